@@ -0,0 +1,8 @@
+def word_counts(text):
+    counts = {}
+    for word in text.lower().split():
+        counts[word] = counts.get(word, 0) + 1
+    return counts
+
+
+print(word_counts("the cat and the hat"))
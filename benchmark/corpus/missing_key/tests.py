@@ -0,0 +1,11 @@
+import unittest
+
+from codebase import word_counts
+
+
+class TestWordCounts(unittest.TestCase):
+    def test_counts_repeated_words(self):
+        self.assertEqual(word_counts("the cat and the hat")["the"], 2)
+
+    def test_is_case_insensitive(self):
+        self.assertEqual(word_counts("A a"), {"a": 2})
@@ -0,0 +1,8 @@
+def moving_average(values, window):
+    averages = []
+    for i in range(len(values) - window):
+        averages.append(sum(values[i : i + window]) / window)
+    return averages
+
+
+print(moving_average([1, 2, 3, 4, 5], 2))
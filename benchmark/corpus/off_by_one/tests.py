@@ -0,0 +1,11 @@
+import unittest
+
+from codebase import moving_average
+
+
+class TestMovingAverage(unittest.TestCase):
+    def test_includes_last_window(self):
+        self.assertEqual(moving_average([1, 2, 3, 4, 5], 2), [1.5, 2.5, 3.5, 4.5])
+
+    def test_window_equal_to_length(self):
+        self.assertEqual(moving_average([2, 4], 2), [3.0])
@@ -0,0 +1,5 @@
+def describe_order(item, quantity):
+    return "Ordered " + quantity + " x " + item
+
+
+print(describe_order("apple", 3))
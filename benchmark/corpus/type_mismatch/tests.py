@@ -0,0 +1,8 @@
+import unittest
+
+from codebase import describe_order
+
+
+class TestDescribeOrder(unittest.TestCase):
+    def test_formats_integer_quantity(self):
+        self.assertEqual(describe_order("apple", 3), "Ordered 3 x apple")
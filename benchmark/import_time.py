@@ -0,0 +1,104 @@
+"""Guard the start-up time of loogy's entry points.
+
+Each entry point is imported in a fresh interpreter, ``--repeats`` times,
+and the median import time is reported along with any heavy modules
+(crewAI, litellm, ...) it loaded. ``loogy --help`` is timed the same way.
+The exit code is non-zero if an entry point loads a heavy module or takes
+longer than ``--max-seconds``, so a new eager import is caught before it
+slows down every CLI call and batch worker.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent.absolute()
+
+ENTRY_POINTS = ["loogy.main", "loogy.batch", "loogy.__main__"]
+# Modules the entry points must only import once a run starts
+HEAVY_MODULES = ["crewai", "litellm", "openai", "httpx"]
+
+IMPORT_SCRIPT = """
+import json, sys, time
+started = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - started
+heavy = [name for name in {heavy!r} if name in sys.modules]
+print(json.dumps({{"seconds": seconds, "heavy": heavy}}))
+"""
+
+
+def run_python(args: list) -> subprocess.CompletedProcess:
+    env = {**os.environ, "PYTHONPATH": str(ROOT), "PYTHONDONTWRITEBYTECODE": "1"}
+    return subprocess.run(
+        [sys.executable, *args], cwd=ROOT, env=env, capture_output=True, text=True
+    )
+
+
+def time_import(module: str, repeats: int) -> dict:
+    seconds = []
+    heavy = set()
+    for _ in range(repeats):
+        process = run_python(
+            ["-c", IMPORT_SCRIPT.format(module=module, heavy=HEAVY_MODULES)]
+        )
+        if process.returncode != 0:
+            raise RuntimeError(f"Importing {module} failed:\n{process.stderr}")
+        result = json.loads(process.stdout.strip().splitlines()[-1])
+        seconds.append(result["seconds"])
+        heavy.update(result["heavy"])
+    return {"seconds": statistics.median(seconds), "heavy": sorted(heavy)}
+
+
+def time_help(repeats: int) -> dict:
+    """Wall time of `python -m loogy --help`, interpreter start included"""
+    seconds = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        process = run_python(["-m", "loogy", "--help"])
+        seconds.append(time.perf_counter() - started)
+        if process.returncode != 0:
+            raise RuntimeError(f"loogy --help failed:\n{process.stderr}")
+    return {"seconds": statistics.median(seconds), "heavy": []}
+
+
+def get_parser(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument(
+        "--max-seconds",
+        type=float,
+        default=0.5,
+        help="Budget for the median import time of each entry point",
+    )
+    parser.add_argument("--output", type=str, help="Write the summary JSON here")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = get_parser(argv)
+    summary = {module: time_import(module, args.repeats) for module in ENTRY_POINTS}
+    summary["loogy --help"] = time_help(args.repeats)
+    print(json.dumps(summary, indent=4))
+    if args.output:
+        Path(args.output).write_text(json.dumps(summary, indent=4))
+
+    failures = []
+    for name, result in summary.items():
+        if result["heavy"]:
+            failures.append(f"{name} imports {', '.join(result['heavy'])}")
+        if result["seconds"] > args.max_seconds:
+            failures.append(
+                f"{name} took {result['seconds']:.3f}s (budget {args.max_seconds}s)"
+            )
+    for failure in failures:
+        print(f"REGRESSION: {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
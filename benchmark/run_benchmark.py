@@ -0,0 +1,312 @@
+"""Benchmark naive vs. logs-appended loogy runs over a corpus of buggy scripts.
+
+Each case in the corpus is a directory holding ``buggy.py`` (the task),
+``fixed.py`` (a reference fix) and ``tests.py`` (reference unit tests). Every
+case is run in each mode:
+
+- naive: failing test results are not fed back to the developer
+- logs: test results, tracebacks and logs are appended to the next prompt
+
+A run counts as a success when the final ``codebase.py`` passes the
+reference tests. With the default ``Stub`` provider the LLM is replaced by a
+deterministic responder so the benchmark runs offline and reproducibly; pass
+``--model_provider Ollama`` or ``OpenAI`` to benchmark real models.
+``--stub-server`` serves the same responder over HTTP from a local
+``loogy.stub_server`` instead, so the runs also go through litellm and the
+network stack with the latency and token rate of a model server.
+
+Writes ``summary.json``, ``runs.csv`` and ``stages.csv`` to the output
+directory. With ``--baseline`` the summary is compared to a previous one and
+the exit code is non-zero on a regression.
+"""
+import argparse
+import csv
+import hashlib
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+import logging
+
+# Add the parent directory to the Python path to find the loogy package
+parent_dir = str(Path(__file__).parent.parent.absolute())
+if parent_dir not in sys.path:
+    sys.path.insert(0, parent_dir)
+
+from loogy.crew import MAX_ITERATIONS, loogy  # noqa: E402
+from loogy.sandbox import extract_code, run_unit_tests  # noqa: E402
+from loogy.stub_server import StubServer  # noqa: E402
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+MODES = {"naive": False, "logs": True}
+CORPUS_DIR = Path(__file__).parent / "corpus"
+
+
+class CorpusResponder:
+    """Deterministic stand-in for the LLM on one corpus case.
+
+    The developer returns the reference fix once a traceback has been fed back
+    in the prompt; otherwise it returns the buggy script, except for a seeded
+    fraction of attempts that get lucky. The tester returns the reference tests.
+    """
+
+    def __init__(self, case_dir: Path, seed: int = 0, naive_fix_rate: float = 0.25):
+        self.case = case_dir.name
+        self.buggy = (case_dir / "buggy.py").read_text()
+        self.fixed = (case_dir / "fixed.py").read_text()
+        self.tests = (case_dir / "tests.py").read_text()
+        self.seed = seed
+        self.naive_fix_rate = naive_fix_rate
+        self.attempts = 0
+
+    def lucky(self) -> bool:
+        digest = hashlib.sha256(f"{self.case}:{self.seed}:{self.attempts}".encode())
+        return int(digest.hexdigest()[:8], 16) / 0xFFFFFFFF < self.naive_fix_rate
+
+    def __call__(self, agent_name: str, prompt: str) -> str:
+        if agent_name == "developer":
+            self.attempts += 1
+            logs = prompt.split("Previous execution logs", 1)[-1]
+            code = self.fixed if "Traceback" in logs or self.lucky() else self.buggy
+            return f"```python\n{code}```"
+        if agent_name == "tester":
+            return f"```python\n{self.tests}```"
+        return "True" if "result: Passed" in prompt else "False"
+
+
+def percentile(values: list, pct: float) -> float:
+    """Nearest-rank percentile"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, int(round(pct / 100 * len(ordered) + 0.5)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def run_case(
+    case_dir: Path, mode: str, repeat: int, args, server: StubServer = None
+) -> tuple:
+    """Run loogy once on a case and return the run row and its stage rows"""
+    responder = CorpusResponder(case_dir, seed=repeat, naive_fix_rate=args.naive_fix_rate)
+    model_provider, api_base = args.model_provider, args.api_base
+    if server is not None:
+        server.responder = responder
+        if model_provider == "Stub":
+            model_provider = "Ollama"
+        api_base = f"{server.url}/v1" if model_provider == "OpenAI" else server.url
+    with tempfile.TemporaryDirectory(prefix="loogy-bench-") as output_dir:
+        crew = loogy(
+            model_provider=model_provider,
+            model_name=args.model_name,
+            output_dir=output_dir,
+            use_cache=False,
+            # Runs start cold so the modes and baselines stay comparable
+            failure_memo=False,
+            append_logs=MODES[mode],
+            stub_responder=responder,
+            api_base=api_base,
+        )
+        started = time.perf_counter()
+        crew.run(topic=responder.buggy, max_iterations=args.max_iterations)
+        wall_seconds = time.perf_counter() - started
+
+        # Judge the final code against the reference tests, not loogy's own
+        code = extract_code(crew.read_output("codebase.py"))
+        reference = run_unit_tests(code, responder.tests)
+
+    stages = crew.stage_stats()
+    row = {
+        "case": case_dir.name,
+        "mode": mode,
+        "repeat": repeat,
+        "success": reference.ok,
+        "self_reported_pass": crew.exit_flag,
+        "iterations": crew.iteration_count,
+        "wall_seconds": round(wall_seconds, 4),
+        "prompt_tokens": sum(stage["prompt_tokens"] for stage in stages),
+        "completion_tokens": sum(stage["completion_tokens"] for stage in stages),
+    }
+    stage_rows = [
+        {"case": case_dir.name, "mode": mode, "repeat": repeat, **stage}
+        for stage in stages
+    ]
+    return row, stage_rows
+
+
+def summarize(rows: list, stage_rows: list) -> dict:
+    summary = {}
+    for mode in sorted({row["mode"] for row in rows}):
+        mode_rows = [row for row in rows if row["mode"] == mode]
+        successes = [row for row in mode_rows if row["success"]]
+        stage_seconds = defaultdict(list)
+        for stage in stage_rows:
+            if stage["mode"] == mode:
+                stage_seconds[stage["stage"]].append(stage["seconds"])
+        wall = [row["wall_seconds"] for row in mode_rows]
+        summary[mode] = {
+            "runs": len(mode_rows),
+            "success_rate": len(successes) / len(mode_rows),
+            "self_reported_pass_rate": sum(r["self_reported_pass"] for r in mode_rows)
+            / len(mode_rows),
+            "mean_iterations_to_success": statistics.mean(
+                [row["iterations"] for row in successes]
+            )
+            if successes
+            else None,
+            "mean_prompt_tokens": statistics.mean(r["prompt_tokens"] for r in mode_rows),
+            "mean_completion_tokens": statistics.mean(
+                r["completion_tokens"] for r in mode_rows
+            ),
+            "wall_seconds": {
+                "p50": percentile(wall, 50),
+                "p90": percentile(wall, 90),
+                "p99": percentile(wall, 99),
+            },
+            "stages": {
+                stage: {
+                    "count": len(seconds),
+                    "mean": statistics.mean(seconds),
+                    "p50": percentile(seconds, 50),
+                    "p90": percentile(seconds, 90),
+                    "p99": percentile(seconds, 99),
+                }
+                for stage, seconds in sorted(stage_seconds.items())
+            },
+        }
+    return summary
+
+
+def find_regressions(summary: dict, baseline: dict, tolerance: float) -> list:
+    """Compare success rate, iterations and p50 latency against a baseline"""
+    regressions = []
+    for mode, current in summary.items():
+        previous = baseline.get(mode)
+        if not previous:
+            continue
+        if current["success_rate"] < previous["success_rate"] - tolerance:
+            regressions.append(
+                f"{mode}: success rate {previous['success_rate']:.2f} -> "
+                f"{current['success_rate']:.2f}"
+            )
+        before = previous.get("mean_iterations_to_success")
+        after = current.get("mean_iterations_to_success")
+        if before and after and after > before * (1 + tolerance):
+            regressions.append(f"{mode}: iterations to success {before:.2f} -> {after:.2f}")
+        before = previous["wall_seconds"]["p50"]
+        after = current["wall_seconds"]["p50"]
+        if before and after > before * (1 + tolerance):
+            regressions.append(f"{mode}: p50 wall time {before:.3f}s -> {after:.3f}s")
+    return regressions
+
+
+def write_csv(path: Path, rows: list) -> None:
+    if not rows:
+        return
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def get_parser(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--corpus", type=str, default=str(CORPUS_DIR))
+    parser.add_argument("--modes", nargs="+", choices=list(MODES), default=list(MODES))
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--max-iterations", type=int, default=MAX_ITERATIONS)
+    parser.add_argument("--model_provider", type=str, default="Stub")
+    parser.add_argument("--model_name", type=str, default="corpus")
+    parser.add_argument(
+        "--naive-fix-rate",
+        type=float,
+        default=0.25,
+        help="Stub only: chance that an attempt without logs fixes the bug",
+    )
+    parser.add_argument(
+        "--api-base",
+        type=str,
+        help="Base URL of the Ollama or OpenAI-compatible model server",
+    )
+    parser.add_argument(
+        "--stub-server",
+        action="store_true",
+        help="Serve the stub responses from a local HTTP model server (as Ollama "
+        "unless --model_provider OpenAI)",
+    )
+    parser.add_argument(
+        "--stub-latency",
+        type=float,
+        default=0.0,
+        help="With --stub-server: seconds before the first token of every response",
+    )
+    parser.add_argument(
+        "--stub-tokens-per-second",
+        type=float,
+        default=0.0,
+        help="With --stub-server: generation speed of every response (0: no limit)",
+    )
+    parser.add_argument("--output-dir", type=str, default="benchmark/results")
+    parser.add_argument("--baseline", type=str, help="Previous summary.json to compare")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.1,
+        help="Relative change allowed before --baseline reports a regression",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    logging.basicConfig(level=logging.WARNING)
+    args = get_parser(argv)
+    cases = sorted(path for path in Path(args.corpus).iterdir() if path.is_dir())
+
+    server = None
+    if args.stub_server:
+        server = StubServer(
+            latency=args.stub_latency, tokens_per_second=args.stub_tokens_per_second
+        ).start()
+
+    rows, stage_rows = [], []
+    for case_dir in cases:
+        for mode in args.modes:
+            for repeat in range(args.repeats):
+                row, stages = run_case(case_dir, mode, repeat, args, server)
+                rows.append(row)
+                stage_rows.extend(stages)
+                logger.warning(
+                    f"{row['case']} [{mode} #{repeat}]: success={row['success']} "
+                    f"iterations={row['iterations']} wall={row['wall_seconds']}s"
+                )
+
+    summary = summarize(rows, stage_rows)
+    output_dir = Path(args.output_dir)
+    os.makedirs(output_dir, exist_ok=True)
+    with open(output_dir / "summary.json", "w") as f:
+        json.dump(summary, f, indent=2)
+    write_csv(output_dir / "runs.csv", rows)
+    write_csv(output_dir / "stages.csv", stage_rows)
+    print(json.dumps(summary, indent=2))
+    if server is not None:
+        server.stop()
+        with open(output_dir / "stub_server.json", "w") as f:
+            json.dump(server.stats(), f, indent=2)
+        logger.warning(f"Stub server stats: {server.stats()}")
+
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            regressions = find_regressions(summary, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,9 +1,8 @@
-from .crew import loogy
+from .main import cli
 
 def run():
     """Entry point for the loogy package."""
-    crew = loogy()
-    crew.run()
+    cli()
 
 if __name__ == "__main__":
     run() 
\ No newline at end of file
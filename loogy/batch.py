@@ -0,0 +1,398 @@
+"""Run loogy over many scripts in parallel worker processes.
+
+Tasks come from a directory of ``*.py`` scripts or from a JSONL file with one
+task per line::
+
+    {"task_id": "shape-bug", "path": "buggy/buggy.py"}
+    {"task_id": "adder", "topic": "Fix the code ...", "model_name": "gpt-4o-mini"}
+
+Each task runs in its own ``output_dir`` under the batch output directory and
+one JSON line per finished task is appended to the results file. Tasks that
+already have a result are skipped and unfinished tasks continue from their
+last checkpoint, so an interrupted batch can be resumed by running the same
+command again.
+"""
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import re
+import time
+from collections import Counter
+from pathlib import Path
+import logging
+
+from loogy.cache import DEFAULT_CACHE_DIR
+from loogy.defaults import MAX_ITERATIONS
+from loogy.http_pool import DEFAULT_MAX_CONNECTIONS, configure_http_pool
+from loogy.memo import DEFAULT_MEMO_PATH
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+DEFAULT_PROVIDER_LIMITS = {"Ollama": 2}
+# Stages of one async run that use a thread at the same time (developer and
+# tester, see loogy.arun)
+THREADS_PER_RUN = 2
+
+
+def safe_task_id(task_id: str) -> str:
+    """Turn a task id into a directory name"""
+    return re.sub(r"[^A-Za-z0-9_.-]+", "_", task_id).strip("._") or "task"
+
+
+def load_tasks(source: str) -> list:
+    """Load tasks from a directory of scripts or a JSONL file"""
+    source_path = Path(source)
+    tasks = []
+    if source_path.is_dir():
+        for path in sorted(source_path.rglob("*.py")):
+            task_id = str(path.relative_to(source_path).with_suffix(""))
+            tasks.append({"task_id": task_id, "topic": path.read_text()})
+        return tasks
+
+    with open(source_path, "r") as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            task = json.loads(line)
+            task["task_id"] = str(
+                task.get("task_id")
+                or task.get("id")
+                or task.get("request_id")
+                or line_number
+            )
+            if "topic" not in task:
+                # Script paths are relative to the JSONL file
+                script_path = source_path.parent / task["path"]
+                task["topic"] = script_path.read_text()
+            tasks.append(task)
+    return tasks
+
+
+def load_finished(results_path: str) -> set:
+    """Task ids that already have a result line"""
+    finished = set()
+    if not os.path.exists(results_path):
+        return finished
+    with open(results_path, "r") as f:
+        for line in f:
+            try:
+                finished.add(json.loads(line)["task_id"])
+            except (ValueError, KeyError):
+                # A partially written last line from an interrupted batch
+                continue
+    return finished
+
+
+def make_crew(task: dict, options: dict):
+    """Create the loogy instance for a task and the start of its result record"""
+    from loogy.crew import loogy
+
+    output_dir = os.path.join(options["output_dir"], safe_task_id(task["task_id"]))
+    model_provider = task.get("model_provider", options["model_provider"])
+    model_name = task.get("model_name", options["model_name"])
+    record = {
+        "task_id": task["task_id"],
+        "output_dir": output_dir,
+        "model_provider": model_provider,
+        "model_name": model_name,
+    }
+    crew = loogy(
+        model_provider=model_provider,
+        model_name=model_name,
+        output_dir=output_dir,
+        use_cache=options["use_cache"],
+        cache_dir=options["cache_dir"],
+        failure_memo=options["failure_memo"],
+        failure_memo_path=options["failure_memo_path"],
+        api_base=options.get("api_base"),
+    )
+    return crew, record
+
+
+def describe_result(record: dict, crew) -> dict:
+    test_result = crew.test_result
+    record.update(
+        {
+            "status": "passed" if crew.exit_flag else "failed",
+            "iterations": crew.iteration_count,
+            "tests_passed": test_result.passed if test_result else 0,
+            "tests_failed": test_result.failed if test_result else 0,
+            "tests_errors": test_result.errors if test_result else 0,
+            "error_classes": test_result.error_classes if test_result else [],
+            "cache": crew.cache.stats(),
+            "failure_memo": crew.failure_memo.stats() if crew.failure_memo else None,
+        }
+    )
+    return record
+
+
+def run_task(task: dict, options: dict) -> dict:
+    """Run a single task; executed in a worker process"""
+    started = time.perf_counter()
+    record = {"task_id": task["task_id"]}
+    try:
+        crew, record = make_crew(task, options)
+        crew.run(
+            topic=task["topic"],
+            max_iterations=task.get("max_iterations", options["max_iterations"]),
+            resume=options.get("resume", False),
+        )
+        describe_result(record, crew)
+    except Exception as e:
+        logger.error(f"Task {task['task_id']} failed: {e}", exc_info=True)
+        record.update({"status": "error", "error": f"{type(e).__name__}: {e}"})
+    record["duration"] = round(time.perf_counter() - started, 3)
+    return record
+
+
+async def arun_task(task: dict, options: dict) -> dict:
+    """Run a single task with loogy.arun in the current event loop"""
+    started = time.perf_counter()
+    record = {"task_id": task["task_id"]}
+    try:
+        # Building the crew imports crewAI and creates the agents, which would
+        # block the other runs if done on the event loop
+        crew, record = await asyncio.to_thread(make_crew, task, options)
+        await crew.arun(
+            topic=task["topic"],
+            max_iterations=task.get("max_iterations", options["max_iterations"]),
+            resume=options.get("resume", False),
+        )
+        describe_result(record, crew)
+    except Exception as e:
+        logger.error(f"Task {task['task_id']} failed: {e}", exc_info=True)
+        record.update({"status": "error", "error": f"{type(e).__name__}: {e}"})
+    record["duration"] = round(time.perf_counter() - started, 3)
+    return record
+
+
+def pending_tasks(tasks: list, results_path: str, resume: bool) -> list:
+    finished = load_finished(results_path) if resume else set()
+    pending = [task for task in tasks if task["task_id"] not in finished]
+    logger.info(
+        f"{len(tasks)} tasks, {len(tasks) - len(pending)} already done, "
+        f"{len(pending)} to run"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(results_path)), exist_ok=True)
+    return pending
+
+
+def write_record(results, record: dict, statuses: Counter) -> None:
+    results.write(json.dumps(record) + "\n")
+    results.flush()
+    statuses[record["status"]] += 1
+    logger.info(f"Task {record['task_id']}: {record['status']}")
+
+
+def run_batch(
+    tasks: list,
+    options: dict,
+    results_path: str,
+    workers: int,
+    provider_limits: dict,
+    resume: bool = True,
+) -> Counter:
+    """Run tasks through a process pool with bounded concurrency per provider"""
+    pending = pending_tasks(tasks, results_path, resume)
+    if pending:
+        # Imported once here, so the forked workers do not import crewAI again
+        import loogy.crew  # noqa: F401
+
+    statuses = Counter()
+    in_flight = {}
+    per_provider = Counter()
+
+    def provider(task):
+        return task.get("model_provider", options["model_provider"])
+
+    with ProcessPoolExecutor(max_workers=workers) as pool, open(
+        results_path, "w" if not resume else "a"
+    ) as results:
+        while pending or in_flight:
+            # Submit every pending task whose provider has a free slot
+            for task in list(pending):
+                if len(in_flight) >= workers:
+                    break
+                name = provider(task)
+                limit = provider_limits.get(name)
+                if limit is not None and per_provider[name] >= limit:
+                    continue
+                pending.remove(task)
+                per_provider[name] += 1
+                in_flight[pool.submit(run_task, task, options)] = task
+
+            if not in_flight:
+                raise ValueError(f"Provider limits leave no slot: {provider_limits}")
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                task = in_flight.pop(future)
+                per_provider[provider(task)] -= 1
+                try:
+                    record = future.result()
+                except Exception as e:
+                    # The worker process itself died
+                    record = {
+                        "task_id": task["task_id"],
+                        "status": "error",
+                        "error": f"{type(e).__name__}: {e}",
+                    }
+                write_record(results, record, statuses)
+
+    return statuses
+
+
+async def run_batch_async(
+    tasks: list,
+    options: dict,
+    results_path: str,
+    concurrency: int,
+    provider_limits: dict,
+    resume: bool = True,
+) -> Counter:
+    """Run tasks concurrently in one process with asyncio and a shared HTTP pool"""
+    configure_http_pool(max_connections=max(DEFAULT_MAX_CONNECTIONS, 2 * concurrency))
+    # The stages run on the loop's default executor; its stock size of
+    # min(32, cpu + 4) threads would cap the runs below ``concurrency``
+    executor = ThreadPoolExecutor(
+        max_workers=THREADS_PER_RUN * concurrency, thread_name_prefix="loogy-stage"
+    )
+    asyncio.get_running_loop().set_default_executor(executor)
+    pending = pending_tasks(tasks, results_path, resume)
+    statuses = Counter()
+    slots = asyncio.Semaphore(concurrency)
+    provider_slots = {
+        name: asyncio.Semaphore(limit) for name, limit in provider_limits.items()
+    }
+
+    async def run_one(task):
+        provider = task.get("model_provider", options["model_provider"])
+        async with slots, provider_slots.get(provider, contextlib.nullcontext()):
+            return await arun_task(task, options)
+
+    with open(results_path, "w" if not resume else "a") as results:
+        for finished in asyncio.as_completed([run_one(task) for task in pending]):
+            write_record(results, await finished, statuses)
+
+    return statuses
+
+
+def parse_provider_limits(values: list) -> dict:
+    limits = dict(DEFAULT_PROVIDER_LIMITS)
+    for value in values or []:
+        name, _, limit = value.partition("=")
+        limits[name] = int(limit)
+    return limits
+
+
+def get_parser(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="loogy batch", description="Run loogy over many scripts in parallel"
+    )
+    parser.add_argument("source", help="Directory of scripts or JSONL file of tasks")
+    parser.add_argument("--output-dir", type=str, default="outputs/batch")
+    parser.add_argument(
+        "--results",
+        type=str,
+        default=None,
+        help="Results JSONL (default: <output-dir>/results.jsonl)",
+    )
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument(
+        "--async",
+        dest="use_async",
+        action="store_true",
+        help="Run tasks concurrently in one process with asyncio instead of a process pool",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=16,
+        help="Concurrent runs with --async",
+    )
+    parser.add_argument(
+        "--provider-limit",
+        action="append",
+        metavar="PROVIDER=N",
+        help="Maximum concurrent runs per model provider (default: Ollama=2)",
+    )
+    parser.add_argument("--model_provider", type=str, default="Ollama")
+    parser.add_argument("--model_name", type=str, default="qwen2.5-coder:7b")
+    parser.add_argument("--max-iterations", type=int, default=MAX_ITERATIONS)
+    parser.add_argument(
+        "--api-base",
+        type=str,
+        help="Base URL of the Ollama or OpenAI-compatible model server, "
+        "e.g. a local `loogy stub-server`",
+    )
+    parser.add_argument(
+        "--no-cache", action="store_true", help="Bypass the LLM response cache"
+    )
+    parser.add_argument("--cache-dir", type=str, default=DEFAULT_CACHE_DIR)
+    parser.add_argument(
+        "--no-failure-memo",
+        action="store_true",
+        help="Do not share fixes of earlier failures between tasks",
+    )
+    parser.add_argument("--failure-memo-path", type=str, default=DEFAULT_MEMO_PATH)
+    parser.add_argument(
+        "--no-resume",
+        action="store_true",
+        help="Start over instead of skipping tasks already in the results file "
+        "and resuming unfinished ones from their checkpoint",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    logging.basicConfig(level=logging.INFO)
+    args = get_parser(argv)
+    options = {
+        "output_dir": os.path.abspath(args.output_dir),
+        "model_provider": args.model_provider,
+        "model_name": args.model_name,
+        "max_iterations": args.max_iterations,
+        "api_base": args.api_base,
+        "use_cache": not args.no_cache,
+        "cache_dir": args.cache_dir,
+        "failure_memo": not args.no_failure_memo,
+        "failure_memo_path": args.failure_memo_path,
+        # Unfinished tasks continue from their last checkpoint
+        "resume": not args.no_resume,
+    }
+    results_path = args.results or os.path.join(args.output_dir, "results.jsonl")
+    tasks = load_tasks(args.source)
+    provider_limits = parse_provider_limits(args.provider_limit)
+    if args.use_async:
+        statuses = asyncio.run(
+            run_batch_async(
+                tasks,
+                options,
+                results_path,
+                concurrency=args.concurrency,
+                provider_limits=provider_limits,
+                resume=not args.no_resume,
+            )
+        )
+    else:
+        statuses = run_batch(
+            tasks,
+            options,
+            results_path,
+            workers=args.workers,
+            provider_limits=provider_limits,
+            resume=not args.no_resume,
+        )
+    logger.info(f"Batch finished: {dict(statuses)}, results in {results_path}")
+
+
+if __name__ == "__main__":
+    main()
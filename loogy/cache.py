@@ -0,0 +1,161 @@
+"""Content-addressed on-disk cache for LLM responses.
+
+Entries are keyed by a SHA-256 of everything that determines a response
+(model provider, model name, agent configuration and the rendered prompt)
+and stored one JSON file per key. The cache is bounded in bytes and evicts
+the least recently used entries first, using file mtimes as access times.
+
+Within a run a key is only served once: when a failing iteration sends the
+same prompt again, the retry must reach the model instead of getting the
+answer that just failed, and the new answer replaces the cached one. Call
+``start_run`` at the start of every run.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from pathlib import Path
+from typing import Optional
+import logging
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+DEFAULT_CACHE_DIR = os.environ.get(
+    "LOOGY_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "loogy", "llm")
+)
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+
+class ResponseCache:
+    """Size-bounded LRU cache of LLM responses on disk"""
+
+    def __init__(
+        self,
+        cache_dir: str = DEFAULT_CACHE_DIR,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        bypass: bool = False,
+    ):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.bypass = bypass
+        self.hits = 0
+        self.misses = 0
+        self.repeats = 0
+        # Keys answered in the current run, see start_run()
+        self.answered = set()
+        self._size = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(*parts) -> str:
+        """Hash the request parts into a cache key"""
+        payload = json.dumps(parts, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def start_run(self) -> None:
+        """Forget which keys were answered, so the next run can hit them again"""
+        with self._lock:
+            self.answered.clear()
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / f"{key}.json"
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached response or None, counting hits and misses"""
+        if self.bypass:
+            return None
+        with self._lock:
+            if key in self.answered:
+                # A retry of a prompt already answered in this run
+                self.repeats += 1
+                return None
+        path = self._path(key)
+        try:
+            with open(path, "r") as f:
+                value = json.load(f)["response"]
+            # Touch the entry so eviction sees it as recently used
+            os.utime(path)
+        except (OSError, ValueError, KeyError):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+            self.answered.add(key)
+        logger.info(f"LLM cache hit: {key[:12]}")
+        return value
+
+    def put(self, key: str, value: str) -> None:
+        """Store a response, evicting old entries if over the size bound"""
+        if self.bypass:
+            return
+        with self._lock:
+            self.answered.add(key)
+        path = self._path(key)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # Write to a temporary file first so readers never see partial entries
+            fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+            with os.fdopen(fd, "w") as f:
+                json.dump({"response": value}, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Could not write LLM cache entry {path}: {e}")
+            return
+
+        with self._lock:
+            if self._size is None:
+                self._size = self._disk_usage()
+            else:
+                self._size += path.stat().st_size
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _entries(self):
+        entries = []
+        for path in self.cache_dir.glob("*/*.json"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def _disk_usage(self) -> int:
+        return sum(size for _, size, _ in self._entries())
+
+    def _evict(self) -> None:
+        """Remove least recently used entries until under max_bytes"""
+        entries = sorted(self._entries())
+        self._size = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if self._size <= self.max_bytes:
+                break
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+            self._size -= size
+            logger.info(f"Evicted LLM cache entry: {path.name}")
+
+    def clear(self) -> None:
+        """Remove every cached response"""
+        with self._lock:
+            for _, _, path in self._entries():
+                try:
+                    path.unlink()
+                except FileNotFoundError:
+                    pass
+            self._size = 0
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "repeats": self.repeats,
+            "bypass": self.bypass,
+        }
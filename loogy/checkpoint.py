@@ -0,0 +1,119 @@
+"""Checkpoints of a run's iteration state.
+
+After every completed stage the crew saves its inputs, stage outputs,
+iteration count, completed stages and stage timings as gzipped JSON in the
+outputs directory. ``run(resume=True)`` restores the last checkpoint of the
+same topic and continues from the next stage instead of iteration 1, so a
+crash or a killed process does not waste the LLM work already done.
+
+The state is captured on the run's thread, but serialized, compressed and
+written by ``CheckpointWriter`` on a background thread.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from pathlib import Path
+from typing import Optional
+import logging
+
+from loogy.trace import Tracer
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+CHECKPOINT_FILE = "checkpoint.json.gz"
+CHECKPOINT_VERSION = 1
+
+
+def topic_digest(topic: str) -> str:
+    return hashlib.sha256(topic.encode("utf-8")).hexdigest()
+
+
+def save_checkpoint(path: str, state: dict) -> int:
+    """Atomically write ``state``; returns the compressed size in bytes"""
+    state = {"version": CHECKPOINT_VERSION, **state}
+    data = gzip.compress(json.dumps(state, default=str).encode("utf-8"))
+    directory = Path(path).parent
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".checkpoint-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        # A crash while writing leaves the previous checkpoint intact
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    return len(data)
+
+
+class CheckpointWriter:
+    """Saves checkpoints to ``path`` on a background thread.
+
+    A state submitted while the previous one is still waiting to be written
+    replaces it, so only the latest state is written.
+    """
+
+    def __init__(self, path: str, tracer: Tracer = None):
+        self.path = path
+        self.tracer = tracer or Tracer()
+        self._lock = threading.Lock()
+        self._state = None
+        self._writer = None
+        self._pending = []
+
+    def submit(self, state: dict) -> None:
+        """Schedule ``state`` to be written; it must not be modified afterwards"""
+        with self._lock:
+            scheduled = self._state is not None
+            self._state = state
+            if scheduled:
+                return
+            if self._writer is None:
+                self._writer = ThreadPoolExecutor(
+                    max_workers=1, thread_name_prefix="loogy-checkpoint"
+                )
+            self._pending.append(self._writer.submit(self._write))
+
+    def _write(self) -> None:
+        with self._lock:
+            state, self._state = self._state, None
+        if state is None:
+            return
+        with self.tracer.span("checkpoint", category="io") as span:
+            try:
+                span["bytes"] = save_checkpoint(self.path, state)
+            except OSError as e:
+                logger.warning(f"Could not save the checkpoint {self.path}: {e}")
+
+    def flush(self) -> None:
+        """Write the pending checkpoint and wait for it"""
+        with self._lock:
+            pending, self._pending = self._pending, []
+        for future in pending:
+            future.result()
+        self._write()
+
+
+def load_checkpoint(path: str, topic: str) -> Optional[dict]:
+    """The checkpoint saved for ``topic``, or None if there is no usable one"""
+    try:
+        with gzip.open(path, "rb") as f:
+            state = json.loads(f.read().decode("utf-8"))
+    except FileNotFoundError:
+        return None
+    except (OSError, EOFError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable checkpoint {path}: {e}")
+        return None
+    if state.get("version") != CHECKPOINT_VERSION:
+        logger.info(f"Ignoring checkpoint with version {state.get('version')}")
+        return None
+    if state.get("topic") != topic_digest(topic):
+        logger.info("Ignoring checkpoint saved for another topic")
+        return None
+    return state
@@ -0,0 +1,189 @@
+"""Compaction of test results and logs before they are fed back to the LLM.
+
+Tracebacks and test output grow quickly across iterations and are sent with
+every developer prompt. ``compact_logs`` keeps what the model needs to fix
+the code (the summary, the failing assertions and the frames in the user's
+code) and drops the rest:
+
+- frames inside the standard library and installed packages are collapsed
+- consecutive repeated frames and lines (recursion, loops) are deduplicated
+- only the last ``tail_lines`` lines of each output block are kept
+- the result is cut down further until it fits ``token_budget``
+"""
+import re
+
+DEFAULT_TOKEN_BUDGET = 1500
+DEFAULT_TAIL_LINES = 20
+MIN_TAIL_LINES = 3
+
+FRAME_RE = re.compile(r'^\s*File "(?P<path>[^"]+)", line \d+, in .+$')
+CARET_RE = re.compile(r"^\s*[\^~]+\s*$")
+FENCE = "```"
+PASSED_ROW_RE = re.compile(r"^\| .+ \| (passed|skipped) \|( [0-9.]+s \|)?$")
+LIBRARY_MARKERS = (
+    "site-packages",
+    "dist-packages",
+    "/lib/python",
+    "\\lib\\python",
+    "<frozen ",
+)
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count used when no tokenizer is involved"""
+    return max(1, len(text) // 4)
+
+
+def is_library_frame(path: str) -> bool:
+    return any(marker in path for marker in LIBRARY_MARKERS)
+
+
+def split_frames(lines: list) -> list:
+    """Group traceback lines into frames (header + source) and other lines.
+
+    Returns a list of ``(path, lines)`` tuples where path is None for lines
+    that are not part of a frame, such as the exception message.
+    """
+    items = []
+    for line in lines:
+        match = FRAME_RE.match(line)
+        if match:
+            items.append((match.group("path"), [line]))
+        elif (
+            items
+            and items[-1][0] is not None
+            and line.startswith("    ")
+            and len(items[-1][1]) < 2
+        ):
+            # The source line printed under a frame header
+            items[-1][1].append(line)
+        else:
+            items.append((None, [line]))
+    return items
+
+
+def compact_traceback(lines: list) -> list:
+    """Collapse library frames and repeated frames of a traceback"""
+    compacted = []
+    library_frames = 0
+    previous = None
+    repeats = 0
+
+    def flush():
+        nonlocal library_frames, repeats
+        if repeats:
+            compacted.append(f"  [previous frame repeated {repeats} more times]")
+            repeats = 0
+        if library_frames:
+            compacted.append(f"  [{library_frames} library frames omitted]")
+            library_frames = 0
+
+    for path, frame in split_frames(line for line in lines if not CARET_RE.match(line)):
+        if path is not None and is_library_frame(path):
+            if repeats:
+                flush()
+            library_frames += 1
+            previous = frame
+            continue
+        if path is not None and frame == previous:
+            repeats += 1
+            continue
+        flush()
+        compacted.extend(frame)
+        previous = frame if path is not None else None
+    flush()
+    return compacted
+
+
+def dedupe_lines(lines: list) -> list:
+    """Replace runs of identical lines with one line and a count"""
+    deduped = []
+    repeats = 0
+    for index, line in enumerate(lines):
+        if index and line == lines[index - 1]:
+            repeats += 1
+            continue
+        if repeats:
+            deduped.append(f"[previous line repeated {repeats} more times]")
+            repeats = 0
+        deduped.append(line)
+    if repeats:
+        deduped.append(f"[previous line repeated {repeats} more times]")
+    return deduped
+
+
+def tail(lines: list, tail_lines: int) -> list:
+    if len(lines) <= tail_lines:
+        return lines
+    return [f"[{len(lines) - tail_lines} earlier lines omitted]"] + lines[-tail_lines:]
+
+
+def compact_block(lines: list, tail_lines: int) -> list:
+    return tail(dedupe_lines(compact_traceback(lines)), tail_lines)
+
+
+def split_blocks(text: str) -> list:
+    """Split markdown into ``(is_code, lines)`` chunks at the code fences"""
+    chunks = []
+    current = []
+    in_code = False
+    for line in text.splitlines():
+        if line.strip().startswith(FENCE):
+            if in_code:
+                chunks.append((True, current))
+                current = [line]
+            else:
+                chunks.append((False, current + [line]))
+                current = []
+            in_code = not in_code
+            continue
+        current.append(line)
+    # Unterminated fences and logs without markdown are compacted as code
+    chunks.append((in_code or FENCE not in text, current))
+    return chunks
+
+
+def render(chunks: list, tail_lines: int, drop_passed: bool) -> str:
+    lines = []
+    for is_code, chunk in chunks:
+        if is_code:
+            lines.extend(compact_block(chunk, tail_lines))
+        elif drop_passed:
+            lines.extend(line for line in chunk if not PASSED_ROW_RE.match(line))
+        else:
+            lines.extend(chunk)
+    return "\n".join(lines).strip("\n") + "\n"
+
+
+def truncate_middle(text: str, max_chars: int) -> str:
+    """Keep the head (the result summary) and the tail (the last failure)"""
+    head = max_chars // 4
+    omitted = len(text) - max_chars
+    return (
+        f"{text[:head]}\n[... {omitted} characters omitted ...]\n"
+        f"{text[-(max_chars - head):]}"
+    )
+
+
+def compact_logs(
+    text: str,
+    token_budget: int = DEFAULT_TOKEN_BUDGET,
+    tail_lines: int = DEFAULT_TAIL_LINES,
+) -> str:
+    """Compact test results or logs to fit ``token_budget`` tokens"""
+    if not text or not text.strip():
+        return ""
+    chunks = split_blocks(text)
+    compacted = render(chunks, tail_lines, drop_passed=False)
+    if not token_budget:
+        return compacted
+
+    # Progressively drop detail until the text fits the budget
+    if estimate_tokens(compacted) > token_budget:
+        compacted = render(chunks, tail_lines, drop_passed=True)
+    while estimate_tokens(compacted) > token_budget and tail_lines > MIN_TAIL_LINES:
+        tail_lines = max(MIN_TAIL_LINES, tail_lines // 2)
+        compacted = render(chunks, tail_lines, drop_passed=True)
+    if estimate_tokens(compacted) > token_budget:
+        compacted = truncate_middle(compacted, token_budget * 4)
+    return compacted
@@ -1,18 +1,278 @@
-from crewai import Agent, Crew, Process, Task
-from crewai.project import CrewBase, agent, crew, task
+from crewai import LLM, Agent, Crew, Process, Task
+from crewai.project import CrewBase
 from crewai.flow.flow import Flow, listen, start
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import asyncio
+import functools
+import hashlib
 import json
+import litellm
 import os
+import re
+import threading
+import time
 from pathlib import Path
+from typing import Optional
 import logging
 
+from loogy.cache import DEFAULT_CACHE_DIR, DEFAULT_MAX_BYTES, ResponseCache
+from loogy.checkpoint import (
+    CHECKPOINT_FILE,
+    CheckpointWriter,
+    load_checkpoint,
+    topic_digest,
+)
+from loogy.compaction import DEFAULT_TAIL_LINES, DEFAULT_TOKEN_BUDGET, compact_logs
+from loogy.defaults import MAX_ITERATIONS
+from loogy.events import EventBus
+from loogy.http_pool import configure_http_pool, shared_http_handler
+from loogy.memo import DEFAULT_MEMO_PATH, FailureMemo, format_hints, signatures
+from loogy.patching import PatchError, apply_patch
+from loogy.static_analysis import analyze
+from loogy.trace import Tracer
+from loogy.usage import report_usage
+from loogy.warmup import DEFAULT_KEEP_ALIVE, warm_models
+from loogy.sandbox import (
+    DEFAULT_CPU_SECONDS,
+    DEFAULT_MEMORY_MB,
+    DEFAULT_TIMEOUT,
+    TestRunResult,
+    extract_code,
+    get_worker_pool,
+    imported_modules,
+    run_unit_tests,
+    strip_timings,
+)
+
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
 # If you want to run a snippet of code before or after the crew starts,
 # you can use the @before_kickoff and @after_kickoff decorators
 # https://docs.crewai.com/concepts/crews#example-crew-class-with-decorators
-MAX_ITERATIONS = 3
+REFINE_MODES = ("full", "edit")
+MODEL_PROVIDERS = ("Ollama", "OpenAI", "Stub")
+# Agents moved to the escalation model after escalate_after failed iterations
+ESCALATED_AGENTS = ("developer",)
+TRACEBACK_FILE_RE = re.compile(r'File "([^"]+)", line \d+')
+# Seconds the end of a run waits for the Ollama models to be pinned
+PIN_TIMEOUT = 5.0
+
+
+def parse_model(spec: str, default_provider: str) -> tuple:
+    """Split "Provider/model" into (provider, model name).
+
+    A bare model name such as "qwen2.5-coder:14b" uses ``default_provider``.
+    """
+    provider, _, model_name = spec.partition("/")
+    for known in MODEL_PROVIDERS:
+        if provider.lower() == known.lower() and model_name:
+            return known, model_name
+    return default_provider, spec
+
+
+class CachedLLM(LLM):
+    """LLM whose responses are looked up in a ResponseCache before calling out.
+
+    Plain completions call litellm directly so Ollama models use the shared
+    HTTP pool; tool calls go through crewAI's LLM.call. While the ``events``
+    bus has listeners, completions are streamed and every token is emitted as
+    a "token" event of ``agent_name``.
+    """
+
+    def __init__(
+        self,
+        model: str,
+        cache: ResponseCache,
+        namespace: tuple,
+        events: EventBus = None,
+        agent_name: str = None,
+        **kwargs,
+    ):
+        super().__init__(model=model, **kwargs)
+        self.cache = cache
+        self.namespace = namespace
+        self.events = events
+        self.agent_name = agent_name
+
+    def call(self, messages, tools=None, callbacks=None, available_functions=None):
+        # Tool calls execute functions, so only plain completions are cached
+        if tools:
+            return super().call(messages, tools, callbacks, available_functions)
+
+        key = self.cache.make_key(self.namespace, self.temperature, messages)
+        response = self.cache.get(key)
+        if response is not None:
+            if self.events is not None:
+                self.events.emit("token", agent=self.agent_name, text=response)
+        elif self.events is not None and self.events.active:
+            response = self.stream(messages, callbacks)
+            self.cache.put(key, response)
+        else:
+            response = self.complete(messages, callbacks)
+            self.cache.put(key, response)
+        return response
+
+    def completion_params(self, messages, stream: bool) -> dict:
+        """litellm.completion() arguments, as crewAI's LLM.call builds them"""
+        params = {
+            "model": self.model,
+            "messages": messages,
+            "timeout": self.timeout,
+            "temperature": self.temperature,
+            "top_p": self.top_p,
+            "n": self.n,
+            "stop": self.stop,
+            "max_tokens": self.max_tokens or self.max_completion_tokens,
+            "presence_penalty": self.presence_penalty,
+            "frequency_penalty": self.frequency_penalty,
+            "logit_bias": self.logit_bias,
+            "response_format": self.response_format,
+            "seed": self.seed,
+            "logprobs": self.logprobs,
+            "top_logprobs": self.top_logprobs,
+            "api_base": self.base_url,
+            "api_version": self.api_version,
+            "api_key": self.api_key,
+            "stream": stream,
+        }
+        # litellm's Ollama provider only pools connections through ``client``
+        if self.model.startswith("ollama/"):
+            params["client"] = shared_http_handler()
+        return {k: v for k, v in params.items() if v is not None}
+
+    def complete(self, messages, callbacks=None) -> str:
+        """Plain completion"""
+        if callbacks:
+            self.set_callbacks(callbacks)
+        params = self.completion_params(messages, stream=False)
+        response = litellm.completion(**params)
+        report_usage(callbacks, params, getattr(response, "usage", None))
+        return response.choices[0].message.content or ""
+
+    def stream(self, messages, callbacks=None) -> str:
+        """Streamed completion emitting each token as it arrives"""
+        params = self.completion_params(messages, stream=True)
+        chunks = []
+        for chunk in litellm.completion(**params):
+            chunks.append(chunk)
+            text = chunk.choices[0].delta.content if chunk.choices else None
+            if text:
+                self.events.emit("token", agent=self.agent_name, text=text)
+        response = litellm.stream_chunk_builder(chunks, messages=messages)
+        if response is None:
+            return ""
+
+        report_usage(callbacks, params, getattr(response, "usage", None))
+        return response.choices[0].message.content or ""
+
+
+class ArtifactStore:
+    """Stage outputs kept in memory and written to the outputs directory.
+
+    Stages read each other's outputs from memory. Writes to disk happen on a
+    background thread (flush="async") or only when flush() is called at the
+    end of a run (flush="end"); files written by a previous run are read
+    from disk on first access.
+    """
+
+    FLUSH_MODES = ("async", "end")
+
+    def __init__(self, root: Path, flush: str = "async", tracer: Tracer = None):
+        if flush not in self.FLUSH_MODES:
+            raise ValueError(f"Unknown flush mode: {flush}")
+        self.root = Path(root)
+        self.flush_mode = flush
+        self.tracer = tracer or Tracer()
+        self.artifacts = {}
+        self.dirty = set()
+        self._lock = threading.Lock()
+        self._writer = None
+        self._pending = []
+
+    def path(self, name: str) -> Path:
+        return self.root / name
+
+    def get(self, name: str, default: str = "") -> str:
+        with self._lock:
+            if name in self.artifacts:
+                return self.artifacts[name]
+        with self.tracer.span(f"load {name}", category="io") as span:
+            try:
+                content = self.path(name).read_text()
+            except FileNotFoundError:
+                return default
+            span["bytes"] = len(content)
+        with self._lock:
+            return self.artifacts.setdefault(name, content)
+
+    def exists(self, name: str) -> bool:
+        with self._lock:
+            if name in self.artifacts:
+                return True
+        return self.path(name).exists()
+
+    def put(self, name: str, content: str) -> None:
+        with self._lock:
+            self.artifacts[name] = content
+            scheduled = name in self.dirty
+            self.dirty.add(name)
+            if scheduled or self.flush_mode != "async":
+                return
+            if self._writer is None:
+                self._writer = ThreadPoolExecutor(
+                    max_workers=1, thread_name_prefix="loogy-artifacts"
+                )
+            self._pending.append(self._writer.submit(self._write, name))
+
+    def _write(self, name: str) -> None:
+        # The latest content is written, so repeated puts coalesce
+        with self._lock:
+            if name not in self.dirty:
+                return
+            self.dirty.discard(name)
+            content = self.artifacts[name]
+        self._save(name, content)
+
+    def _write_latest(self, names: list) -> None:
+        # On the writer thread, after the writes queued before it
+        for name in names:
+            with self._lock:
+                content = self.artifacts[name]
+            self._save(name, content)
+
+    def _save(self, name: str, content: str) -> None:
+        with self.tracer.span(f"flush {name}", category="io", bytes=len(content)):
+            os.makedirs(self.root, exist_ok=True)
+            self.path(name).write_text(content)
+
+    def flush(self) -> None:
+        """Write every pending artifact to disk and wait for it"""
+        with self._lock:
+            pending, self._pending = self._pending, []
+            names = sorted(self.dirty)
+            self.dirty.clear()
+            contents = {name: self.artifacts[name] for name in names}
+            if self._writer is not None:
+                # A write queued earlier may already have saved a later put,
+                # so the writer saves the latest content rather than these
+                pending.append(self._writer.submit(self._write_latest, names))
+                contents = {}
+        for future in pending:
+            future.result()
+        for name, content in contents.items():
+            self._save(name, content)
+
+    def snapshot(self) -> dict:
+        """Copy of the artifacts held in memory"""
+        with self._lock:
+            return dict(self.artifacts)
+
+    def clear(self) -> None:
+        """Forget the in-memory artifacts after writing pending ones"""
+        self.flush()
+        with self._lock:
+            self.artifacts.clear()
 
 
 @CrewBase
@@ -26,7 +286,44 @@ class loogy(Flow):
     tasks_config = "config/tasks.yaml"
     exit_flag = False
 
-    def __init__(self, model_provider="Ollama", model_name="qwen2.5-coder:7b", output_dir="outputs"):
+    def __init__(
+        self,
+        model_provider="Ollama",
+        model_name="qwen2.5-coder:7b",
+        output_dir="outputs",
+        test_timeout=DEFAULT_TIMEOUT,
+        test_cpu_seconds=DEFAULT_CPU_SECONDS,
+        test_memory_mb=DEFAULT_MEMORY_MB,
+        use_exit_agent=False,
+        use_cache=True,
+        cache_dir=DEFAULT_CACHE_DIR,
+        cache_max_bytes=DEFAULT_MAX_BYTES,
+        append_logs=True,
+        stub_responder=None,
+        trace_format="jsonl",
+        logs_token_budget=DEFAULT_TOKEN_BUDGET,
+        logs_tail_lines=DEFAULT_TAIL_LINES,
+        artifact_flush="async",
+        refine="full",
+        static_checks=True,
+        static_retries=2,
+        candidates=1,
+        candidate_models=None,
+        warm_workers=True,
+        preload_modules=None,
+        checkpoints=True,
+        freeze_tests=True,
+        test_shards=None,
+        instrument=True,
+        failure_memo=True,
+        failure_memo_path=DEFAULT_MEMO_PATH,
+        agent_models=None,
+        escalate_after=None,
+        escalation_model=None,
+        keep_alive=DEFAULT_KEEP_ALIVE,
+        warm_up=True,
+        api_base=None,
+    ):
         super().__init__()
 
         # Simply use "outputs" directory in the current working directory
@@ -35,12 +332,140 @@ class loogy(Flow):
         # Create outputs directory if it doesn't exist
         os.makedirs(self.outputs_dir, exist_ok=True)
         logger.info(f"Outputs directory: {self.outputs_dir}")
+        self.debug_paths()
 
         # Store model configuration
         self.model_provider = model_provider
         self.model_name = model_name
         logger.info(f"Using model provider: {model_provider}, model: {model_name}")
 
+        # Base URL of the Ollama or OpenAI-compatible server, e.g. a local
+        # loogy stub-server (default: the provider's own)
+        self.api_base = api_base
+
+        # agent_models maps agent names to "Provider/model" overrides. After
+        # escalate_after failed iterations the developer moves to
+        # escalation_model, so easy tasks stay on the cheap default model
+        self.agent_models = dict(agent_models or {})
+        self.escalate_after = escalate_after
+        self.escalation_model = escalation_model
+        self.failed_iterations = 0
+
+        # Ollama models are loaded in the background when an iteration first
+        # needs them and kept loaded for keep_alive after the run
+        self.keep_alive = keep_alive
+        self.warm_up = warm_up
+        self.warmed_models = set()
+
+        # Failing tests also report the calls, last lines and exception locals
+        # of codebase.py, recorded by the harness with sys.settrace
+        self.instrument = instrument
+
+        # Limits for the local test sandbox
+        self.test_timeout = test_timeout
+        self.test_cpu_seconds = test_cpu_seconds
+        self.test_memory_mb = test_memory_mb
+        self.test_result = None
+
+        # Reruns of the same tests start with the ones that failed and shard
+        # the rest over test_shards processes (default: one per CPU)
+        self.test_shards = test_shards or os.cpu_count() or 1
+        self.scheduled_tests = None
+        self.test_durations = {}
+
+        # Tests are forked from a warm worker that imported preload_modules
+        # (by default the modules the script imports) once
+        self.warm_workers = warm_workers
+        self.preload_modules = preload_modules
+
+        # The exit decision is made from the test results; the exit agent is
+        # an optional extra LLM check on top of it
+        self.use_exit_agent = use_exit_agent
+
+        # Responses are cached on disk; use_cache=False bypasses the cache
+        self.cache = ResponseCache(
+            cache_dir=cache_dir, max_bytes=cache_max_bytes, bypass=not use_cache
+        )
+
+        # Fixes of earlier failures, shared by all runs and added to the logs
+        # as hints when the same kind of failure comes up again
+        self.failure_memo = FailureMemo(failure_memo_path) if failure_memo else None
+        self.pending_failures = None
+
+        # append_logs=False is the naive mode: failing test results are not
+        # fed back to the developer
+        self.append_logs = append_logs
+
+        # Responder for model_provider="Stub", see loogy.stub
+        self.stub_responder = stub_responder
+
+        # Test results and logs are compacted to this many tokens before they
+        # are put in a prompt; a budget of 0 only collapses and deduplicates
+        self.logs_token_budget = logs_token_budget
+        self.logs_tail_lines = logs_tail_lines
+
+        # refine="edit" asks the developer for edits to the previous code
+        # after the first iteration instead of regenerating the whole file
+        if refine not in REFINE_MODES:
+            raise ValueError(f"Unknown refine mode: {refine}")
+        self.refine = refine
+        self.refine_base = ""
+        self.refine_failed = False
+
+        # Static checks of the developer's code run before any test is written
+        # or run; on errors the developer retries up to static_retries times.
+        # Candidates run their guardrails concurrently, so the retries left and
+        # the last report are kept per task name
+        self.static_checks = static_checks
+        self.static_retries = static_retries
+        self.static_retries_left = {}
+        self.static_reports = {}
+        self._static_lock = threading.Lock()
+
+        # With candidates > 1 each iteration generates that many fixes
+        # concurrently (over candidate_models or a spread of temperatures)
+        # and keeps the first one passing the tests
+        self.candidates = candidates
+        self.candidate_models = list(candidate_models or [])
+        self._candidate_pool = None
+        self._candidate_cancel = threading.Event()
+
+        # The unit tests written in the first iteration are reused for the
+        # same topic until they are shown to be invalid
+        self.freeze_tests = freeze_tests
+        self.frozen_tests = None
+
+        # The state is checkpointed after every stage so run(resume=True)
+        # can continue from the last completed one
+        self.checkpoints = checkpoints
+        self.completed_stages = set()
+        self.resumed_stages = set()
+        self._checkpoint_lock = threading.Lock()
+
+        # Live events for UIs, see stream()
+        self.events = EventBus()
+
+        # Spans of the current run, exported to the outputs directory at the
+        # end of each run unless trace_format is None
+        self.tracer = Tracer(listeners=[self.emit_stage])
+        self.trace_format = trace_format
+
+        # Outputs are passed between stages in memory and flushed to the
+        # outputs directory in the background
+        self.artifacts = ArtifactStore(
+            self.outputs_dir, flush=artifact_flush, tracer=self.tracer
+        )
+        self.checkpoint_writer = CheckpointWriter(
+            self.get_output_path(CHECKPOINT_FILE), tracer=self.tracer
+        )
+        # Token usage of each agent when its last stage ended, see record_task()
+        self._usage_before = {}
+        self._usage_lock = threading.Lock()
+
+        # Agents, tasks and crews built so far, see memoize()
+        self._components = {}
+        self._config_fingerprint = None
+
         # Initialize inputs
         self.inputs = {}
         self.tasks = []
@@ -57,231 +482,533 @@ class loogy(Flow):
         self.inputs = inputs or {}
         logger.info(f"Setting inputs: {self.inputs}")
 
-    # If you would like to add tools to your agents, you can learn more about it here:
-    # https://docs.crewai.com/concepts/agents#agent-tools
+    def agent_llm(self, name: str, config: dict, provider: str, model_name: str) -> LLM:
+        """Wrap the agent's model in an LLM backed by the response cache"""
+        if provider == "Stub":
+            from loogy.stub import StubLLM
 
-    @agent
-    @start()
-    def developer(self) -> Agent:
-        config = self.agents_config["developer"].copy()
+            return StubLLM(
+                model=f"stub/{model_name}",
+                agent_name=name,
+                responder=self.stub_responder,
+                events=self.events,
+            )
 
-        # Override the model based on user selection
-        if self.model_provider == "Ollama":
-            config["llm"] = f"ollama/{self.model_name}"  # Add 'ollama/' prefix
-            config["api_type"] = "ollama"
-        else:
-            config["llm"] = self.model_name
+        agent_config = {k: v for k, v in config.items() if k != "llm"}
+        namespace = (provider, model_name, name, agent_config)
+        if self.api_base:
+            # Another server's answers must not be served from the cache
+            namespace += (self.api_base,)
+        return CachedLLM(
+            model=config["llm"],
+            cache=self.cache,
+            namespace=namespace,
+            temperature=config.get("temperature"),
+            base_url=self.api_base,
+            events=self.events,
+            agent_name=name,
+        )
 
-        agent = Agent(config=config, verbose=True)
-        print(f"\n🤖 Developer using model: {config['llm']}")
-        return agent
+    def component_key(self) -> tuple:
+        """Everything the agents, tasks and crews are built from.
 
-    @agent
-    @listen(developer)
-    def tester(self) -> Agent:
-        config = self.agents_config["tester"].copy()
+        The YAML configs are fingerprinted once; call invalidate() after
+        editing agents_config or tasks_config.
+        """
+        if self._config_fingerprint is None:
+            configs = json.dumps(
+                [self.agents_config, self.tasks_config], sort_keys=True, default=str
+            )
+            self._config_fingerprint = hashlib.sha256(configs.encode()).hexdigest()
+        return (self.model_provider, self.model_name, self._config_fingerprint)
+
+    def memoize(self, name: str, build):
+        """Build a component once per (provider, model, config)"""
+        key = (name,) + self.component_key()
+        component = self._components.get(key)
+        if component is None:
+            logger.info(f"Building {name}")
+            component = self._components[key] = build()
+        return component
+
+    def invalidate(self) -> None:
+        """Drop the memoized agents, tasks and crews so they are rebuilt"""
+        logger.info(f"Invalidating {len(self._components)} cached components")
+        self._components.clear()
+        self._config_fingerprint = None
 
-        # Override the model based on user selection
-        if self.model_provider == "Ollama":
-            config["llm"] = f"ollama/{self.model_name}"  # Add 'ollama/' prefix
-            config["api_type"] = "ollama"
-        else:
-            config["llm"] = self.model_name
+    # If you would like to add tools to your agents, you can learn more about it here:
+    # https://docs.crewai.com/concepts/agents#agent-tools
 
-        agent = Agent(config=config, verbose=True)
-        print(f"\n🤖 Tester using model: {config['llm']}")
-        return agent
+    def escalated(self) -> bool:
+        """Whether the developer moved to the escalation model"""
+        return (
+            self.escalation_model is not None
+            and self.escalate_after is not None
+            and self.failed_iterations >= self.escalate_after
+        )
 
-    @agent
-    @listen(tester)
-    def executor(self) -> Agent:
-        config = self.agents_config["executor"].copy()
+    def model_for(self, name: str) -> tuple:
+        """(provider, model name) the agent ``name`` currently runs on"""
+        provider, model_name = self.model_provider, self.model_name
+        if name in self.agent_models:
+            provider, model_name = parse_model(self.agent_models[name], provider)
+        if name in ESCALATED_AGENTS and self.escalated():
+            provider, model_name = parse_model(self.escalation_model, provider)
+        return provider, model_name
+
+    def ollama_models(self) -> list:
+        """Ollama models the agents of the current iteration run on"""
+        names = ["developer", "tester"]
+        if self.use_exit_agent:
+            names.append("exit_agent")
+        specs = [self.model_for(name) for name in names]
+        if self.candidates > 1:
+            provider = self.model_for("developer")[0]
+            specs += [parse_model(spec, provider) for spec in self.candidate_models]
+        models = []
+        for provider, model_name in specs:
+            if provider == "Ollama" and model_name not in models:
+                models.append(model_name)
+        return models
+
+    def warm_up_models(self, models: list = None) -> Optional[threading.Thread]:
+        """Load the Ollama models in the background and pin them for keep_alive.
+
+        Ollama resets the keep-alive of a model to its default on every call
+        that does not set one, and crewai's LLM does not, so the models are
+        pinned again at the start of every iteration and at the end of the run.
+        """
+        if not self.warm_up:
+            return None
+        models = self.ollama_models() if models is None else models
+        if not models:
+            return None
+        loading = [model for model in models if model not in self.warmed_models]
+        if loading:
+            logger.info(f"🔥 Warming up {', '.join(loading)}")
+        self.warmed_models.update(models)
+        return warm_models(
+            models, keep_alive=self.keep_alive, api_base=self.api_base
+        )
 
-        # Override the model based on user selection
-        if self.model_provider == "Ollama":
-            config["llm"] = f"ollama/{self.model_name}"  # Add 'ollama/' prefix
-            config["api_type"] = "ollama"
-        else:
-            config["llm"] = self.model_name
+    def candidate_variant(self, name: str, config: dict, variant: int) -> tuple:
+        """Provider, model name and temperature of one of the candidates"""
+        provider, model_name = self.model_for(name)
+        if self.candidate_models:
+            spec = self.candidate_models[variant % len(self.candidate_models)]
+            return parse_model(spec, provider) + (config.get("temperature"),)
+        if variant == 0 or self.candidates < 2:
+            return provider, model_name, config.get("temperature")
+        # Spread the other candidates over the temperature range
+        temperature = round(0.1 + 0.9 * variant / (self.candidates - 1), 2)
+        return provider, model_name, temperature
+
+    def build_agent(self, name: str, variant: int = None) -> Agent:
+        """Create the agent configured under ``name`` in agents.yaml.
+
+        The model comes from model_for(); ``variant`` selects the model and
+        temperature of a best-of-N candidate.
+        """
+        config = self.agents_config[name].copy()
+        provider, model_name = self.model_for(name)
+        if variant is not None:
+            provider, model_name, config["temperature"] = self.candidate_variant(
+                name, config, variant
+            )
 
-        agent = Agent(config=config, verbose=True)
-        print(f"\n🤖 Executor using model: {config['llm']}")
-        return agent
+        def build() -> Agent:
+            # Override the model based on user selection
+            if provider == "Ollama":
+                config["llm"] = f"ollama/{model_name}"  # Add 'ollama/' prefix
+                config["api_type"] = "ollama"
+            else:
+                config["llm"] = model_name
+            print(f"\n🤖 {config['role'].strip()} using model: {config['llm']}")
+            config["llm"] = self.agent_llm(name, config, provider, model_name)
 
-    @agent
-    @listen(executor)
-    def exit_agent(self) -> Agent:
-        config = self.agents_config["exit_agent"].copy()
+            return Agent(config=config, verbose=True)
 
-        # Override the model based on user selection
-        if self.model_provider == "Ollama":
-            config["llm"] = f"ollama/{self.model_name}"  # Add 'ollama/' prefix
-            config["api_type"] = "ollama"
-        else:
-            config["llm"] = self.model_name
+        suffix = "" if variant is None else f"#{variant}"
+        return self.memoize(f"agent {name}{suffix} {provider}/{model_name}", build)
 
-        agent = Agent(config=config, verbose=True)
-        print(f"\n🤖 Exit Agent using model: {config['llm']}")
-        return agent
+    @start()
+    def developer(self) -> Agent:
+        return self.build_agent("developer")
+
+    @listen(developer)
+    def tester(self) -> Agent:
+        return self.build_agent("tester")
+
+    def exit_agent(self) -> Agent:
+        return self.build_agent("exit_agent")
 
     # To learn more about structured task outputs,
     # task dependencies, and task callbacks, check out the documentation:
     # https://docs.crewai.com/concepts/tasks#overview-of-a-task
 
-    @task
-    def develop_topic_task(self) -> Task:
-        logger.info("Creating develop_topic_task")
-        description = self.tasks_config["develop_topic_task"]["description"]
-        expected_output = self.tasks_config["develop_topic_task"]["expected_output"]
-
-        format_vars = {
-            "topic": self.inputs.get("topic", "default topic"),
-            "logs": self.inputs.get("logs", ""),
-        }
-        logger.info(f"Develop task format_vars: {format_vars}")
+    def build_task(self, name: str, agent: Agent, callback, **kwargs) -> Task:
+        """Create the task configured under ``name`` in tasks.yaml.
+
+        The placeholders ({topic}, {logs}, {tests_results}) are left in place
+        and interpolated by crew.kickoff(inputs=...) so every iteration sees
+        the latest inputs. A "#<n>" suffix names a copy of the task.
+        """
+        task = None
+
+        def on_complete(output) -> None:
+            if self.candidate_cancelled(name):
+                return
+            self.record_task(task)
+            if callback is not None:
+                callback(output)
+            # Candidates are checkpointed together once one is kept
+            if "#" not in name:
+                self.complete_stage(name)
+
+        def build() -> Task:
+            nonlocal task
+            config = self.tasks_config[name.split("#")[0]]
+            task = Task(
+                description=config["description"],
+                expected_output=config["expected_output"],
+                agent=agent,
+                name=name,
+                callback=on_complete,
+                **kwargs,
+            )
+            return task
 
-        # Use simple path joining for consistency with other tasks
-        output_file = os.path.join(str(self.outputs_dir), "codebase.py")
-        logger.info(f"Setting output file to: {output_file}")
+        return self.memoize(f"task {name} {agent.llm.model}", build)
 
-        return Task(
-            description=description.format(**format_vars),
-            expected_output=expected_output.format(**format_vars),
-            agent=self.developer(),
-            output_file=output_file,
+    def develop_topic_task(self) -> Task:
+        return self.build_task(
+            "develop_topic_task",
+            self.developer(),
+            self.save_task_output("codebase.py"),
+            guardrail=self.static_guardrail("develop_topic_task"),
+            max_retries=self.static_retries + 1,
         )
 
-    @task
-    def write_unit_tests_task(self) -> Task:
-        description = self.tasks_config["write_unit_tests_task"]["description"]
-        expected_output = self.tasks_config["write_unit_tests_task"]["expected_output"]
-
-        format_vars = {"topic": self.inputs.get("topic", "default topic"), "logs": ""}
-        format_vars.update(self.inputs)
-
-        # Create full path for output file
-        output_file = os.path.join(str(self.outputs_dir), "unit_tests.py")
-        logger.info(f"Setting output file to: {output_file}")
-
-        return Task(
-            description=description.format(**format_vars),
-            expected_output=expected_output.format(**format_vars),
-            agent=self.tester(),
-            output_file=output_file,
+    def candidate_task(self, variant: int) -> Task:
+        """Developer task of a best-of-N candidate; its output is kept in memory"""
+        return self.build_task(
+            f"develop_topic_task#{variant}",
+            self.build_agent("developer", variant),
+            None,
+            guardrail=self.static_guardrail(f"develop_topic_task#{variant}"),
+            max_retries=self.static_retries + 1,
         )
 
-    @task
-    def execute_unit_tests_task(self) -> Task:
-        description = self.tasks_config["execute_unit_tests_task"]["description"]
-        expected_output = self.tasks_config["execute_unit_tests_task"][
-            "expected_output"
-        ]
-
-        format_vars = {"topic": self.inputs.get("topic", "default topic"), "logs": ""}
-        format_vars.update(self.inputs)
-
-        # Create full path for output file
-        output_file = os.path.join(str(self.outputs_dir), "tests_results.md")
-        logger.info(f"Setting output file to: {output_file}")
+    def refine_code_task(self) -> Task:
+        return self.build_task(
+            "refine_code_task", self.developer(), self.apply_refinement
+        )
 
-        return Task(
-            description=description.format(**format_vars),
-            expected_output=expected_output.format(**format_vars),
-            agent=self.executor(),
-            output_file=output_file,
-            allow_code_execution=True,
+    def write_unit_tests_task(self) -> Task:
+        return self.build_task(
+            "write_unit_tests_task",
+            self.tester(),
+            self.save_task_output("unit_tests.py"),
         )
 
-    @task
     def exit_task(self) -> Task:
-        # Create full paths for input and output files
-        input_file = os.path.join(str(self.outputs_dir), "tests_results.md")
-        output_file = os.path.join(str(self.outputs_dir), "exit_task_output.md")
-        logger.info(f"Setting input file to: {input_file}")
-        logger.info(f"Setting output file to: {output_file}")
-
-        return Task(
-            description=self.tasks_config["exit_task"]["description"],
-            expected_output=self.tasks_config["exit_task"]["expected_output"],
-            input_file=input_file,
-            agent=self.exit_agent(),
-            output_parser=self.parse_exit_task_output,
-            output_file=output_file,
+        return self.build_task(
+            "exit_task", self.exit_agent(), self.save_task_output("exit_task_output.md")
         )
 
-    def parse_exit_task_output(self, output: str) -> str:
-        """Parse the exit task output and set the exit flag"""
-        try:
-            logger.info("=== Parsing Exit Task Output ===")
-            logger.info(f"Raw output from exit agent: {output}")
-
-            # Set exit flag to True if "True" appears anywhere in the output
-            if "true" in output.lower():
-                self.exit_flag = True
-                logger.info("Found 'True' in output, setting exit_flag to True")
-            else:
-                self.exit_flag = False
-                logger.info("No 'True' found in output, setting exit_flag to False")
+    def parse_exit_answer(self, output: str) -> bool:
+        """Parse the optional exit agent answer, which must be exactly True/False"""
+        answer = output.strip().strip("`*.").strip().lower()
+        logger.info(f"Exit agent answered: {answer!r}")
+        return answer == "true"
+
+    def should_exit(self, test_result: TestRunResult, exit_answer=None) -> bool:
+        """Decide whether to stop iterating from the structured test results"""
+        if not test_result.ok:
+            logger.info(
+                f"Tests not green: passed={test_result.passed} "
+                f"failed={test_result.failed} errors={test_result.errors} "
+                f"error classes={test_result.error_classes} "
+                f"exit code={test_result.exit_code}"
+            )
+            return False
+        if exit_answer is not None and not self.parse_exit_answer(exit_answer):
+            logger.info("Tests passed but the exit agent asked to continue")
+            return False
+        return True
+
+    def build_crew(self, name: str, tasks: list) -> Crew:
+        """Create a sequential crew running ``tasks`` with their agents"""
+
+        def build() -> Crew:
+            return Crew(
+                agents=[task.agent for task in tasks],
+                tasks=tasks,
+                process=Process.sequential,
+                verbose=True,
+            )
 
-            # Write the exit status immediately
-            exit_file_path = self.get_output_path("exit_task_output.md")
-            with open(exit_file_path, "w") as f:
-                f.write(str(self.exit_flag))
-            logger.info(f"Wrote exit status to {exit_file_path}: {self.exit_flag}")
+        models = ", ".join(f"{task.name} {task.agent.llm.model}" for task in tasks)
+        return self.memoize(f"crew {name} ({models})", build)
 
-            # Log test results file content for debugging
-            try:
-                test_results_path = self.get_output_path("tests_results.md")
-                with open(test_results_path, "r") as f:
-                    test_results = f.read()
-                    first_line = test_results.strip().split("\n")[0]
-                logger.info(
-                    f"Test results first line: '{first_line}' (for verification)"
-                )
+    def tester_tasks(self) -> list:
+        """The tester's task, unless this iteration reuses the frozen tests"""
+        return [] if self.tests_frozen() else [self.write_unit_tests_task()]
 
-                # Double-check if test results indicate passing
-                if "result: passed" in first_line.lower():
-                    self.exit_flag = True
-                    logger.info("Test results indicate PASS, setting exit_flag to True")
-
-                    # Update the exit file with the new status
-                    with open(exit_file_path, "w") as f:
-                        f.write(str(self.exit_flag))
-                    logger.info(
-                        f"Updated exit status to {exit_file_path}: {self.exit_flag}"
-                    )
-            except Exception as e:
-                logger.warning(f"Could not read test results file: {e}")
+    def crew(self) -> Crew:
+        """Creates the loogy crew that runs until success"""
+        self.tasks = [self.develop_topic_task()] + self.tester_tasks()
+        self.agents = [task.agent for task in self.tasks]
+        return self.build_crew("loogy", self.tasks)
+
+    def refine_crew(self) -> Crew:
+        """Creates the crew asking for edits to the previous code"""
+        tasks = [self.refine_code_task()] + self.tester_tasks()
+        return self.build_crew("refine", tasks)
+
+    def exit_crew(self) -> Crew:
+        """Creates the crew that decides whether to stop iterating.
+
+        It runs after the tests were executed locally, so it is kept out of
+        the main crew.
+        """
+        return self.build_crew("exit", [self.exit_task()])
+
+    def save_task_output(self, filename: str):
+        """Build a task callback writing the raw output to the outputs directory.
+
+        Used instead of Task(output_file=...), which strips the leading slash
+        of absolute paths.
+        """
+        output_path = self.get_output_path(filename)
+        logger.info(f"Setting output file to: {output_path}")
+
+        def callback(output) -> None:
+            self.write_output(filename, output.raw)
+
+        return callback
+
+    def static_guardrail(self, name: str):
+        """Guardrail running the static checks on the output of task ``name``"""
+        if not self.static_checks:
+            return None
+        return functools.partial(self.check_code, name)
+
+    def check_code(self, name: str, output):
+        """Guardrail of the developer task running the static checks.
+
+        Hard errors are sent straight back to the developer, so the tester and
+        the unit tests only run on code that at least compiles. Each task (the
+        developer or one candidate) has its own retries.
+        """
+        if self.candidate_cancelled(name):
+            # An abandoned candidate stops retrying and writes nothing
+            return True, output.raw
+        report = analyze(extract_code(output.raw))
+        with self._static_lock:
+            self.static_reports[name] = report
+            retries_left = self.static_retries_left.get(name, self.static_retries)
+            if not report.ok and retries_left > 0:
+                self.static_retries_left[name] = retries_left - 1
+        self.record_stage(
+            "static_analysis",
+            report.duration,
+            task=name,
+            errors=len(report.errors),
+            warnings=len(report.warnings),
+        )
+        if report.ok:
+            return True, output.raw
 
-            status = "passed" if self.exit_flag else "failed"
-            logger.info(f"\n🔍 Tests {status}")
-            if self.exit_flag:
-                logger.info("✅ Exit condition met - all tests passed!")
+        self.write_output("static_analysis.md", report.to_markdown())
+        if retries_left <= 0:
+            logger.info(
+                f"Static analysis of {name} still fails, running the unit tests anyway"
+            )
+            return True, output.raw
+        logger.info(
+            f"Static analysis of {name} found {len(report.errors)} errors, "
+            "sending them back to the developer"
+        )
+        return False, self.compact(report.to_markdown())
+
+    def use_refinement(self) -> bool:
+        """Whether this iteration asks for edits instead of a whole new file"""
+        if self.refine != "edit" or self.iteration_count < 2:
+            return False
+        code = extract_code(self.read_output("codebase.py"))
+        if not code.strip() or code.startswith("# No code generated yet"):
+            return False
+        self.refine_base = code
+        self.refine_failed = False
+        self.inputs["code"] = code
+        return True
+
+    def apply_refinement(self, output) -> None:
+        """Task callback applying the developer's edits to the previous code"""
+        self.write_output("codebase_edits.md", output.raw)
+        try:
+            code = apply_patch(self.refine_base, output.raw)
+            if self.static_checks and not analyze(code).ok:
+                raise PatchError("Patched code fails the static checks")
+        except PatchError as e:
+            logger.warning(f"Could not apply the developer's edits: {e}")
+            self.refine_failed = True
+            return
+        logger.info("Applied the developer's edits to codebase.py")
+        self.write_output("codebase.py", code)
+
+    def regenerate_if_refinement_failed(self) -> None:
+        """Fall back to regenerating the whole file when the edits did not apply"""
+        if self.refine_failed:
+            logger.info("Falling back to regenerating codebase.py")
+            self.refine_failed = False
+            self.kickoff_and_record(self.stage_crew(self.develop_topic_task()))
+
+    def read_output(self, filename: str) -> str:
+        """Read an output, returning an empty string if it is missing"""
+        return self.artifacts.get(filename)
+
+    def write_output(self, filename: str, content: str) -> None:
+        """Store an output; it is written to the outputs directory by the store"""
+        self.artifacts.put(filename, content)
+        self.events.emit("artifact", name=filename, content=content)
+
+    def emit_stage(self, span: dict) -> None:
+        """Tracer listener turning finished stages into events"""
+        if span["category"] == "stage":
+            self.events.emit(
+                "stage", stage=span["name"], seconds=span["duration"], **span["attrs"]
+            )
 
-            return str(self.exit_flag)
-        except Exception as e:
-            logger.error(f"Failed to parse exit agent response: {e}", exc_info=True)
-            self.exit_flag = False
-            return "false"
+    def stream(
+        self,
+        topic: str,
+        logs: str = "",
+        max_iterations: int = MAX_ITERATIONS,
+        resume: bool = False,
+    ):
+        """Run the crew on a thread and yield its events as they happen.
+
+        Yields "iteration", "token", "stage" and "artifact" events, then a
+        "done" event, or an "error" event if the run raised.
+        """
+        return self.events.iterate(
+            lambda: self.run(topic, logs, max_iterations, resume=resume)
+        )
 
-    @crew
-    def crew(self) -> Crew:
-        """Creates the loogy crew that runs until success"""
-        logger.info("Creating crew...")
+    def worker_pool(self):
+        """Warm test worker for this run, None to run tests in a new process"""
+        if not self.warm_workers:
+            return None
+        modules = self.preload_modules
+        if modules is None:
+            modules = imported_modules(self.inputs.get("topic", ""))
+        return get_worker_pool(modules)
+
+    def tests_frozen(self) -> bool:
+        """Whether the unit tests of an earlier iteration are reused"""
+        return (
+            self.frozen_tests is not None
+            and self.frozen_tests == topic_digest(self.inputs["topic"])
+            and self.artifacts.exists("unit_tests.py")
+        )
 
-        crew = Crew(
-            agents=self.agents,
-            tasks=self.tasks,
-            process=Process.sequential,
-            verbose=True,
+    def write_unit_tests(self) -> str:
+        """The frozen unit tests, or new ones from the tester"""
+        if not self.tests_frozen():
+            self.kickoff_and_record(self.stage_crew(self.write_unit_tests_task()))
+        return extract_code(self.read_output("unit_tests.py"))
+
+    def invalid_tests_reason(self, test_result: TestRunResult) -> Optional[str]:
+        """Why the tests should be rewritten, or None if they can be reused"""
+        if test_result.timed_out or test_result.cancelled:
+            return None
+        if test_result.collection_error is not None:
+            if self.raised_in_tests(test_result.collection_error):
+                return "the tests could not be collected"
+            return None
+        if not test_result.tests:
+            return "no tests were collected"
+        for test in test_result.failures():
+            if test.outcome == "error" and self.raised_in_tests(test):
+                return f"{test.name} raised {test.error_type} in the test code"
+        return None
+
+    @staticmethod
+    def raised_in_tests(test) -> bool:
+        """Whether the error was raised by unit_tests.py itself, not the code"""
+        files = TRACEBACK_FILE_RE.findall(test.traceback or "")
+        if not files or os.path.basename(files[-1]) != "unit_tests.py":
+            return False
+        # Missing names in codebase are the developer's to fix
+        return "codebase" not in (test.message or "")
+
+    def update_frozen_tests(self, test_result: TestRunResult) -> None:
+        """Freeze the tests after they ran, or thaw them if they are invalid"""
+        if not self.freeze_tests:
+            return
+        reason = self.invalid_tests_reason(test_result)
+        if reason is not None:
+            logger.info(f"🧪 Rewriting the unit tests next iteration: {reason}")
+            self.frozen_tests = None
+        elif not self.tests_frozen():
+            logger.info("🧊 Freezing the unit tests for the next iterations")
+            self.frozen_tests = topic_digest(self.inputs["topic"])
+
+    def execute_unit_tests(self) -> TestRunResult:
+        """Run unit_tests.py against codebase.py in the local sandbox"""
+        # Agents usually wrap their answer in markdown fences
+        code = extract_code(self.read_output("codebase.py"))
+        tests = extract_code(self.read_output("unit_tests.py"))
+        self.write_output("codebase.py", code)
+        self.write_output("unit_tests.py", tests)
+
+        result = run_unit_tests(
+            code,
+            tests,
+            timeout=self.test_timeout,
+            cpu_seconds=self.test_cpu_seconds,
+            memory_mb=self.test_memory_mb,
+            pool=self.worker_pool(),
+            instrument=self.instrument,
+            **self.test_schedule(tests),
         )
-        logger.info("Crew initialized")
-        return crew
+        self.write_output("tests_results.md", result.to_markdown())
+        logger.info("Stored test results in tests_results.md")
+
+        self.record_test_run(tests, result)
+        return result
+
+    def test_schedule(self, tests: str) -> dict:
+        """Order and sharding of a run of ``tests`` from their previous runs"""
+        if tests != self.scheduled_tests or self.test_result is None:
+            return {}
+        failing = [
+            test.name
+            for test in self.test_result.tests
+            if test.outcome in ("failed", "error")
+        ]
+        return {
+            "failing_first": failing,
+            "durations": dict(self.test_durations),
+            "shards": self.test_shards,
+        }
+
+    def record_test_run(self, tests: str, result: TestRunResult) -> None:
+        if tests != self.scheduled_tests:
+            self.scheduled_tests = tests
+            self.test_durations = {}
+        self.test_durations.update({test.name: test.duration for test in result.tests})
+        self.test_result = result
 
     def clean_outputs_directory(self):
         """Clean all files from outputs directory"""
         try:
             logger.info(f"Cleaning outputs directory: {self.outputs_dir}")
+            self.artifacts.clear()
+            self.checkpoint_writer.flush()
             if os.path.exists(self.outputs_dir):
                 for file in os.listdir(self.outputs_dir):
                     file_path = os.path.join(self.outputs_dir, file)
@@ -326,12 +1053,155 @@ class loogy(Flow):
                 f"Error listing files in outputs directory: {e}", exc_info=True
             )
 
-    def run(self, topic: str, logs: str = "", max_iterations: int = MAX_ITERATIONS):
-        """Run the crew with specific inputs"""
-        logger.info(f"\n=== Starting Run with Topic: {topic} ===")
+    def record_stage(
+        self, stage: str, seconds: float, usage=None, start=None, **attrs
+    ) -> None:
+        """Record the latency and token usage of one stage of the current iteration"""
+        seconds = seconds or 0.0
+        self.tracer.add_span(
+            stage,
+            start=start if start is not None else time.time() - seconds,
+            duration=seconds,
+            iteration=self.iteration_count,
+            prompt_tokens=usage.prompt_tokens if usage else 0,
+            completion_tokens=usage.completion_tokens if usage else 0,
+            **attrs,
+        )
 
-        # Debug paths
-        self.debug_paths()
+    def stage_stats(self) -> list:
+        """Per-stage latency and token records of the current run"""
+        return [
+            {
+                "iteration": span["attrs"]["iteration"],
+                "stage": span["name"],
+                "seconds": span["duration"],
+                "prompt_tokens": span["attrs"]["prompt_tokens"],
+                "completion_tokens": span["attrs"]["completion_tokens"],
+            }
+            for span in self.tracer.of_category("stage")
+        ]
+
+    def kickoff_and_record(self, crew: Crew):
+        """Kick off a crew; each task records its stage when it completes"""
+        with self._usage_lock:
+            for task in crew.tasks:
+                # Guardrail retries are counted per kickoff, not per task object
+                task.retry_count = 0
+                self._usage_before[id(task.agent)] = (
+                    task.agent._token_process.get_summary()
+                )
+        return crew.kickoff(inputs=dict(self.inputs))
+
+    def record_task(self, task: Task) -> None:
+        """Record the stage of a task that just completed, with its token usage"""
+        agent = task.agent
+        usage = agent._token_process.get_summary()
+        with self._usage_lock:
+            # An agent used by several tasks is only counted once
+            before = self._usage_before.get(id(agent))
+            self._usage_before[id(agent)] = usage
+        usage = usage.model_copy()
+        if before is not None:
+            usage.prompt_tokens -= before.prompt_tokens
+            usage.completion_tokens -= before.completion_tokens
+
+        attrs = {"model": agent.llm.model}
+        config = self.tasks_config.get(task.name.split("#")[0], {})
+        if "{logs}" in config.get("description", ""):
+            attrs["logs_bytes"] = len(self.inputs.get("logs", "").encode("utf-8"))
+        self.record_stage(
+            task.name,
+            task.execution_duration,
+            usage,
+            start=task.start_time.timestamp() if task.start_time else None,
+            **attrs,
+        )
+
+    def kickoff_pending(self, crew: Crew):
+        """Kick off the tasks of ``crew`` that were not completed before a resume"""
+        done = self.completed_stages
+        pending = [task for task in crew.tasks if task.name not in done]
+        if len(pending) == len(crew.tasks):
+            return self.kickoff_and_record(crew)
+        for task in pending:
+            self.kickoff_and_record(self.stage_crew(task))
+
+    def complete_stage(self, stage: str) -> None:
+        """Mark a stage of the current iteration as done and checkpoint the run"""
+        with self._checkpoint_lock:
+            self.completed_stages.add(stage)
+            self.save_checkpoint()
+
+    def save_checkpoint(self) -> None:
+        """Capture the run's state and write it in the background"""
+        if not self.checkpoints:
+            return
+        state = {
+            "topic": topic_digest(self.inputs["topic"]),
+            "iteration": self.iteration_count,
+            "completed": sorted(self.completed_stages),
+            "exit_flag": self.exit_flag,
+            "failed_iterations": self.failed_iterations,
+            "frozen_tests": self.frozen_tests,
+            "inputs": dict(self.inputs),
+            "artifacts": self.artifacts.snapshot(),
+            "spans": [
+                span
+                for span in list(self.tracer.spans)
+                if span["category"] in ("stage", "iteration")
+            ],
+        }
+        self.checkpoint_writer.submit(state)
+
+    def restore_checkpoint(self, topic: str) -> bool:
+        """Continue from the last checkpoint of ``topic``, if there is one"""
+        self.checkpoint_writer.flush()
+        state = load_checkpoint(self.get_output_path(CHECKPOINT_FILE), topic)
+        if state is None:
+            logger.info("No checkpoint to resume from, starting over")
+            return False
+        for filename, content in state["artifacts"].items():
+            self.write_output(filename, content)
+        self.inputs = state["inputs"]
+        self.exit_flag = state["exit_flag"]
+        self.failed_iterations = state.get("failed_iterations", 0)
+        self.frozen_tests = state.get("frozen_tests")
+        self.tracer.spans.extend(state["spans"])
+        if state["spans"]:
+            self.tracer.origin = min(span["start"] for span in state["spans"])
+
+        completed = set(state["completed"])
+        if "evaluate" in completed:
+            # The iteration was finished, go on with the next one
+            self.iteration_count = state["iteration"]
+        else:
+            self.iteration_count = state["iteration"] - 1
+            self.resumed_stages = completed
+        logger.info(
+            f"Resuming from the checkpoint of iteration {state['iteration']}, "
+            f"completed stages: {', '.join(sorted(completed)) or 'none'}"
+        )
+        return True
+
+    def compact(self, text: str) -> str:
+        """Compact test results or logs before they are put in a prompt"""
+        with self.tracer.span("compact_logs", category="compaction") as span:
+            compacted = compact_logs(
+                text,
+                token_budget=self.logs_token_budget,
+                tail_lines=self.logs_tail_lines,
+            )
+            span.update(bytes_in=len(text), bytes_out=len(compacted))
+        logger.info(f"Compacted logs from {len(text)} to {len(compacted)} characters")
+        return compacted
+
+    def prepare_run(self, topic: str, logs: str = "", resume: bool = False) -> None:
+        """Reset the run state and inputs for a new topic"""
+        self.tracer = Tracer(listeners=self.tracer.listeners)
+        self.artifacts.tracer = self.tracer
+        self.checkpoint_writer.tracer = self.tracer
+        self.cache.start_run()
+        logger.info(f"\n=== Starting Run with Topic: {topic} ===")
 
         # Clean outputs directory for new topic
         if hasattr(self, "_last_topic") and self._last_topic != topic:
@@ -342,118 +1212,376 @@ class loogy(Flow):
         # Ensure all output files exist
         self.ensure_output_files_exist()
 
-        # List files after ensuring they exist
-        try:
-            files = os.listdir(self.outputs_dir)
-            logger.info(f"Files after ensure_output_files_exist: {files}")
-        except Exception as e:
-            logger.error(f"Error listing files: {e}", exc_info=True)
-
-        # Load logs from test_results.md if it exists
-        test_results_path = os.path.join(self.outputs_dir, "tests_results.md")
-        if os.path.exists(test_results_path):
+        # Without logs, start from the results of the previous run. Their
+        # timings change every run and would make every prompt a cache miss
+        if not logs:
             try:
-                with open(test_results_path, "r") as f:
-                    logs = f.read()
-                logger.info(f"Loaded logs from {test_results_path}")
+                logs = strip_timings(self.read_output("tests_results.md"))
                 logger.info(f"Logs content: {logs[:200]}...")  # Log first 200 chars
             except Exception as e:
                 logger.warning(f"Could not read test results: {e}")
                 logs = ""
-        else:
-            logger.info("No previous test results found")
-            logs = ""
+
+        logs = self.compact(logs) if self.append_logs else ""
 
         # Store inputs for task formatting
-        self.inputs = {"topic": topic, "logs": logs}
+        self.inputs = {"topic": topic, "logs": logs, "tests_results": ""}
         logger.info(f"Set inputs with topic and logs (logs length: {len(logs)})")
 
-        crew = self.crew()
+        # Import the heavy modules while the first LLM stages run
+        threading.Thread(
+            target=self.worker_pool, name="loogy-worker-start", daemon=True
+        ).start()
+
         self.iteration_count = 0  # Track iteration count as an instance variable
 
         # Reset exit flag at the start of a new run
         self.exit_flag = False
+        self.failed_iterations = 0
+        self.warmed_models = set()
+        self.pending_failures = None
+        self.completed_stages = set()
+        self.resumed_stages = set()
+        if resume:
+            self.restore_checkpoint(topic)
+
+    def evaluate_iteration(self, exit_crew=None, test_result=None) -> bool:
+        """Test the generated code and decide whether to stop iterating"""
+        if test_result is None:
+            # Run the generated tests locally instead of asking an agent
+            test_result = self.execute_unit_tests()
+            self.record_stage("execute_unit_tests", test_result.duration)
+        self.inputs["tests_results"] = self.compact(
+            test_result.to_markdown(timings=False)
+        )
 
-        while self.iteration_count < max_iterations and not self.exit_flag:
-            self.iteration_count += 1
-            logger.info(f"\n=== Starting iteration {self.iteration_count} ===")
-            logger.info(f"\n🔄 Starting iteration {self.iteration_count}...")
-            logger.info(f"🎯 Current topic: {topic}")
+        hints = self.memoize_failures(test_result)
+        self.update_frozen_tests(test_result)
+
+        exit_answer = None
+        if exit_crew is not None:
+            exit_answer = self.kickoff_and_record(exit_crew).raw
 
+        self.exit_flag = self.should_exit(test_result, exit_answer)
+        if self.exit_flag:
+            logger.info("🎉 Exit flag is True - tests passed successfully!")
+            logger.info("\n✅ Tests passed successfully! Exiting crew.\n")
+        else:
+            logger.info("❌ Tests failed or exit flag not set")
+            if self.append_logs:
+                # Feed the test results back to the developer
+                self.inputs["logs"] = self.inputs["tests_results"] + hints
+            self.failed_iterations += 1
+            if self.escalated() and self.failed_iterations == self.escalate_after:
+                logger.info(
+                    f"⬆️ {self.failed_iterations} failed iterations, escalating "
+                    f"{', '.join(ESCALATED_AGENTS)} to {self.escalation_model}"
+                )
+        self.complete_stage("evaluate")
+        return self.exit_flag
+
+    def memoize_failures(self, test_result: TestRunResult) -> str:
+        """Memoize the fixes of the last iteration's failures.
+
+        A failure counts as fixed when the same unit tests ran again and its
+        test passed. Returns hints with the known fixes of the current failures.
+        """
+        if self.failure_memo is None:
+            return ""
+        code = extract_code(self.read_output("codebase.py"))
+        tests = hashlib.sha256(
+            extract_code(self.read_output("unit_tests.py")).encode("utf-8")
+        ).hexdigest()
+        # Errors in the tests' own code say nothing about the fix of the code
+        failing = [
+            test for test in test_result.failures() if not self.raised_in_tests(test)
+        ]
+        found = [] if test_result.ok else signatures(failing)
+        # Failures only count as fixed if the tests could run at all
+        ran = test_result.collection_error is None and not test_result.timed_out
+        if self.pending_failures and ran:
+            previous, before, previous_tests = self.pending_failures
+            passed = {
+                test.name for test in test_result.tests if test.outcome == "passed"
+            }
+            for signature in previous:
+                if (
+                    previous_tests == tests
+                    and signature.test in passed
+                    and all(signature.key != other.key for other in found)
+                ):
+                    self.failure_memo.record(signature, before, code)
+        self.pending_failures = (found, code, tests) if found else None
+        hints = self.failure_memo.lookup(found)
+        if hints:
+            logger.info(f"💡 Found {len(hints)} known fixes of similar failures")
+        return format_hints(hints)
+
+    def finish_run(self) -> None:
+        if self._candidate_pool is not None:
+            # Abandoned candidates must be done before the outputs are flushed
+            self._candidate_pool.shutdown(wait=True)
+            self._candidate_pool = None
+        logger.info(f"LLM cache stats: {self.cache.stats()}")
+        # Keep the models loaded for the next run
+        pinning = self.warm_up_models(sorted(self.warmed_models))
+        if pinning is not None:
+            pinning.join(timeout=PIN_TIMEOUT)
+        if self.failure_memo is not None:
+            self.failure_memo.save()
+            logger.info(f"Failure memo stats: {self.failure_memo.stats()}")
+
+        # Save the final iteration count whether or not we succeeded
+        self.write_output("iteration_count.txt", str(self.iteration_count))
+        logger.info(f"Saved final iteration count: {self.iteration_count}")
+        self.artifacts.flush()
+        self.checkpoint_writer.flush()
+        self.events.emit(
+            "done", exit_flag=self.exit_flag, iterations=self.iteration_count
+        )
+
+        logger.info(
+            f"Time in LLM stages and tests: {self.tracer.total('stage'):.2f}s, "
+            f"file I/O: {self.tracer.total('io'):.4f}s"
+        )
+        if self.trace_format:
+            filename = "trace.json" if self.trace_format == "chrome" else "trace.jsonl"
+            self.tracer.export(self.get_output_path(filename), self.trace_format)
+            logger.info(f"Exported {self.trace_format} trace to {filename}")
+
+    def start_iteration(self) -> None:
+        self.iteration_count += 1
+        with self._static_lock:
+            self.static_retries_left.clear()
+            self.static_reports.clear()
+        self.completed_stages, self.resumed_stages = self.resumed_stages, set()
+        self.events.emit("iteration", iteration=self.iteration_count)
+        # Escalation moves the developer to a model that may not be loaded yet
+        self.warm_up_models()
+        if self.completed_stages:
+            logger.info(f"Skipping completed stages: {sorted(self.completed_stages)}")
+        logger.info(f"\n=== Starting iteration {self.iteration_count} ===")
+        logger.info(f"\n🔄 Starting iteration {self.iteration_count}...")
+        logger.info(f"🎯 Current topic: {self.inputs['topic']}")
+
+    def run(
+        self,
+        topic: str,
+        logs: str = "",
+        max_iterations: int = MAX_ITERATIONS,
+        resume: bool = False,
+    ):
+        """Run the crew with specific inputs.
+
+        With resume=True the run continues from the last checkpoint of the
+        same topic in the outputs directory.
+        """
+        self.prepare_run(topic, logs, resume)
+        crew = self.crew()
+        exit_crew = self.exit_crew() if self.use_exit_agent else None
+
+        while self.iteration_count < max_iterations and not self.exit_flag:
+            self.start_iteration()
             try:
-                # Execute the crew
-                result = crew.kickoff(inputs=self.inputs)
-                logger.info(f"Crew kickoff completed. Exit flag: {self.exit_flag}")
-
-                # Check if files were created
-                self.debug_paths()
-
-                # Check test results directly
-                test_results_path = self.get_output_path("tests_results.md")
-                if os.path.exists(test_results_path):
-                    with open(test_results_path, "r") as f:
-                        test_results = f.read()
-                    logger.info(f"Test results after kickoff: {test_results[:200]}...")
-
-                    # Check if test results indicate passing
-                    if "result: passed" in test_results.lower():
-                        self.exit_flag = True
-                        logger.info(
-                            "Test results indicate PASS, setting exit_flag to True"
-                        )
+                with self.tracer.span(
+                    "iteration", category="iteration", iteration=self.iteration_count
+                ):
+                    # Execute the crew
+                    test_result = None
+                    if self.candidates > 1:
+                        if "candidates" not in self.completed_stages:
+                            test_result = self.run_candidates()
+                    elif self.use_refinement():
+                        self.kickoff_pending(self.refine_crew())
+                        self.regenerate_if_refinement_failed()
+                    else:
+                        # Rebuilt when the developer was escalated
+                        crew = self.crew()
+                        self.kickoff_pending(crew)
+                    logger.info("Crew kickoff completed")
 
-                # Check exit status file
-                exit_file_path = self.get_output_path("exit_task_output.md")
-                if os.path.exists(exit_file_path):
-                    with open(exit_file_path, "r") as f:
-                        exit_flag_str = f.read().strip()
-                    logger.info(f"Exit flag from file: {exit_flag_str}")
+                    if self.evaluate_iteration(exit_crew, test_result):
+                        break
+            except Exception as e:
+                logger.error(f"Error during iteration: {e}", exc_info=True)
+                if self.checkpoints:
+                    logger.info("Run again with resume=True to continue from here")
+                break
 
-                    if exit_flag_str.lower() == "true":
-                        self.exit_flag = True
-                        logger.info("Exit flag file indicates TRUE")
+        self.finish_run()
+        return crew
 
-                if self.exit_flag:
-                    logger.info("🎉 Exit flag is True - tests passed successfully!")
-                    logger.info("\n✅ Tests passed successfully! Exiting crew.\n")
+    def candidate_cancelled(self, name: str) -> bool:
+        """Whether ``name`` is the task of a candidate abandoned this iteration"""
+        return "#" in name and self._candidate_cancel.is_set()
 
-                    # Save the final iteration count
-                    with open(self.get_output_path("iteration_count.txt"), "w") as f:
-                        f.write(str(self.iteration_count))
-                    logger.info(f"Saved final iteration count: {self.iteration_count}")
+    def evaluate_candidate(self, variant: int, tests_future, cancel) -> tuple:
+        """Generate one candidate fix and run the shared unit tests on it.
 
-                    return crew
-                else:
-                    logger.info("❌ Tests failed or exit flag not set")
+        Returns None as soon as ``cancel`` is set between two stages.
+        """
+        if cancel.is_set():
+            return None
+        output = self.kickoff_and_record(
+            self.build_crew(f"candidate {variant}", [self.candidate_task(variant)])
+        )
+        if cancel.is_set():
+            return None
+        code = extract_code(output.raw)
+        tests = tests_future.result()
+        if cancel.is_set():
+            return None
+        result = run_unit_tests(
+            code,
+            tests,
+            timeout=self.test_timeout,
+            cpu_seconds=self.test_cpu_seconds,
+            memory_mb=self.test_memory_mb,
+            pool=self.worker_pool(),
+            cancel=cancel,
+            instrument=self.instrument,
+            # The candidates already run in parallel, so their tests are not sharded
+            **{**self.test_schedule(tests), "shards": 1},
+        )
+        if cancel.is_set():
+            return None
+        self.record_stage("execute_unit_tests", result.duration, candidate=variant)
+        logger.info(
+            f"Candidate {variant}: passed={result.passed} failed={result.failed} "
+            f"errors={result.errors} cancelled={result.cancelled}"
+        )
+        return variant, code, tests, result
+
+    def run_candidates(self) -> TestRunResult:
+        """Generate candidates concurrently and keep the first one passing.
+
+        All candidates share one set of tests, written by the tester unless
+        the tests are frozen. Once a candidate
+        passes, the test runs of the others are killed and they stop, without
+        recording or writing anything, at their next stage or guardrail retry.
+        finish_run() waits for them.
+        """
+        if self._candidate_pool is not None:
+            # Candidates abandoned in the previous iteration still use the crews
+            self._candidate_pool.shutdown(wait=True)
+        pool = self._candidate_pool = ThreadPoolExecutor(
+            max_workers=self.candidates + 1, thread_name_prefix="loogy-candidate"
+        )
+        cancel = self._candidate_cancel = threading.Event()
+        tests_future = pool.submit(self.write_unit_tests)
+        futures = [
+            pool.submit(self.evaluate_candidate, variant, tests_future, cancel)
+            for variant in range(self.candidates)
+        ]
+
+        best = None
+        try:
+            for future in as_completed(futures):
+                try:
+                    candidate = future.result()
+                except Exception as e:
+                    logger.warning(f"Candidate failed: {e}")
+                    continue
+                if candidate is None:
+                    continue
+                result = candidate[3]
+                score = (result.ok, result.passed, -result.failed - result.errors)
+                if best is None or score > best[0]:
+                    best = (score, candidate)
+                if result.ok:
+                    break
+        finally:
+            cancel.set()
+            pool.shutdown(wait=False, cancel_futures=True)
+
+        if best is None:
+            raise RuntimeError("No candidate could be generated and tested")
+        variant, code, tests, result = best[1]
+        logger.info(f"Keeping candidate {variant}")
+        self.write_output("codebase.py", code)
+        self.write_output("unit_tests.py", tests)
+        self.write_output("tests_results.md", result.to_markdown())
+        self.record_test_run(tests, result)
+        self.complete_stage("candidates")
+        return result
+
+    def stage_crew(self, task: Task) -> Crew:
+        """Creates a crew running a single task, for stages run concurrently"""
+        return self.build_crew(f"stage {task.name}", [task])
+
+    async def arun(
+        self,
+        topic: str,
+        logs: str = "",
+        max_iterations: int = MAX_ITERATIONS,
+        resume: bool = False,
+    ):
+        """Run the crew asynchronously.
+
+        The tester drafts the unit tests from the task spec while the developer
+        writes the code, and all LLM calls share a pooled HTTP client.
+        """
+        configure_http_pool()
+        self.prepare_run(topic, logs, resume)
+        developer_crew = self.stage_crew(self.develop_topic_task())
+        exit_crew = self.exit_crew() if self.use_exit_agent else None
+
+        while self.iteration_count < max_iterations and not self.exit_flag:
+            self.start_iteration()
+            try:
+                with self.tracer.span(
+                    "iteration", category="iteration", iteration=self.iteration_count
+                ):
+                    test_result = None
+                    if self.candidates > 1:
+                        if "candidates" not in self.completed_stages:
+                            test_result = await asyncio.to_thread(self.run_candidates)
+                    else:
+                        if self.use_refinement():
+                            developer_stage = self.stage_crew(self.refine_code_task())
+                        else:
+                            # Rebuilt when the developer was escalated
+                            developer_crew = self.stage_crew(self.develop_topic_task())
+                            developer_stage = developer_crew
+                        stages = [developer_stage]
+                        if not self.tests_frozen():
+                            stages.append(
+                                self.stage_crew(self.write_unit_tests_task())
+                            )
+                        await asyncio.gather(
+                            *(
+                                asyncio.to_thread(self.kickoff_pending, stage)
+                                for stage in stages
+                            )
+                        )
+                        await asyncio.to_thread(self.regenerate_if_refinement_failed)
+                    logger.info("Developer and tester stages completed")
 
+                    if await asyncio.to_thread(
+                        self.evaluate_iteration, exit_crew, test_result
+                    ):
+                        break
             except Exception as e:
                 logger.error(f"Error during iteration: {e}", exc_info=True)
+                if self.checkpoints:
+                    logger.info("Run again with resume=True to continue from here")
                 break
 
-        # Save the final iteration count even if we didn't succeed
-        with open(self.get_output_path("iteration_count.txt"), "w") as f:
-            f.write(str(self.iteration_count))
-        logger.info(f"Saved final iteration count: {self.iteration_count}")
-
-        return crew
+        self.finish_run()
+        return developer_crew
 
     def ensure_output_files_exist(self):
-        """Create empty output files if they don't exist"""
+        """Create placeholder outputs if they don't exist"""
         try:
             # List of required output files
             required_files = [
                 "codebase.py",
                 "unit_tests.py",
                 "tests_results.md",
-                "exit_task_output.md",
             ]
 
             for filename in required_files:
-                file_path = os.path.join(str(self.outputs_dir), filename)
-                if not os.path.exists(file_path):
-                    # Create directory if it doesn't exist
-                    os.makedirs(os.path.dirname(file_path), exist_ok=True)
-
+                if not self.artifacts.exists(filename):
                     # Create empty file with appropriate content
                     if filename.endswith(".py"):
                         content = "# No code generated yet"
@@ -462,9 +1590,8 @@ class loogy(Flow):
                     else:
                         content = ""
 
-                    with open(file_path, "w") as f:
-                        f.write(content)
-                    logger.info(f"Created empty file: {file_path}")
+                    self.write_output(filename, content)
+                    logger.info(f"Created placeholder: {filename}")
 
             logger.info("Ensured all required output files exist")
         except Exception as e:
@@ -0,0 +1,7 @@
+"""Defaults shared by the crew and the entry points.
+
+This module must stay free of heavy imports: ``loogy --help``, the batch
+driver and the Streamlit app read these values without loading crewAI.
+"""
+
+MAX_ITERATIONS = 3
@@ -0,0 +1,72 @@
+"""Live events of a loogy run.
+
+The crew emits an event when an iteration starts, for every token streamed
+by an agent's LLM, when a stage finishes, when an output is stored and when
+the run ends. Events are dicts with an ``event`` key (see ``EVENT_TYPES``)
+and a ``time``. ``EventBus.iterate`` turns a run into a generator of its
+events for UIs such as the Streamlit app and ``loogy --stream``.
+"""
+import queue
+import threading
+import time
+from typing import Any, Callable, Iterator
+
+EVENT_TYPES = ("iteration", "token", "stage", "artifact", "done", "error")
+
+
+class EventBus:
+    """Fans events out to listeners; LLMs only stream while someone listens"""
+
+    def __init__(self):
+        self.listeners = []
+        self._lock = threading.Lock()
+
+    @property
+    def active(self) -> bool:
+        return bool(self.listeners)
+
+    def subscribe(self, listener: Callable[[dict], None]) -> None:
+        with self._lock:
+            self.listeners.append(listener)
+
+    def unsubscribe(self, listener: Callable[[dict], None]) -> None:
+        with self._lock:
+            if listener in self.listeners:
+                self.listeners.remove(listener)
+
+    def emit(self, event: str, **fields) -> None:
+        if not self.listeners:
+            return
+        payload = {"event": event, "time": time.time(), **fields}
+        for listener in list(self.listeners):
+            listener(payload)
+
+    def iterate(self, run: Callable[[], Any]) -> Iterator[dict]:
+        """Call ``run`` on a thread and yield its events until it returns"""
+        events = queue.Queue()
+        finished = object()
+
+        def target():
+            try:
+                run()
+            except BaseException as e:
+                events.put(
+                    {
+                        "event": "error",
+                        "time": time.time(),
+                        "error": f"{type(e).__name__}: {e}",
+                    }
+                )
+            finally:
+                events.put(finished)
+
+        self.subscribe(events.put)
+        threading.Thread(target=target, name="loogy-events", daemon=True).start()
+        try:
+            while True:
+                event = events.get()
+                if event is finished:
+                    return
+                yield event
+        finally:
+            self.unsubscribe(events.put)
@@ -0,0 +1,501 @@
+"""Standalone unit test harness executed inside the sandbox subprocess.
+
+Usage: python harness.py [--instrument] [--plan plan.json]
+                         [--cpu-seconds N] [--memory-mb N] <workdir> <report.json>
+       python harness.py --serve [module ...]
+
+Imports ``unit_tests.py`` from ``workdir`` (which also holds ``codebase.py``),
+runs every test individually and writes a JSON report with per-test outcomes,
+durations and tracebacks. A plan selects the tests to run, in order, or the
+tests to leave out, and can stop at the first failure (see ``select_tests``).
+With ``--instrument`` the report of a failing test
+also says what ``codebase.py`` did at runtime (see ``RuntimeRecorder``). This
+file must only depend on the standard library because it runs under
+``python -I`` with nothing from loogy on the path.
+
+With ``--serve`` the harness is a warm worker: it imports the modules once,
+then forks a process per test run requested on stdin (see ``serve``).
+"""
+import argparse
+import collections
+import importlib
+import inspect
+import json
+import linecache
+import os
+import selectors
+import signal
+import sys
+import time
+import traceback
+import unittest
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+# Prefix stripped from paths so reports do not depend on the temporary directory
+WORKDIR_PREFIX = ""
+
+# Limits of the runtime records of one test
+MAX_TRACE_EVENTS = 200000
+MAX_RECORDED_LINES = 10
+MAX_RECORDED_CALLS = 5
+MAX_RECORDED_NAMES = 12
+MAX_REPR_CHARS = 60
+SCALAR_TYPES = (bool, int, float, complex, str, bytes, type(None))
+CONTAINER_TYPES = (list, tuple, dict, set, frozenset)
+
+
+def _relative(text):
+    return text.replace(WORKDIR_PREFIX, "") if WORKDIR_PREFIX and text else text
+
+
+def _format_exc(exc_info):
+    return _relative("".join(traceback.format_exception(*exc_info)))
+
+
+def describe(value):
+    """Type and shape of a value, e.g. ndarray float64 (800, 20) or int 3"""
+    kind = type(value).__name__
+    try:
+        if isinstance(value, SCALAR_TYPES):
+            text = repr(value)
+            if len(text) > MAX_REPR_CHARS:
+                text = text[: MAX_REPR_CHARS - 3] + "..."
+            return f"{kind} {text}"
+        shape = getattr(value, "shape", None)
+        if isinstance(shape, tuple):
+            dtype = getattr(value, "dtype", None)
+            return f"{kind} {dtype} {shape}" if dtype is not None else f"{kind} {shape}"
+        if isinstance(value, CONTAINER_TYPES):
+            return f"{kind} len={len(value)}"
+    except Exception:
+        pass
+    return kind
+
+
+def describe_names(names):
+    """Describe variables, leaving out modules, functions and classes"""
+    described = {}
+    for name, value in names.items():
+        if len(described) >= MAX_RECORDED_NAMES:
+            break
+        hidden = inspect.ismodule(value) or inspect.isclass(value)
+        hidden = hidden or inspect.isroutine(value)
+        if hidden or name.startswith("__"):
+            continue
+        described[name] = describe(value)
+    return described
+
+
+class RuntimeRecorder:
+    """Records what codebase.py does while a test runs, with sys.settrace.
+
+    Only frames of codebase.py are traced, so library code runs at full
+    speed. The records are the last calls into codebase.py with the shapes
+    of their arguments and results, the last lines executed and the local
+    variables of the frame that raised. Tracing stops after
+    MAX_TRACE_EVENTS events, e.g. in long Python loops.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.reset()
+
+    def reset(self):
+        self.calls = collections.deque(maxlen=MAX_RECORDED_CALLS)
+        self.lines = collections.deque(maxlen=MAX_RECORDED_LINES)
+        self.exception = None
+        self._raised = None
+        self.events = 0
+        self.truncated = False
+
+    def start(self):
+        self.reset()
+        sys.settrace(self._trace_call)
+
+    def stop(self):
+        sys.settrace(None)
+
+    def _trace_call(self, frame, event, arg):
+        if frame.f_code.co_filename != self.path:
+            return None
+        call = None
+        caller = frame.f_back
+        # Calls from inside codebase.py are covered by the executed lines
+        if frame.f_code.co_name != "<module>" and (
+            caller is None or caller.f_code.co_filename != self.path
+        ):
+            code = frame.f_code
+            count = code.co_argcount + code.co_kwonlyargcount
+            names = code.co_varnames[:count]
+            values = frame.f_locals
+            args = {name: values[name] for name in names if name in values}
+            function = getattr(code, "co_qualname", code.co_name)
+            call = {"function": function, "args": describe_names(args)}
+            self.calls.append(call)
+        return self._local_tracer(call)
+
+    def _local_tracer(self, call):
+        raising = False
+
+        def trace(frame, event, arg):
+            nonlocal raising
+            self.events += 1
+            if self.events > MAX_TRACE_EVENTS:
+                self.truncated = True
+                sys.settrace(None)
+                return None
+            if event == "line":
+                if raising:
+                    # The exception was handled in this frame
+                    raising = False
+                    self.exception = None
+                self.lines.append((frame.f_code.co_name, frame.f_lineno))
+            elif event == "exception":
+                raising = True
+                # The innermost frame is the first to see a new exception
+                if arg[1] is not self._raised:
+                    self._raised = arg[1]
+                    self.exception = {
+                        "function": frame.f_code.co_name,
+                        "line": frame.f_lineno,
+                        "error_type": arg[0].__name__,
+                        "locals": describe_names(frame.f_locals),
+                    }
+            elif event == "return" and call is not None:
+                if raising:
+                    call["raised"] = type(self._raised).__name__
+                else:
+                    call["returned"] = describe(arg)
+            return trace
+
+        return trace
+
+    def snapshot(self):
+        """The records of the test as a JSON-serializable dict"""
+        return {
+            "calls": list(self.calls),
+            "lines": [
+                {
+                    "function": function,
+                    "line": line,
+                    "source": linecache.getline(self.path, line).strip(),
+                }
+                for function, line in self.lines
+            ],
+            "exception": self.exception,
+            "truncated": self.truncated,
+        }
+
+
+class RecordingResult(unittest.TestResult):
+    """TestResult that records one entry per test with its duration"""
+
+    def __init__(self, recorder=None):
+        super().__init__()
+        self.records = []
+        self.recorder = recorder
+        self._started = {}
+
+    def startTest(self, test):
+        super().startTest(test)
+        self._started[test.id()] = time.perf_counter()
+        if self.recorder is not None:
+            self.recorder.start()
+
+    def stopTest(self, test):
+        if self.recorder is not None:
+            self.recorder.stop()
+        super().stopTest(test)
+
+    def _record(self, test, outcome, exc_info=None, reason=None):
+        started = self._started.pop(test.id(), time.perf_counter())
+        runtime = None
+        if self.recorder is not None:
+            self.recorder.stop()
+            if outcome in ("failed", "error"):
+                runtime = self.recorder.snapshot()
+        self.records.append(
+            {
+                "name": test.id(),
+                "outcome": outcome,
+                "duration": round(time.perf_counter() - started, 6),
+                "error_type": exc_info[0].__name__ if exc_info else None,
+                "message": _relative(str(exc_info[1])) if exc_info else reason,
+                "traceback": _relative(self._exc_info_to_string(exc_info, test))
+                if exc_info
+                else None,
+                "runtime": runtime,
+            }
+        )
+
+    def addSuccess(self, test):
+        super().addSuccess(test)
+        self._record(test, "passed")
+
+    def addFailure(self, test, err):
+        super().addFailure(test, err)
+        self._record(test, "failed", err)
+
+    def addError(self, test, err):
+        super().addError(test, err)
+        self._record(test, "error", err)
+
+    def addSkip(self, test, reason):
+        super().addSkip(test, reason)
+        self._record(test, "skipped", reason=reason)
+
+    def addExpectedFailure(self, test, err):
+        super().addExpectedFailure(test, err)
+        self._record(test, "passed")
+
+    def addUnexpectedSuccess(self, test):
+        super().addUnexpectedSuccess(test)
+        self._record(test, "failed", reason="unexpected success")
+
+
+def _iter_tests(suite):
+    for item in suite:
+        if isinstance(item, unittest.TestSuite):
+            yield from _iter_tests(item)
+        else:
+            yield item
+
+
+def _plain_class_tests(module, cls):
+    """Wrap pytest-style ``Test*`` classes that do not subclass TestCase"""
+    tests = []
+    for name, _ in inspect.getmembers(cls, inspect.isfunction):
+        if not name.startswith("test"):
+            continue
+
+        def run(cls=cls, name=name):
+            instance = cls()
+            if hasattr(instance, "setup_method"):
+                instance.setup_method(getattr(instance, name))
+            try:
+                getattr(instance, name)()
+            finally:
+                if hasattr(instance, "teardown_method"):
+                    instance.teardown_method(getattr(instance, name))
+
+        run.__name__ = name
+        run.__qualname__ = f"{cls.__name__}.{name}"
+        run.__module__ = module.__name__
+        tests.append(unittest.FunctionTestCase(run))
+    return tests
+
+
+def collect(module):
+    """Collect unittest cases plus pytest-style test functions and classes"""
+    tests = list(_iter_tests(unittest.defaultTestLoader.loadTestsFromModule(module)))
+    for name, obj in vars(module).items():
+        if getattr(obj, "__module__", None) != module.__name__:
+            continue
+        if inspect.isfunction(obj) and name.startswith("test"):
+            tests.append(unittest.FunctionTestCase(obj))
+        elif (
+            inspect.isclass(obj)
+            and name.startswith("Test")
+            and not issubclass(obj, unittest.TestCase)
+        ):
+            tests.extend(_plain_class_tests(module, obj))
+    return tests
+
+
+def select_tests(tests, plan):
+    """Apply a plan's "select" (test ids, in order) and "exclude" lists"""
+    exclude = set(plan.get("exclude") or ())
+    tests = [test for test in tests if test.id() not in exclude]
+    if plan.get("select") is None:
+        return tests
+    by_id = {}
+    for test in tests:
+        by_id.setdefault(test.id(), []).append(test)
+    return [test for test_id in plan["select"] for test in by_id.pop(test_id, [])]
+
+
+def main(workdir, report_path, instrument=False, plan=None):
+    global WORKDIR_PREFIX
+    WORKDIR_PREFIX = os.path.join(workdir, "")
+    os.chdir(workdir)
+    sys.path.insert(0, workdir)
+    report = {"collection_error": None, "tests": []}
+    started = time.perf_counter()
+    recorder = None
+    if instrument:
+        recorder = RuntimeRecorder(os.path.join(workdir, "codebase.py"))
+        recorder.start()
+
+    try:
+        module = importlib.import_module("unit_tests")
+        tests = collect(module)
+    except BaseException:
+        report["collection_error"] = {
+            "error_type": sys.exc_info()[0].__name__,
+            "message": _relative(str(sys.exc_info()[1])),
+            "traceback": _format_exc(sys.exc_info()),
+            "runtime": recorder.snapshot() if recorder else None,
+        }
+        tests = []
+    finally:
+        if recorder is not None:
+            recorder.stop()
+
+    plan = plan or {}
+    tests = select_tests(tests, plan)
+    result = RecordingResult(recorder)
+    result.failfast = plan.get("failfast", False)
+    for test in tests:
+        if result.shouldStop:
+            break
+        test(result)
+    report["tests"] = result.records
+    report["duration"] = round(time.perf_counter() - started, 6)
+
+    with open(report_path, "w") as f:
+        json.dump(report, f)
+
+    # A plan may legitimately select no tests, a whole suite may not
+    empty = not tests and not plan
+    failed = report["collection_error"] or not result.wasSuccessful() or empty
+    return 1 if failed else 0
+
+
+def _send(message):
+    sys.stdout.write(json.dumps(message) + "\n")
+    sys.stdout.flush()
+
+
+def limit_resources(cpu_seconds, memory_mb):
+    """Apply the rlimits of a test run to this process"""
+    if resource is None:
+        return
+    if cpu_seconds:
+        resource.setrlimit(resource.RLIMIT_CPU, (cpu_seconds, cpu_seconds))
+    if memory_mb:
+        limit = memory_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def _run_forked(request):
+    """Body of a forked test run; never returns"""
+    code = 1
+    try:
+        os.setsid()
+        devnull = os.open(os.devnull, os.O_RDONLY)
+        os.dup2(devnull, 0)
+        for fd, key in ((1, "stdout"), (2, "stderr")):
+            output = os.open(request[key], os.O_WRONLY | os.O_CREAT | os.O_TRUNC)
+            os.dup2(output, fd)
+        os.environ.clear()
+        os.environ.update(request["env"])
+        limit_resources(request.get("cpu_seconds"), request.get("memory_mb"))
+        code = main(
+            request["workdir"],
+            request["report"],
+            request.get("instrument", False),
+            request.get("plan"),
+        )
+    except SystemExit as e:
+        code = e.code if isinstance(e.code, int) else 1
+    except BaseException:
+        traceback.print_exc()
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os._exit(code)
+
+
+def _reap(running):
+    while running:
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            return
+        if pid == 0:
+            return
+        exit_code = os.waitstatus_to_exitcode(status)
+        _send({"id": running.pop(pid, None), "exit_code": exit_code})
+
+
+def serve(modules):
+    """Import ``modules`` once, then fork a test run per request.
+
+    Requests are JSON lines on stdin with the run's id, workdir, report,
+    stdout and stderr paths, env and limits. The worker answers with
+    {"id", "pid"} once the run is forked and {"id", "exit_code"} when it ends,
+    and exits when stdin is closed.
+    """
+    loaded = []
+    for name in modules:
+        try:
+            importlib.import_module(name)
+            loaded.append(name)
+        except BaseException:
+            pass
+
+    # SIGCHLD wakes up the select loop so finished runs are reaped
+    wakeup_read, wakeup_write = os.pipe()
+    os.set_blocking(wakeup_write, False)
+    signal.set_wakeup_fd(wakeup_write)
+    signal.signal(signal.SIGCHLD, lambda signum, frame: None)
+    selector = selectors.DefaultSelector()
+    selector.register(0, selectors.EVENT_READ)
+    selector.register(wakeup_read, selectors.EVENT_READ)
+    _send({"ready": True, "modules": loaded})
+
+    running = {}
+    buffer = b""
+    while True:
+        for key, _ in selector.select():
+            if key.fd == wakeup_read:
+                os.read(wakeup_read, 4096)
+                _reap(running)
+                continue
+            data = os.read(0, 65536)
+            if not data:
+                return 0
+            buffer += data
+            while b"\n" in buffer:
+                line, buffer = buffer.split(b"\n", 1)
+                request = json.loads(line)
+                pid = os.fork()
+                if pid == 0:
+                    signal.set_wakeup_fd(-1)
+                    signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+                    selector.close()
+                    os.close(wakeup_read)
+                    os.close(wakeup_write)
+                    _run_forked(request)
+                running[pid] = request["id"]
+                _send({"id": request["id"], "pid": pid})
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Run unit_tests.py in workdir")
+    parser.add_argument("workdir")
+    parser.add_argument("report")
+    parser.add_argument("--instrument", action="store_true")
+    parser.add_argument("--plan", help="JSON file with the plan of the run")
+    parser.add_argument("--cpu-seconds", type=int, default=0)
+    parser.add_argument("--memory-mb", type=int, default=0)
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--serve"]:
+        sys.exit(serve(sys.argv[2:]))
+    args = parse_args(sys.argv[1:])
+    # Applied here rather than in a preexec_fn, which is unsafe in a
+    # threaded parent
+    limit_resources(args.cpu_seconds, args.memory_mb)
+    plan = None
+    if args.plan:
+        with open(args.plan) as f:
+            plan = json.load(f)
+    sys.exit(main(args.workdir, args.report, args.instrument, plan))
@@ -0,0 +1,68 @@
+"""Shared keep-alive HTTP connection pool for the LLM calls.
+
+litellm creates HTTP clients lazily with small default pools. When one
+process drives many concurrent runs we install a single pooled client for
+OpenAI-compatible calls (``litellm.client_session``). litellm's Ollama
+provider ignores the module level clients and only uses a handler passed as
+``client=``, so CachedLLM passes ``shared_http_handler()`` on its Ollama
+calls and connections to the model server are reused across agents and runs.
+"""
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+DEFAULT_MAX_CONNECTIONS = 64
+DEFAULT_KEEPALIVE_EXPIRY = 120.0
+DEFAULT_TIMEOUT = 600.0
+
+_lock = threading.Lock()
+_configured = False
+_handler = None
+
+
+def configure_http_pool(
+    max_connections: int = DEFAULT_MAX_CONNECTIONS,
+    keepalive_expiry: float = DEFAULT_KEEPALIVE_EXPIRY,
+    timeout: float = DEFAULT_TIMEOUT,
+) -> None:
+    """Install pooled httpx clients in litellm, once per process"""
+    global _configured, _handler
+    with _lock:
+        if _configured:
+            return
+
+        import httpx
+        import litellm
+        from litellm.llms.custom_httpx.http_handler import (
+            AsyncHTTPHandler,
+            HTTPHandler,
+        )
+
+        limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        if litellm.client_session is None:
+            litellm.client_session = httpx.Client(limits=limits, timeout=timeout)
+        if litellm.aclient_session is None:
+            litellm.aclient_session = httpx.AsyncClient(limits=limits, timeout=timeout)
+        _handler = HTTPHandler(
+            timeout=timeout, client=httpx.Client(limits=limits, timeout=timeout)
+        )
+        litellm.module_level_client = _handler
+        litellm.module_level_aclient = AsyncHTTPHandler(
+            timeout=timeout, concurrent_limit=max_connections
+        )
+        _configured = True
+        logger.info(
+            f"Configured shared HTTP pool: max_connections={max_connections}, "
+            f"keepalive_expiry={keepalive_expiry}s"
+        )
+
+
+def shared_http_handler():
+    """The pooled litellm HTTPHandler, or None before configure_http_pool()"""
+    return _handler
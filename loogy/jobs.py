@@ -0,0 +1,155 @@
+"""Background execution of loogy runs for front ends serving many users.
+
+``JobQueue`` runs crews on a bounded pool of threads so a web request never
+blocks on a run. Jobs wait in the queue until a worker is free. Each session
+has at most ``max_per_session`` unfinished jobs and the queue holds at most
+``max_pending`` of them. Job state is updated from the run's events (see
+``loogy.events``), so the UI can poll it while the run is in progress.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+import threading
+import time
+import uuid
+from typing import Any, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+DEFAULT_MAX_WORKERS = 2
+DEFAULT_MAX_PENDING = 16
+# Finished jobs kept for sessions that have not looked at them yet
+MAX_FINISHED_JOBS = 100
+# Characters of live agent output kept per job
+MAX_TOKEN_CHARS = 4000
+
+JOB_STATUSES = ("queued", "running", "passed", "failed", "error")
+
+
+class JobRejected(RuntimeError):
+    """Raised when the queue or the session already has too many jobs"""
+
+
+@dataclass
+class Job:
+    job_id: str
+    session_id: str
+    topic: str
+    crew: Any = field(default=None, repr=False)
+    options: dict = field(default_factory=dict)
+    status: str = "queued"
+    submitted: float = field(default_factory=time.time)
+    started: Optional[float] = None
+    finished: Optional[float] = None
+    iteration: int = 0
+    stage: Optional[str] = None
+    agent: Optional[str] = None
+    tokens: str = ""
+    artifacts: dict = field(default_factory=dict)
+    error: Optional[str] = None
+
+    @property
+    def done(self) -> bool:
+        return self.status in ("passed", "failed", "error")
+
+    def apply(self, event: dict) -> None:
+        """Update the job from an event of its run"""
+        kind = event["event"]
+        if kind == "token":
+            if event["agent"] != self.agent:
+                self.agent = event["agent"]
+                self.tokens = ""
+            self.tokens = (self.tokens + event["text"])[-MAX_TOKEN_CHARS:]
+        elif kind == "iteration":
+            self.iteration = event["iteration"]
+        elif kind == "stage":
+            self.stage = event["stage"]
+        elif kind == "artifact":
+            self.artifacts[event["name"]] = event["content"]
+        elif kind == "done":
+            self.status = "passed" if event["exit_flag"] else "failed"
+        elif kind == "error":
+            self.status = "error"
+            self.error = event["error"]
+
+
+class JobQueue:
+    """Runs jobs on at most ``max_workers`` threads.
+
+    Give each session its own crew and output directory so concurrent runs do
+    not share files; a crew runs one job at a time.
+    """
+
+    def __init__(
+        self,
+        max_workers: int = DEFAULT_MAX_WORKERS,
+        max_pending: int = DEFAULT_MAX_PENDING,
+        max_per_session: int = 1,
+    ):
+        self.max_pending = max_pending
+        self.max_per_session = max_per_session
+        self.jobs = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="loogy-job"
+        )
+
+    def submit(self, session_id: str, crew, topic: str, **options) -> Job:
+        """Queue a run of ``crew`` on ``topic``; options go to crew.stream()"""
+        with self._lock:
+            unfinished = [job for job in self.jobs.values() if not job.done]
+            if len(unfinished) >= self.max_pending:
+                raise JobRejected("Too many runs in progress, try again later")
+            mine = [job for job in unfinished if job.session_id == session_id]
+            if len(mine) >= self.max_per_session:
+                raise JobRejected("A run of this session is still in progress")
+            job = Job(uuid.uuid4().hex, session_id, topic, crew, options)
+            self.jobs[job.job_id] = job
+            self._prune()
+        position = sum(1 for other in unfinished if other.status == "queued")
+        logger.info(f"Queued job {job.job_id} ({position} jobs ahead)")
+        self._executor.submit(self._run, job)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self.jobs.get(job_id)
+
+    def position(self, job: Job) -> int:
+        """Number of queued jobs submitted before ``job``"""
+        with self._lock:
+            return sum(
+                1
+                for other in self.jobs.values()
+                if other.status == "queued" and other.submitted < job.submitted
+            )
+
+    def _prune(self) -> None:
+        finished = sorted(
+            (job for job in self.jobs.values() if job.done),
+            key=lambda job: job.finished or time.time(),
+        )
+        for job in finished[: max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self.jobs[job.job_id]
+
+    def _run(self, job: Job) -> None:
+        job.status = "running"
+        job.started = time.time()
+        try:
+            for event in job.crew.stream(job.topic, **job.options):
+                job.apply(event)
+            if not job.done:
+                job.status = "passed" if job.crew.exit_flag else "failed"
+        except Exception as e:
+            logger.error(f"Job {job.job_id} failed: {e}", exc_info=True)
+            job.status = "error"
+            job.error = f"{type(e).__name__}: {e}"
+        finally:
+            job.finished = time.time()
+            logger.info(
+                f"Job {job.job_id} {job.status} in {job.finished - job.started:.1f}s"
+            )
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._executor.shutdown(wait=wait, cancel_futures=True)
@@ -1,22 +1,240 @@
-from loogy.crew import loogy
+from loogy.cache import DEFAULT_CACHE_DIR
+from loogy.compaction import DEFAULT_TOKEN_BUDGET
+from loogy.memo import DEFAULT_MEMO_PATH
+from loogy.warmup import DEFAULT_KEEP_ALIVE
 import argparse
+import asyncio
 import os
+import sys
 
-def get_parser():
-    parser = argparse.ArgumentParser()
+def get_parser(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Run loogy on a script; use `loogy batch` for many scripts"
+    )
     parser.add_argument("--model_provider", type=str, default="Ollama")
     parser.add_argument("--model_name", type=str, default="qwen2.5-coder:7b")
     parser.add_argument("--path-to-script", type=str, default="buggy/buggy.py")
-    return parser.parse_args()
+    parser.add_argument(
+        "--use-exit-agent",
+        action="store_true",
+        help="Also ask the exit agent to confirm passing test results",
+    )
+    parser.add_argument(
+        "--no-cache", action="store_true", help="Bypass the LLM response cache"
+    )
+    parser.add_argument("--cache-dir", type=str, default=DEFAULT_CACHE_DIR)
+    parser.add_argument(
+        "--no-failure-memo",
+        action="store_true",
+        help="Do not look up or record fixes of earlier failures",
+    )
+    parser.add_argument("--failure-memo-path", type=str, default=DEFAULT_MEMO_PATH)
+    parser.add_argument(
+        "--logs-token-budget",
+        type=int,
+        default=DEFAULT_TOKEN_BUDGET,
+        help="Approximate tokens of test results fed back to the developer (0: no limit)",
+    )
+    parser.add_argument(
+        "--refine",
+        choices=["full", "edit"],
+        default="full",
+        help="edit: after the first iteration ask for edits to the previous code "
+        "instead of regenerating the whole file",
+    )
+    parser.add_argument(
+        "--no-static-checks",
+        action="store_true",
+        help="Skip the static analysis of the generated code before the tests",
+    )
+    parser.add_argument(
+        "--candidates",
+        type=int,
+        default=1,
+        help="Fixes generated concurrently per iteration; the first one passing "
+        "the tests is kept",
+    )
+    parser.add_argument(
+        "--candidate-models",
+        nargs="+",
+        help="Models the candidates cycle through (default: --model_name at "
+        "different temperatures)",
+    )
+    parser.add_argument(
+        "--agent-model",
+        action="append",
+        default=[],
+        metavar="AGENT=PROVIDER/MODEL",
+        help="Model of one agent, e.g. tester=Ollama/qwen2.5-coder:1.5b (repeatable)",
+    )
+    parser.add_argument(
+        "--escalate-after",
+        type=int,
+        help="Failed iterations after which the developer moves to "
+        "--escalation-model",
+    )
+    parser.add_argument(
+        "--escalation-model",
+        type=str,
+        help="Larger model for the developer, e.g. OpenAI/gpt-4o",
+    )
+    parser.add_argument(
+        "--api-base",
+        type=str,
+        help="Base URL of the Ollama or OpenAI-compatible model server, "
+        "e.g. a local `loogy stub-server`",
+    )
+    parser.add_argument(
+        "--keep-alive",
+        type=str,
+        default=DEFAULT_KEEP_ALIVE,
+        help="How long Ollama keeps the models loaded after a run, e.g. 30m or -1",
+    )
+    parser.add_argument(
+        "--no-warm-up",
+        action="store_true",
+        help="Do not load and pin the Ollama models in the background",
+    )
+    parser.add_argument(
+        "--no-freeze-tests",
+        action="store_true",
+        help="Ask the tester for new unit tests in every iteration",
+    )
+    parser.add_argument(
+        "--test-shards",
+        type=int,
+        help="Processes the unit tests are split over once they take long enough "
+        "(default: one per CPU)",
+    )
+    parser.add_argument(
+        "--no-instrument",
+        action="store_true",
+        help="Do not record what the code did at runtime in failing tests",
+    )
+    parser.add_argument(
+        "--no-warm-workers",
+        action="store_true",
+        help="Start a new interpreter for every test run instead of forking "
+        "from a warm worker",
+    )
+    parser.add_argument(
+        "--preload-modules",
+        nargs="+",
+        help="Modules the warm worker imports once (default: the script's imports)",
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Print the agents' tokens and stage events live",
+    )
+    parser.add_argument(
+        "--async",
+        dest="use_async",
+        action="store_true",
+        help="Run with loogy.arun(): the tester writes the tests while the "
+        "developer writes the code",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Continue from the last checkpoint in the outputs directory",
+    )
+    parser.add_argument(
+        "--trace-format",
+        choices=["jsonl", "chrome", "none"],
+        default="jsonl",
+        help="Format of the per-run trace written to the outputs directory",
+    )
+    return parser.parse_args(argv)
+
+def parse_agent_models(specs):
+    """Turn AGENT=PROVIDER/MODEL options into a dict"""
+    agent_models = {}
+    for spec in specs:
+        agent, sep, model = spec.partition("=")
+        if not sep or not agent or not model:
+            raise SystemExit(f"--agent-model expects AGENT=PROVIDER/MODEL, got {spec}")
+        agent_models[agent.strip()] = model.strip()
+    return agent_models
 
 def get_script_content(path_to_script):
     with open(path_to_script, "r") as f:
         return f.read()
 
+def stream_run(crew, topic, resume=False):
+    """Run the crew printing tokens and stage events as they arrive"""
+    agent = None
+    for event in crew.stream(topic, resume=resume):
+        kind = event["event"]
+        if kind == "token":
+            if event["agent"] != agent:
+                agent = event["agent"]
+                print(f"\n--- {agent} ---")
+            print(event["text"], end="", flush=True)
+            continue
+        agent = None
+        if kind == "iteration":
+            print(f"\n=== Iteration {event['iteration']} ===")
+        elif kind == "stage":
+            print(f"\n[{event['stage']} finished in {event['seconds']:.2f}s]")
+        elif kind == "done":
+            outcome = "tests passed" if event["exit_flag"] else "tests still failing"
+            print(f"\nFinished after {event['iterations']} iterations: {outcome}")
+        elif kind == "error":
+            print(f"\nRun failed: {event['error']}", file=sys.stderr)
+
 def main(args):
-    crew = loogy(model_provider=args.model_provider, model_name=args.model_name)
-    crew.run(topic=get_script_content(args.path_to_script))
+    if args.stream and args.use_async:
+        raise SystemExit("--stream and --async cannot be combined")
+    # crewAI takes seconds to import, so --help and `loogy batch` do not load it
+    from loogy.crew import loogy
+
+    crew = loogy(
+        model_provider=args.model_provider,
+        model_name=args.model_name,
+        use_exit_agent=args.use_exit_agent,
+        use_cache=not args.no_cache,
+        cache_dir=args.cache_dir,
+        failure_memo=not args.no_failure_memo,
+        failure_memo_path=args.failure_memo_path,
+        logs_token_budget=args.logs_token_budget,
+        refine=args.refine,
+        static_checks=not args.no_static_checks,
+        candidates=args.candidates,
+        candidate_models=args.candidate_models,
+        warm_workers=not args.no_warm_workers,
+        instrument=not args.no_instrument,
+        freeze_tests=not args.no_freeze_tests,
+        test_shards=args.test_shards,
+        preload_modules=args.preload_modules,
+        agent_models=parse_agent_models(args.agent_model),
+        escalate_after=args.escalate_after,
+        escalation_model=args.escalation_model,
+        keep_alive=args.keep_alive,
+        api_base=args.api_base,
+        warm_up=not args.no_warm_up,
+        trace_format=None if args.trace_format == "none" else args.trace_format,
+    )
+    topic = get_script_content(args.path_to_script)
+    if args.stream:
+        stream_run(crew, topic, resume=args.resume)
+    elif args.use_async:
+        asyncio.run(crew.arun(topic=topic, resume=args.resume))
+    else:
+        crew.run(topic=topic, resume=args.resume)
+
+def cli(argv=None):
+    """Command line entry point dispatching `loogy batch` and `loogy stub-server`"""
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] == "batch":
+        from loogy import batch
+
+        return batch.main(argv[1:])
+    if argv and argv[0] == "stub-server":
+        from loogy import stub_server
+
+        return stub_server.main(argv[1:])
+    main(get_parser(argv))
 
 if __name__ == "__main__":
-    args = get_parser()
-    main(args)
+    cli()
@@ -0,0 +1,249 @@
+"""Memo of failure signatures and the fixes that resolved them.
+
+Many tasks fail the same way (e.g. numpy shape mismatches), so every run
+records, for each failing test it fixes, a normalized signature of the
+failure and the diff that made it go away. Before the developer gets the
+test results of a failing iteration, the memo is queried with the current
+signatures and the known fixes are added to the prompt as hints.
+
+A signature is the exception type, the message with numbers, quoted strings
+and addresses replaced by placeholders, and the failing line of
+``codebase.py``, or the failing test when no frame of ``codebase.py`` is in
+the traceback. Lookups fall back to the type and message alone so a fix
+found on one script can help with another, except when there is no failing
+line or the error is too generic (assertions, undefined names) for its
+message to tell which fix applies. The memo is one JSON file shared
+by all runs, bounded to ``max_entries`` entries with least recently used
+eviction.
+"""
+import difflib
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+DEFAULT_MEMO_PATH = os.environ.get(
+    "LOOGY_MEMO_PATH",
+    os.path.join(os.path.expanduser("~"), ".cache", "loogy", "failures.json"),
+)
+DEFAULT_MAX_ENTRIES = 1000
+# Limits of the hints added to one prompt
+MAX_HINTS = 2
+MAX_FIX_LINES = 30
+MAX_TEMPLATE_CHARS = 200
+# Errors whose type and message alone do not identify the failure
+GENERIC_ERROR_TYPES = ("AssertionError", "NameError")
+
+CODEBASE_FRAME_RE = re.compile(r'^\s*File "[^"]*codebase\.py", line \d+, in (.+)$')
+ADDRESS_RE = re.compile(r"0x[0-9a-fA-F]+")
+QUOTED_RE = re.compile(r"'[^']*'|\"[^\"]*\"")
+NUMBER_RE = re.compile(r"(?<![A-Za-z_])-?\d+(\.\d+)?")
+
+
+@dataclass(frozen=True)
+class Signature:
+    error_type: str
+    template: str
+    frame: str
+    # Id of the failing test, which identifies failures without a frame
+    test: str = ""
+
+    @property
+    def key(self) -> str:
+        return _digest(self.error_type, self.template, self.frame or self.test)
+
+    @property
+    def loose_key(self) -> Optional[str]:
+        """Key matching the failure in other code, None if it is too generic"""
+        if not self.frame or self.error_type in GENERIC_ERROR_TYPES:
+            return None
+        return _digest(self.error_type, self.template)
+
+    def __str__(self) -> str:
+        return f"{self.error_type}: {self.template}"
+
+
+def _digest(*parts) -> str:
+    return hashlib.sha256(json.dumps(parts).encode("utf-8")).hexdigest()
+
+
+def message_template(message: str) -> str:
+    """The message of an exception with its variable parts replaced"""
+    first_line = (message or "").strip().splitlines()[:1]
+    template = ADDRESS_RE.sub("0x?", first_line[0] if first_line else "")
+    template = QUOTED_RE.sub("'?'", template)
+    template = NUMBER_RE.sub("N", template)
+    return " ".join(template.split())[:MAX_TEMPLATE_CHARS]
+
+
+def failing_frame(traceback: str) -> str:
+    """Source line of the innermost codebase.py frame of a traceback"""
+    frame = ""
+    lines = (traceback or "").splitlines()
+    for index, line in enumerate(lines):
+        if CODEBASE_FRAME_RE.match(line) and index + 1 < len(lines):
+            frame = " ".join(lines[index + 1].split())
+    return frame
+
+
+def signatures(failures) -> List[Signature]:
+    """Signatures of failing tests (TestCaseResults), without duplicates"""
+    found = []
+    for test in failures:
+        signature = Signature(
+            test.error_type or "Error",
+            message_template(test.message),
+            failing_frame(test.traceback),
+            test.name,
+        )
+        if all(signature.key != other.key for other in found):
+            found.append(signature)
+    return found
+
+
+def fix_diff(before: str, after: str) -> str:
+    """Unified diff of a fix, cut to MAX_FIX_LINES lines"""
+    diff = list(
+        difflib.unified_diff(
+            before.splitlines(),
+            after.splitlines(),
+            "before.py",
+            "after.py",
+            n=1,
+            lineterm="",
+        )
+    )
+    if len(diff) > MAX_FIX_LINES:
+        omitted = len(diff) - MAX_FIX_LINES
+        diff = diff[:MAX_FIX_LINES] + [f"[{omitted} more diff lines omitted]"]
+    return "\n".join(diff)
+
+
+class FailureMemo:
+    """Bounded index of failure signatures to the fixes that resolved them"""
+
+    def __init__(
+        self, path: str = DEFAULT_MEMO_PATH, max_entries: int = DEFAULT_MAX_ENTRIES
+    ):
+        self.path = Path(path)
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = None
+        self._lock = threading.Lock()
+
+    def _read(self) -> dict:
+        try:
+            with open(self.path, "r") as f:
+                return json.load(f)["entries"]
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Ignoring unreadable failure memo {self.path}: {e}")
+            return {}
+
+    def entries(self) -> dict:
+        with self._lock:
+            if self._entries is None:
+                self._entries = self._read()
+            return self._entries
+
+    def lookup(self, found: List[Signature]) -> List[dict]:
+        """Known fixes of the signatures, exact matches first"""
+        entries = self.entries()
+        by_loose_key = {}
+        for entry in entries.values():
+            # Recomputed so entries saved under older rules follow the current ones
+            loose_key = Signature(
+                entry["error_type"], entry["template"], entry["frame"]
+            ).loose_key
+            if loose_key is not None:
+                by_loose_key.setdefault(loose_key, entry)
+        hints = []
+        for signature in found:
+            entry = entries.get(signature.key)
+            if entry is None and signature.loose_key is not None:
+                entry = by_loose_key.get(signature.loose_key)
+            if entry is None:
+                self.misses += 1
+                continue
+            self.hits += 1
+            entry["used"] = time.time()
+            if entry not in hints:
+                hints.append(entry)
+        return hints[:MAX_HINTS]
+
+    def record(self, signature: Signature, before: str, after: str) -> None:
+        """Remember that changing ``before`` into ``after`` fixed ``signature``"""
+        fix = fix_diff(before, after)
+        if not fix:
+            return
+        entries = self.entries()
+        with self._lock:
+            entries[signature.key] = {
+                "error_type": signature.error_type,
+                "template": signature.template,
+                "frame": signature.frame,
+                "test": signature.test,
+                "fix": fix,
+                "used": time.time(),
+            }
+        logger.info(f"Memoized the fix of {signature}")
+
+    def save(self) -> None:
+        """Merge with the entries saved by other runs, evict and write"""
+        if self._entries is None:
+            return
+        with self._lock:
+            merged = self._read()
+            for key, entry in self._entries.items():
+                if key not in merged or merged[key]["used"] <= entry["used"]:
+                    merged[key] = entry
+            if len(merged) > self.max_entries:
+                oldest = sorted(merged, key=lambda key: merged[key]["used"])
+                for key in oldest[: len(merged) - self.max_entries]:
+                    del merged[key]
+            self._entries = merged
+            try:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                fd, tmp_path = tempfile.mkstemp(dir=self.path.parent, suffix=".tmp")
+                with os.fdopen(fd, "w") as f:
+                    json.dump({"entries": merged}, f)
+                os.replace(tmp_path, self.path)
+            except OSError as e:
+                logger.warning(f"Could not write failure memo {self.path}: {e}")
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self.entries()),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+def format_hints(hints: List[dict]) -> str:
+    """Render known fixes as a section appended to the test results"""
+    if not hints:
+        return ""
+    lines = ["### Fixes that resolved similar failures before"]
+    for hint in hints:
+        lines.append("")
+        lines.append(f"{hint['error_type']}: {hint['template']}")
+        if hint["frame"]:
+            lines.append(f"failing line: {hint['frame']}")
+        lines.append("```diff")
+        lines.append(hint["fix"])
+        lines.append("```")
+    return "\n".join(lines) + "\n"
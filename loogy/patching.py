@@ -0,0 +1,138 @@
+"""Apply the developer's edits to the previous ``codebase.py``.
+
+In the ``edit`` refinement mode the developer answers with targeted edit
+blocks::
+
+    <<<<<<< SEARCH
+    lines copied from codebase.py
+    =======
+    replacement lines
+    >>>>>>> REPLACE
+
+or with a unified diff. ``apply_patch`` validates and applies them; a
+``PatchError`` tells the caller to fall back to regenerating the whole file.
+"""
+import re
+
+EDIT_BLOCK_RE = re.compile(
+    r"^<{5,9} ?SEARCH[^\n]*\n(.*?)^={5,9}[ \t]*\n(.*?)^>{5,9} ?REPLACE[^\n]*$",
+    re.DOTALL | re.MULTILINE,
+)
+HUNK_RE = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
+
+
+class PatchError(ValueError):
+    """Raised when the developer's edits cannot be applied"""
+
+
+def parse_edit_blocks(text: str) -> list:
+    """Return the (search, replace) pairs of the edit blocks in ``text``"""
+    return [(search, replace) for search, replace in EDIT_BLOCK_RE.findall(text or "")]
+
+
+def find_lines(lines: list, target: list) -> list:
+    """Start indexes of ``target`` in ``lines``, ignoring trailing whitespace"""
+    target = [line.rstrip() for line in target]
+    stripped = [line.rstrip() for line in lines]
+    size = len(target)
+    return [
+        index
+        for index in range(len(lines) - size + 1)
+        if stripped[index : index + size] == target
+    ]
+
+
+def apply_edit_blocks(code: str, blocks: list) -> str:
+    for number, (search, replace) in enumerate(blocks, 1):
+        if not search.strip():
+            raise PatchError(f"Edit block {number} has an empty SEARCH section")
+        count = code.count(search)
+        if count == 1:
+            code = code.replace(search, replace, 1)
+            continue
+        if count > 1:
+            raise PatchError(f"SEARCH section of edit block {number} is ambiguous")
+
+        # Models often get trailing whitespace or the final newline wrong
+        lines = code.splitlines(keepends=True)
+        search_lines = search.splitlines()
+        matches = find_lines(lines, search_lines)
+        if len(matches) != 1:
+            raise PatchError(
+                f"SEARCH section of edit block {number} matches {len(matches)} "
+                "places in codebase.py"
+            )
+        start = matches[0]
+        replacement = replace
+        if replacement and not replacement.endswith("\n"):
+            replacement += "\n"
+        code = "".join(lines[:start]) + replacement + "".join(
+            lines[start + len(search_lines) :]
+        )
+    return code
+
+
+def parse_hunks(diff: str) -> list:
+    """Return (old_start, old_lines, new_lines) for each hunk of a unified diff"""
+    hunks = []
+    current = None
+    for line in diff.splitlines():
+        match = HUNK_RE.match(line)
+        if match:
+            current = (int(match.group(1)), [], [])
+            hunks.append(current)
+        elif current is None or line.startswith(("---", "+++")):
+            continue
+        elif line.startswith("-"):
+            current[1].append(line[1:])
+        elif line.startswith("+"):
+            current[2].append(line[1:])
+        elif line.startswith(" ") or not line:
+            current[1].append(line[1:])
+            current[2].append(line[1:])
+        elif line.startswith("\\"):
+            continue  # "\ No newline at end of file"
+        else:
+            current = None
+    return hunks
+
+
+def apply_unified_diff(code: str, diff: str) -> str:
+    hunks = parse_hunks(diff)
+    if not hunks:
+        raise PatchError("No hunks in the diff")
+    lines = code.splitlines()
+    offset = 0
+    for number, (old_start, old_lines, new_lines) in enumerate(hunks, 1):
+        if not old_lines:
+            # "-N,0" is a pure insertion after line N
+            start = min(max(old_start + offset, 0), len(lines))
+            lines[start:start] = new_lines
+            offset += len(new_lines)
+            continue
+        matches = find_lines(lines, old_lines)
+        if not matches:
+            raise PatchError(f"Hunk {number} does not match codebase.py")
+        # Line numbers from models are approximate, take the closest match
+        expected = old_start - 1 + offset
+        start = min(matches, key=lambda index: abs(index - expected))
+        lines[start : start + len(old_lines)] = new_lines
+        offset += len(new_lines) - len(old_lines)
+    return "\n".join(lines) + "\n"
+
+
+def apply_patch(code: str, response: str) -> str:
+    """Apply the edit blocks or unified diff in ``response`` to ``code``"""
+    blocks = parse_edit_blocks(response)
+    if blocks:
+        patched = apply_edit_blocks(code, blocks)
+    elif re.search(r"^@@ -\d", response or "", re.MULTILINE):
+        patched = apply_unified_diff(code, response)
+    else:
+        raise PatchError("No edit blocks or diff in the response")
+
+    try:
+        compile(patched, "codebase.py", "exec")
+    except SyntaxError as e:
+        raise PatchError(f"Patched code does not compile: {e}") from e
+    return patched
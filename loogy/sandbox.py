@@ -0,0 +1,719 @@
+"""Deterministic local execution of generated unit tests.
+
+The generated ``codebase.py`` and ``unit_tests.py`` are copied into a fresh
+temporary directory and run by ``harness.py`` in an isolated Python
+subprocess with wall-clock, CPU and memory limits. With a ``WorkerPool`` the
+run is forked from a warm worker that already imported the heavy modules.
+Reruns of a suite start with the tests that failed before and can split the
+rest over several harness processes (see ``run_unit_tests``).
+"""
+import atexit
+import itertools
+import json
+import os
+import re
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import List, Optional
+import logging
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+HARNESS_PATH = Path(__file__).parent / "harness.py"
+
+DEFAULT_TIMEOUT = 120
+DEFAULT_CPU_SECONDS = 120
+DEFAULT_MEMORY_MB = 4096
+
+# Output of the subprocess kept in the results, the rest is dropped
+MAX_OUTPUT_CHARS = 4000
+
+# How often a cancellable test run checks whether it was cancelled
+CANCEL_POLL_SECONDS = 0.05
+
+# Warm workers kept alive at once, one per set of preloaded modules
+MAX_WORKER_POOLS = 4
+
+# Tests only run in parallel shards if they took this long the previous time;
+# below that starting the extra processes costs more than it saves
+SHARD_MIN_SECONDS = 1.0
+
+CODE_BLOCK_RE = re.compile(r"```(?:python|py)?[ \t]*\n(.*?)```", re.DOTALL)
+IMPORT_RE = re.compile(
+    r"^[ \t]*(?:from[ \t]+([\w.]+)[ \t]+import|import[ \t]+([\w., \t]+))",
+    re.MULTILINE,
+)
+SUMMARY_DURATION_RE = re.compile(r"^(passed: .*), duration: [\d.]+s$", re.MULTILINE)
+TIMED_TABLE_HEADER = "| test | outcome | duration |"
+
+
+def extract_code(text: str) -> str:
+    """Strip markdown fences from an agent response and return the code"""
+    blocks = CODE_BLOCK_RE.findall(text or "")
+    if not blocks:
+        return (text or "").strip() + "\n"
+    # The longest block is the implementation, the others are usually examples
+    return max(blocks, key=len).strip() + "\n"
+
+
+def imported_modules(code: str) -> List[str]:
+    """Top-level modules imported by ``code``, in order of appearance"""
+    modules = []
+    for from_module, names in IMPORT_RE.findall(code or ""):
+        for name in [from_module] if from_module else names.split(","):
+            module = name.split()[0].split(".")[0] if name.strip() else ""
+            if module and module not in modules:
+                modules.append(module)
+    return modules
+
+
+@dataclass
+class TestCaseResult:
+    name: str
+    outcome: str  # passed, failed, error or skipped
+    duration: float = 0.0
+    error_type: Optional[str] = None
+    message: Optional[str] = None
+    traceback: Optional[str] = None
+    # What codebase.py did during a failing test, see harness.RuntimeRecorder
+    runtime: Optional[dict] = None
+
+
+def runtime_lines(runtime: dict) -> List[str]:
+    """Render the runtime records of a failing test as compact text lines"""
+    lines = []
+    if runtime.get("calls"):
+        lines.append("calls into codebase.py (most recent last):")
+        for call in runtime["calls"]:
+            args = ", ".join(f"{name}={value}" for name, value in call["args"].items())
+            if "raised" in call:
+                outcome = f"raised {call['raised']}"
+            else:
+                outcome = f"-> {call.get('returned', '?')}"
+            lines.append(f"  {call['function']}({args}) {outcome}")
+    if runtime.get("lines"):
+        lines.append("last lines executed:")
+        for line in runtime["lines"]:
+            lines.append(f"  {line['line']:>4} {line['function']}: {line['source']}")
+    exception = runtime.get("exception")
+    if exception:
+        lines.append(
+            f"{exception['error_type']} raised in {exception['function']} "
+            f"at line {exception['line']}, locals:"
+        )
+        for name, value in exception["locals"].items():
+            lines.append(f"  {name} = {value}")
+    if runtime.get("truncated"):
+        lines.append("(tracing stopped early, the code ran too many lines)")
+    return lines
+
+
+@dataclass
+class TestRunResult:
+    tests: List[TestCaseResult] = field(default_factory=list)
+    exit_code: Optional[int] = None
+    duration: float = 0.0
+    timed_out: bool = False
+    cancelled: bool = False
+    # Only the previously failing tests ran, and at least one still fails
+    partial: bool = False
+    collection_error: Optional[TestCaseResult] = None
+    stdout: str = ""
+    stderr: str = ""
+
+    def count(self, outcome: str) -> int:
+        return sum(1 for test in self.tests if test.outcome == outcome)
+
+    @property
+    def passed(self) -> int:
+        return self.count("passed")
+
+    @property
+    def failed(self) -> int:
+        return self.count("failed")
+
+    @property
+    def errors(self) -> int:
+        return self.count("error") + (1 if self.collection_error else 0)
+
+    @property
+    def skipped(self) -> int:
+        return self.count("skipped")
+
+    @property
+    def ok(self) -> bool:
+        """True only if at least one test ran and nothing failed"""
+        return (
+            self.exit_code == 0
+            and not self.timed_out
+            and not self.cancelled
+            and self.collection_error is None
+            and self.passed > 0
+            and self.failed == 0
+            and self.errors == 0
+        )
+
+    @property
+    def error_classes(self) -> List[str]:
+        """Sorted exception class names of the failing tests"""
+        return sorted({test.error_type for test in self.failures() if test.error_type})
+
+    def failures(self) -> List[TestCaseResult]:
+        failing = [test for test in self.tests if test.outcome in ("failed", "error")]
+        if self.collection_error:
+            failing.insert(0, self.collection_error)
+        return failing
+
+    def to_markdown(self, timings: bool = True) -> str:
+        """Render the results; the first line keeps the 'result: ...' format.
+
+        With timings=False the output is deterministic, which keeps prompts
+        built from it stable for the LLM response cache.
+        """
+        summary = (
+            f"passed: {self.passed}, failed: {self.failed}, "
+            f"errors: {self.errors}, skipped: {self.skipped}, "
+            f"exit code: {self.exit_code}"
+        )
+        if timings:
+            summary += f", duration: {self.duration:.2f}s"
+        lines = [f"result: {'Passed' if self.ok else 'Failed'}", "", summary]
+        if self.timed_out:
+            lines.append("")
+            lines.append("Test run timed out and was killed.")
+        if self.cancelled:
+            lines.append("")
+            lines.append("Test run was cancelled.")
+        if self.partial:
+            lines.append("")
+            lines.append(
+                "Only the tests that failed before were run, the rest of the "
+                "suite runs once they pass."
+            )
+
+        if self.tests:
+            lines.append("")
+            if timings:
+                lines.append("| test | outcome | duration |")
+                lines.append("| --- | --- | --- |")
+                for test in self.tests:
+                    lines.append(
+                        f"| {test.name} | {test.outcome} | {test.duration:.3f}s |"
+                    )
+            else:
+                lines.append("| test | outcome |")
+                lines.append("| --- | --- |")
+                for test in self.tests:
+                    lines.append(f"| {test.name} | {test.outcome} |")
+
+        for test in self.failures():
+            lines.append("")
+            lines.append(f"### {test.name}: {test.error_type}")
+            lines.append("```")
+            lines.append((test.traceback or test.message or "").rstrip())
+            lines.append("```")
+            runtime = runtime_lines(test.runtime) if test.runtime else []
+            if runtime:
+                lines.append("runtime:")
+                lines.append("```")
+                lines.extend(runtime)
+                lines.append("```")
+
+        for title, output in (("stdout", self.stdout), ("stderr", self.stderr)):
+            if output.strip():
+                lines.append("")
+                lines.append(f"### {title}")
+                lines.append("```")
+                lines.append(output.rstrip())
+                lines.append("```")
+
+        return "\n".join(lines) + "\n"
+
+
+def strip_timings(markdown: str) -> str:
+    """Test results rendered by to_markdown() as if with timings=False"""
+    lines = []
+    in_table = False
+    for line in SUMMARY_DURATION_RE.sub(r"\1", markdown).split("\n"):
+        if line == TIMED_TABLE_HEADER:
+            in_table = True
+        elif not line.startswith("|"):
+            in_table = False
+        if in_table:
+            # Drop the last column
+            line = line.rsplit(" |", 2)[0] + " |"
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def _kill(process: subprocess.Popen):
+    try:
+        if hasattr(os, "killpg"):
+            os.killpg(process.pid, signal.SIGKILL)
+        else:
+            process.kill()
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+def _truncate(text: str) -> str:
+    if len(text) <= MAX_OUTPUT_CHARS:
+        return text
+    return "...\n" + text[-MAX_OUTPUT_CHARS:]
+
+
+def _sandbox_env(home: str) -> dict:
+    return {
+        "PATH": os.environ.get("PATH", ""),
+        "HOME": home,
+        "TMPDIR": home,
+        "PYTHONHASHSEED": "0",
+        "PYTHONDONTWRITEBYTECODE": "1",
+        "MPLBACKEND": "Agg",
+    }
+
+
+class WorkerRun:
+    """A test run forked by a WorkerPool, waited on like a subprocess"""
+
+    def __init__(self):
+        self.pid = None
+        self.returncode = None
+        self.started = threading.Event()
+        self.done = threading.Event()
+
+    def wait(self, timeout: Optional[float] = None) -> Optional[int]:
+        if not self.done.wait(timeout):
+            raise subprocess.TimeoutExpired("test run", timeout)
+        return self.returncode
+
+    def kill(self) -> None:
+        self.started.wait()
+        if self.pid:
+            try:
+                # The run is the leader of its own session
+                os.killpg(self.pid, signal.SIGKILL)
+            except (ProcessLookupError, PermissionError):
+                pass
+
+
+class WorkerPool:
+    """Warm worker that imports ``modules`` once and forks every test run.
+
+    Scripts importing numpy, pandas or sklearn otherwise pay seconds of import
+    time in each run before a single assertion. The worker is ``harness.py
+    --serve`` under ``python -I``, and each forked run gets the same clean
+    environment and limits as a fresh subprocess.
+    """
+
+    def __init__(self, modules, python: str = sys.executable):
+        self.modules = tuple(modules)
+        self.python = python
+        self.loaded = []
+        self.process = None
+        self.home = None
+        self._runs = {}
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+
+    @property
+    def alive(self) -> bool:
+        return self.process is not None and self.process.poll() is None
+
+    def start(self) -> "WorkerPool":
+        started = time.perf_counter()
+        self.home = tempfile.mkdtemp(prefix="loogy-worker-")
+        self.process = subprocess.Popen(
+            [self.python, "-I", str(HARNESS_PATH), "--serve", *self.modules],
+            cwd=self.home,
+            env=_sandbox_env(self.home),
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+            start_new_session=True,
+        )
+        try:
+            ready = json.loads(self.process.stdout.readline() or "{}")
+        except ValueError:
+            ready = {}
+        if not ready.get("ready"):
+            self.close()
+            raise RuntimeError("Test worker failed to start")
+        self.loaded = ready["modules"]
+        threading.Thread(
+            target=self._read_messages, name="loogy-worker", daemon=True
+        ).start()
+        logger.info(
+            f"Test worker ready in {time.perf_counter() - started:.2f}s, "
+            f"preloaded: {', '.join(self.loaded) or 'nothing'}"
+        )
+        return self
+
+    def _read_messages(self) -> None:
+        for line in self.process.stdout:
+            message = json.loads(line)
+            with self._lock:
+                run = self._runs.get(message["id"])
+                if run is not None and "exit_code" in message:
+                    del self._runs[message["id"]]
+            if run is None:
+                continue
+            if "pid" in message:
+                run.pid = message["pid"]
+            else:
+                run.returncode = message["exit_code"]
+                run.done.set()
+            run.started.set()
+
+        # The worker exited, runs in flight will never be reported
+        with self._lock:
+            runs, self._runs = list(self._runs.values()), {}
+        for run in runs:
+            run.started.set()
+            run.done.set()
+
+    def submit(
+        self,
+        workdir: str,
+        report_path: str,
+        cpu_seconds: int,
+        memory_mb: int,
+        instrument: bool = False,
+        plan: Optional[dict] = None,
+    ) -> WorkerRun:
+        """Fork a run of the harness on ``workdir``"""
+        run = WorkerRun()
+        request = {
+            "workdir": workdir,
+            "report": report_path,
+            "stdout": os.path.join(workdir, "stdout.log"),
+            "stderr": os.path.join(workdir, "stderr.log"),
+            "env": _sandbox_env(workdir),
+            "cpu_seconds": cpu_seconds if resource is not None else None,
+            "memory_mb": memory_mb if resource is not None else None,
+            "instrument": instrument,
+            "plan": plan,
+        }
+        with self._lock:
+            request["id"] = next(self._ids)
+            self._runs[request["id"]] = run
+            try:
+                self.process.stdin.write(json.dumps(request) + "\n")
+                self.process.stdin.flush()
+            except OSError:
+                del self._runs[request["id"]]
+                raise
+        return run
+
+    def close(self) -> None:
+        if self.process is not None:
+            try:
+                self.process.stdin.close()
+                self.process.wait(timeout=5)
+            except (OSError, subprocess.TimeoutExpired):
+                _kill(self.process)
+                self.process.wait()
+        if self.home:
+            shutil.rmtree(self.home, ignore_errors=True)
+
+
+_worker_pools = OrderedDict()
+_worker_pools_lock = threading.Lock()
+
+
+def get_worker_pool(modules, python: str = sys.executable) -> Optional[WorkerPool]:
+    """Shared warm worker preloading ``modules``, started on first use.
+
+    Returns None where fork is not available or the worker cannot start, in
+    which case tests run in a fresh subprocess.
+    """
+    if not hasattr(os, "fork"):
+        return None
+    key = (python, tuple(sorted(set(modules))))
+    with _worker_pools_lock:
+        pool = _worker_pools.pop(key, None)
+        if pool is None or not pool.alive:
+            try:
+                pool = WorkerPool(key[1], python).start()
+            except (OSError, RuntimeError) as e:
+                logger.warning(f"Could not start a test worker: {e}")
+                return None
+        _worker_pools[key] = pool
+        while len(_worker_pools) > MAX_WORKER_POOLS:
+            _, oldest = _worker_pools.popitem(last=False)
+            oldest.close()
+    return pool
+
+
+@atexit.register
+def close_worker_pools() -> None:
+    with _worker_pools_lock:
+        while _worker_pools:
+            _, pool = _worker_pools.popitem()
+            pool.close()
+
+
+def parse_report(report: dict) -> TestRunResult:
+    result = TestRunResult(
+        tests=[TestCaseResult(**test) for test in report.get("tests", [])]
+    )
+    if report.get("collection_error"):
+        result.collection_error = TestCaseResult(
+            name="unit_tests", outcome="error", **report["collection_error"]
+        )
+    return result
+
+
+def merge_results(results: List[TestRunResult]) -> TestRunResult:
+    """Combine the results of runs on parts of a test suite"""
+    merged = TestRunResult(exit_code=0)
+    for result in results:
+        merged.tests.extend(result.tests)
+        if not merged.exit_code:
+            merged.exit_code = result.exit_code
+        merged.timed_out = merged.timed_out or result.timed_out
+        merged.cancelled = merged.cancelled or result.cancelled
+        merged.collection_error = merged.collection_error or result.collection_error
+        merged.stdout = "\n".join(filter(None, (merged.stdout, result.stdout)))
+        merged.stderr = "\n".join(filter(None, (merged.stderr, result.stderr)))
+    merged.stdout = _truncate(merged.stdout)
+    merged.stderr = _truncate(merged.stderr)
+    return merged
+
+
+def plan_shards(names: List[str], durations: dict, shards: int) -> List[dict]:
+    """Split tests into plans of about equal previous duration.
+
+    The first plan runs every test not given to the others, so tests that
+    are not in ``durations`` still run.
+    """
+    loads = [[0.0, []] for _ in range(max(1, min(shards, len(names))))]
+    # Longest first, each to the least loaded shard
+    for name in sorted(names, key=lambda name: -durations.get(name, 0.0)):
+        load = min(loads, key=lambda load: load[0])
+        load[0] += durations.get(name, 0.0)
+        load[1].append(name)
+    others = [names for _, names in loads[1:]]
+    plans = [{"exclude": [name for names in others for name in names]}]
+    return plans + [{"select": names} for names in others]
+
+
+class _HarnessRun:
+    """One harness process on a copy of the code and tests"""
+
+    def __init__(self, workdir: str, code: str, tests: str, plan: Optional[dict]):
+        os.makedirs(workdir, exist_ok=True)
+        Path(workdir, "codebase.py").write_text(code)
+        Path(workdir, "unit_tests.py").write_text(tests)
+        self.workdir = workdir
+        self.plan = plan
+        self.report_path = os.path.join(workdir, "report.json")
+        self.stdout_path = os.path.join(workdir, "stdout.log")
+        self.stderr_path = os.path.join(workdir, "stderr.log")
+        self.process = None
+
+    def start(self, python, cpu_seconds, memory_mb, pool, instrument) -> None:
+        if pool is not None and pool.alive:
+            try:
+                self.process = pool.submit(
+                    self.workdir,
+                    self.report_path,
+                    cpu_seconds,
+                    memory_mb,
+                    instrument,
+                    self.plan,
+                )
+                return
+            except OSError as e:
+                logger.warning(f"Test worker unavailable, using a subprocess: {e}")
+        popen_kwargs = {}
+        command = [python, "-I", str(HARNESS_PATH)]
+        if resource is not None:
+            # The harness applies its own rlimits (see harness.limit_resources)
+            popen_kwargs["start_new_session"] = True
+            command += [
+                f"--cpu-seconds={cpu_seconds or 0}",
+                f"--memory-mb={memory_mb or 0}",
+            ]
+        if instrument:
+            command.append("--instrument")
+        if self.plan is not None:
+            plan_path = os.path.join(self.workdir, "plan.json")
+            Path(plan_path).write_text(json.dumps(self.plan))
+            command += ["--plan", plan_path]
+        command += [self.workdir, self.report_path]
+        stdout = open(self.stdout_path, "w")
+        stderr = open(self.stderr_path, "w")
+        with stdout, stderr:
+            self.process = subprocess.Popen(
+                command,
+                cwd=self.workdir,
+                env=_sandbox_env(self.workdir),
+                stdin=subprocess.DEVNULL,
+                stdout=stdout,
+                stderr=stderr,
+                **popen_kwargs,
+            )
+
+    def kill(self) -> None:
+        if isinstance(self.process, WorkerRun):
+            self.process.kill()
+        else:
+            _kill(self.process)
+
+    def result(self, timed_out: bool, cancelled: bool) -> TestRunResult:
+        try:
+            with open(self.report_path, "r") as f:
+                result = parse_report(json.load(f))
+        except (OSError, ValueError) as e:
+            logger.warning(f"No test report produced: {e}")
+            result = TestRunResult()
+        result.exit_code = self.process.returncode
+        result.timed_out = timed_out and not cancelled
+        result.cancelled = cancelled
+        prefix = os.path.join(self.workdir, "")
+        outputs = []
+        for path in (self.stdout_path, self.stderr_path):
+            try:
+                outputs.append(Path(path).read_text(errors="replace"))
+            except OSError:
+                outputs.append("")
+        result.stdout = _truncate(outputs[0].replace(prefix, ""))
+        result.stderr = _truncate(outputs[1].replace(prefix, ""))
+        return result
+
+
+def _run_harness(
+    workdir: str,
+    code: str,
+    tests: str,
+    plans: List[Optional[dict]],
+    deadline: float,
+    cancel: Optional[threading.Event],
+    python: str,
+    cpu_seconds: int,
+    memory_mb: int,
+    pool: Optional[WorkerPool],
+    instrument: bool,
+) -> TestRunResult:
+    """Run the plans in parallel harness processes and merge their results"""
+    if len(plans) == 1:
+        runs = [_HarnessRun(workdir, code, tests, plans[0])]
+    else:
+        runs = [
+            _HarnessRun(os.path.join(workdir, f"shard-{index}"), code, tests, plan)
+            for index, plan in enumerate(plans)
+        ]
+    for run in runs:
+        run.start(python, cpu_seconds, memory_mb, pool, instrument)
+
+    timed_out = cancelled = False
+    # Without a cancel event a single wait until the deadline is enough
+    poll = None if cancel is None else CANCEL_POLL_SECONDS
+    for run in runs:
+        while not (timed_out or cancelled):
+            remaining = max(0, deadline - time.perf_counter())
+            try:
+                run.process.wait(timeout=min(poll or remaining, remaining))
+                break
+            except subprocess.TimeoutExpired:
+                cancelled = cancel is not None and cancel.is_set()
+                timed_out = time.perf_counter() >= deadline
+        if timed_out or cancelled:
+            for other in runs:
+                if other.process.returncode is None:
+                    other.kill()
+            for other in runs:
+                other.process.wait()
+            break
+    return merge_results([run.result(timed_out, cancelled) for run in runs])
+
+
+def run_unit_tests(
+    code: str,
+    tests: str,
+    timeout: float = DEFAULT_TIMEOUT,
+    cpu_seconds: int = DEFAULT_CPU_SECONDS,
+    memory_mb: int = DEFAULT_MEMORY_MB,
+    python: str = sys.executable,
+    cancel: Optional[threading.Event] = None,
+    pool: Optional[WorkerPool] = None,
+    instrument: bool = False,
+    failing_first: List[str] = (),
+    durations: Optional[dict] = None,
+    shards: int = 1,
+) -> TestRunResult:
+    """Run ``tests`` against ``code`` in an isolated subprocess.
+
+    Setting the ``cancel`` event kills the subprocess, e.g. when another
+    candidate already passed. With a live ``pool`` the run is forked from
+    its warm worker instead of starting a new interpreter. With
+    ``instrument`` failing tests also record what the code did at runtime.
+
+    The tests in ``failing_first`` (the failures of the previous run) run
+    first and stop at the first failure; the rest of the suite only runs
+    once they all pass. When the previous ``durations`` of the tests add up
+    to SHARD_MIN_SECONDS or more, the rest runs in up to ``shards`` parallel
+    processes.
+    """
+    with tempfile.TemporaryDirectory(prefix="loogy-sandbox-") as workdir:
+        logger.info(f"Running unit tests in sandbox: {workdir}")
+        started = time.perf_counter()
+        deadline = started + timeout
+        options = (deadline, cancel, python, cpu_seconds, memory_mb, pool, instrument)
+        durations = durations or {}
+
+        first = None
+        if failing_first:
+            plan = {"select": list(failing_first), "failfast": True}
+            first = _run_harness(
+                os.path.join(workdir, "failing"), code, tests, [plan], *options
+            )
+            if not first.tests and not first.collection_error:
+                # The failing tests are gone, run the whole suite
+                first = None
+            elif not first.ok:
+                first.partial = True
+                logger.info("Previously failing tests still fail, skipping the rest")
+
+        if first is None or first.ok:
+            names = [name for name in durations if name not in set(failing_first)]
+            shards = min(shards, os.cpu_count() or 1)
+            if shards > 1 and sum(durations.values()) >= SHARD_MIN_SECONDS:
+                plans = plan_shards(names, durations, shards)
+                for plan in plans:
+                    plan.setdefault("exclude", [])
+                    plan["exclude"] += list(failing_first)
+            elif failing_first and first is not None:
+                plans = [{"exclude": list(failing_first)}]
+            else:
+                plans = [None]
+            rest = _run_harness(
+                os.path.join(workdir, "suite"), code, tests, plans, *options
+            )
+            result = merge_results([first, rest]) if first is not None else rest
+        else:
+            result = first
+
+        result.duration = time.perf_counter() - started
+        logger.info(
+            f"Sandbox finished: passed={result.passed} failed={result.failed} "
+            f"errors={result.errors} exit_code={result.exit_code} "
+            f"duration={result.duration:.2f}s"
+        )
+        return result
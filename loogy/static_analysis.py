@@ -0,0 +1,291 @@
+"""Fast static checks of the generated code before any test is run.
+
+``analyze`` compiles ``codebase.py`` and walks its AST to find errors that
+would fail every test anyway, without an LLM call or a subprocess:
+
+- syntax errors (and other compile-time errors)
+- undefined names, pyflakes-style, with scopes, builtins and imports
+- imports of modules that are not installed (a warning)
+- compiler warnings such as ``is`` comparisons with literals (a warning)
+"""
+import ast
+import builtins
+import importlib.util
+import sys
+import time
+import warnings
+from dataclasses import dataclass, field
+from typing import List
+
+MODULE_NAMES = {
+    "__name__",
+    "__file__",
+    "__doc__",
+    "__spec__",
+    "__loader__",
+    "__package__",
+    "__builtins__",
+    "__annotations__",
+    "__path__",
+    "__cached__",
+}
+# Builtins that only exist on some platforms
+PLATFORM_NAMES = {"WindowsError"}
+BUILTIN_NAMES = set(dir(builtins)) | MODULE_NAMES | PLATFORM_NAMES
+DYNAMIC_NAMES = {"globals", "exec", "eval", "vars", "locals"}
+
+FUNCTION_NODES = (ast.FunctionDef, ast.AsyncFunctionDef, ast.Lambda)
+COMPREHENSION_NODES = (ast.ListComp, ast.SetComp, ast.DictComp, ast.GeneratorExp)
+SCOPE_NODES = FUNCTION_NODES + COMPREHENSION_NODES + (ast.ClassDef,)
+
+
+@dataclass
+class Diagnostic:
+    line: int
+    column: int
+    code: str
+    message: str
+    severity: str = "error"  # error or warning
+
+    def __str__(self) -> str:
+        return f"line {self.line}, col {self.column}: {self.message} [{self.code}]"
+
+
+@dataclass
+class StaticReport:
+    diagnostics: List[Diagnostic] = field(default_factory=list)
+    duration: float = 0.0
+
+    @property
+    def errors(self) -> List[Diagnostic]:
+        return [d for d in self.diagnostics if d.severity == "error"]
+
+    @property
+    def warnings(self) -> List[Diagnostic]:
+        return [d for d in self.diagnostics if d.severity == "warning"]
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors
+
+    def to_markdown(self) -> str:
+        """Render the diagnostics in the format of the test results"""
+        lines = [
+            f"result: {'Passed' if self.ok else 'Failed'}",
+            "",
+            f"static analysis of codebase.py: {len(self.errors)} errors, "
+            f"{len(self.warnings)} warnings (the unit tests were not run)",
+        ]
+        sections = (("errors", self.errors), ("warnings", self.warnings))
+        for title, diagnostics in sections:
+            if diagnostics:
+                lines.append("")
+                lines.append(f"### {title}")
+                lines.extend(f"- {diagnostic}" for diagnostic in diagnostics)
+        return "\n".join(lines) + "\n"
+
+
+def enclosing_parts(node: ast.AST) -> list:
+    """Parts of a nested scope that are evaluated in the enclosing scope"""
+    parts = list(getattr(node, "decorator_list", []))
+    if isinstance(node, COMPREHENSION_NODES):
+        # The first iterable is evaluated before the comprehension scope exists
+        parts.append(node.generators[0].iter)
+    elif isinstance(node, ast.ClassDef):
+        parts += node.bases + [keyword.value for keyword in node.keywords]
+    elif isinstance(node, FUNCTION_NODES):
+        arguments = node.args
+        parts += arguments.defaults + [d for d in arguments.kw_defaults if d]
+        if not isinstance(node, ast.Lambda):
+            for arg in arguments.posonlyargs + arguments.args + arguments.kwonlyargs:
+                if arg.annotation:
+                    parts.append(arg.annotation)
+            if node.returns:
+                parts.append(node.returns)
+    return parts
+
+
+def scope_body(node: ast.AST) -> list:
+    """Child nodes evaluated in the scope that ``node`` creates"""
+    if isinstance(node, ast.Lambda):
+        return [node.body]
+    if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+        return node.body
+    if isinstance(node, COMPREHENSION_NODES):
+        if isinstance(node, ast.DictComp):
+            body = [node.key, node.value]
+        else:
+            body = [node.elt]
+        for index, generator in enumerate(node.generators):
+            body.append(generator.target)
+            if index:
+                body.append(generator.iter)
+            body.extend(generator.ifs)
+        return body
+    return list(ast.iter_child_nodes(node))
+
+
+def walk_scope(node: ast.AST):
+    """Yield the nodes of ``node`` that are evaluated in its own scope"""
+    stack = list(reversed(scope_body(node)))
+    while stack:
+        child = stack.pop()
+        yield child
+        if isinstance(child, SCOPE_NODES):
+            stack.extend(reversed(enclosing_parts(child)))
+        else:
+            stack.extend(reversed(list(ast.iter_child_nodes(child))))
+
+
+def scope_bindings(node: ast.AST, nodes: list) -> set:
+    """Names bound in the scope of ``node``, given the nodes of that scope"""
+    bound = set()
+    if isinstance(node, FUNCTION_NODES):
+        arguments = node.args
+        for arg in arguments.posonlyargs + arguments.args + arguments.kwonlyargs:
+            bound.add(arg.arg)
+        for arg in (arguments.vararg, arguments.kwarg):
+            if arg is not None:
+                bound.add(arg.arg)
+
+    for child in nodes:
+        if isinstance(child, ast.Name) and isinstance(child.ctx, (ast.Store, ast.Del)):
+            bound.add(child.id)
+        elif isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            bound.add(child.name)
+        elif isinstance(child, (ast.Import, ast.ImportFrom)):
+            for alias in child.names:
+                bound.add(alias.asname or alias.name.split(".")[0])
+        elif isinstance(child, ast.ExceptHandler) and child.name:
+            bound.add(child.name)
+        elif isinstance(child, (ast.MatchAs, ast.MatchStar)) and child.name:
+            bound.add(child.name)
+        elif isinstance(child, ast.MatchMapping) and child.rest:
+            bound.add(child.rest)
+        elif isinstance(child, (ast.Global, ast.Nonlocal)):
+            bound.update(child.names)
+        elif isinstance(child, COMPREHENSION_NODES):
+            # Assignment expressions in a comprehension bind in this scope
+            for target in ast.walk(child):
+                if isinstance(target, ast.NamedExpr):
+                    bound.add(target.target.id)
+    return bound
+
+
+def check_undefined_names(tree: ast.Module) -> List[Diagnostic]:
+    declared_global = set()
+    for node in ast.walk(tree):
+        # Anything can come from a star import or be created dynamically
+        if isinstance(node, ast.ImportFrom) and any(a.name == "*" for a in node.names):
+            return []
+        if isinstance(node, ast.Name) and node.id in DYNAMIC_NAMES:
+            return []
+        if isinstance(node, ast.Global):
+            declared_global.update(node.names)
+
+    diagnostics = []
+    reported = set()
+
+    def visit(node, visible):
+        nodes = list(walk_scope(node))
+        names = visible | scope_bindings(node, nodes)
+        for child in nodes:
+            if (
+                isinstance(child, ast.Name)
+                and isinstance(child.ctx, ast.Load)
+                and child.id not in names
+                and child.id not in reported
+            ):
+                reported.add(child.id)
+                diagnostics.append(
+                    Diagnostic(
+                        child.lineno,
+                        child.col_offset + 1,
+                        "undefined-name",
+                        f"undefined name '{child.id}'",
+                    )
+                )
+        # Names bound in a class body are not visible in its methods, but
+        # functions defined in a class get the implicit __class__ cell
+        inherited = visible if isinstance(node, ast.ClassDef) else names
+        for child in nodes:
+            if isinstance(child, SCOPE_NODES):
+                if isinstance(node, ast.ClassDef) and not isinstance(
+                    child, ast.ClassDef
+                ):
+                    visit(child, inherited | {"__class__"})
+                else:
+                    visit(child, inherited)
+
+    visit(tree, BUILTIN_NAMES | declared_global)
+    return diagnostics
+
+
+def check_imports(tree: ast.Module) -> List[Diagnostic]:
+    diagnostics = []
+    seen = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            modules = [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.level == 0 and node.module:
+            modules = [node.module]
+        else:
+            continue
+        for module in modules:
+            top_level = module.split(".")[0]
+            if top_level in seen or top_level in sys.builtin_module_names:
+                continue
+            seen.add(top_level)
+            try:
+                found = importlib.util.find_spec(top_level) is not None
+            except (ImportError, ValueError):
+                found = False
+            if not found:
+                diagnostics.append(
+                    Diagnostic(
+                        node.lineno,
+                        node.col_offset + 1,
+                        "missing-module",
+                        f"module '{top_level}' is not installed",
+                        severity="warning",
+                    )
+                )
+    return diagnostics
+
+
+def compile_code(code: str) -> tuple:
+    """Compile the code, returning the AST or a syntax error diagnostic"""
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter("always")
+        try:
+            tree = ast.parse(code, "codebase.py")
+            compile(tree, "codebase.py", "exec")
+        except SyntaxError as e:
+            message = f"{type(e).__name__}: {e.msg}"
+            if e.text:
+                message += f": {e.text.strip()}"
+            error = Diagnostic(e.lineno or 1, e.offset or 1, "syntax-error", message)
+            return None, [error]
+    diagnostics = [
+        Diagnostic(
+            getattr(warning.message, "lineno", None) or warning.lineno or 1,
+            1,
+            "compiler-warning",
+            str(warning.message),
+            severity="warning",
+        )
+        for warning in caught
+    ]
+    return tree, diagnostics
+
+
+def analyze(code: str, check_modules: bool = True) -> StaticReport:
+    """Run the static checks on ``code``"""
+    started = time.perf_counter()
+    tree, diagnostics = compile_code(code)
+    if tree is not None:
+        diagnostics += check_undefined_names(tree)
+        if check_modules:
+            diagnostics += check_imports(tree)
+    diagnostics.sort(key=lambda d: (d.line, d.column))
+    return StaticReport(diagnostics, time.perf_counter() - started)
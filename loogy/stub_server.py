@@ -0,0 +1,487 @@
+"""Local model server speaking the Ollama and OpenAI chat APIs, for load tests.
+
+``StubServer`` answers ``/api/generate`` and ``/api/chat`` (Ollama) and
+``/v1/chat/completions`` (OpenAI) from a responder, the same
+``(agent_name, prompt) -> str`` callable the Stub provider uses (see
+``loogy.stub``). Unlike the Stub provider, a run against the server goes
+through litellm and HTTP like a run against a real model, so loogy's own
+overhead, caching and concurrency limits can be measured offline::
+
+    loogy stub-server --port 11434 --latency 0.5 --tokens-per-second 40
+    loogy --api-base http://127.0.0.1:11434 --path-to-script buggy/buggy.py
+
+Every response waits ``latency`` seconds before its first token and then
+produces ``tokens_per_second`` tokens. At most ``max_concurrency`` requests
+are answered at a time; the others wait for a slot like they would on a
+model server with that many parallel slots. Responses can be scripted with a
+JSONL file (see ``ScriptedResponder``) and every answer can be recorded to a
+JSONL file that replays as a script. ``GET /stats`` returns the request
+and connection counts, the peak concurrency and the time requests waited for
+a slot.
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import argparse
+import hashlib
+import json
+import re
+import threading
+import time
+import uuid
+from collections import Counter
+from pathlib import Path
+import logging
+
+import yaml
+
+from loogy.compaction import estimate_tokens
+from loogy.stub import FINAL_ANSWER, TOKEN_RE, default_responder
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 11434
+AGENTS_CONFIG = Path(__file__).parent / "config" / "agents.yaml"
+ROLE_RE = re.compile(r"You are ([^\n.]+)")
+
+
+def role_agents(path: Path = AGENTS_CONFIG) -> dict:
+    """Agent names by the role their system prompt introduces them with"""
+    with open(path, "r") as f:
+        config = yaml.safe_load(f)
+    return {agent["role"].strip(): name for name, agent in config.items()}
+
+
+def prompt_digest(prompt: str) -> str:
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+
+
+class ScriptedResponder:
+    """Answers from a JSONL script, falling back to ``fallback``.
+
+    Each line holds a ``response`` and optionally the ``agent`` it is for, a
+    string the prompt ``contains`` or the ``prompt_digest`` of an exact
+    prompt. The first matching line answers; lines with ``"once": true`` are
+    used up by their first match.
+    """
+
+    def __init__(self, path: str, fallback=None):
+        self.fallback = fallback or default_responder
+        self.entries = []
+        with open(path, "r") as f:
+            for line in f:
+                if line.strip():
+                    self.entries.append(json.loads(line))
+        self._lock = threading.Lock()
+        logger.info(f"Loaded {len(self.entries)} scripted responses from {path}")
+
+    def matches(self, entry: dict, agent_name: str, prompt: str) -> bool:
+        if entry.get("agent") not in (None, agent_name):
+            return False
+        if entry.get("contains") is not None and entry["contains"] not in prompt:
+            return False
+        digest = entry.get("prompt_digest")
+        return digest is None or digest == prompt_digest(prompt)
+
+    def __call__(self, agent_name: str, prompt: str) -> str:
+        with self._lock:
+            for entry in self.entries:
+                if self.matches(entry, agent_name, prompt):
+                    if entry.get("once"):
+                        self.entries.remove(entry)
+                    return entry["response"]
+        return self.fallback(agent_name, prompt)
+
+
+class StubServer:
+    """Threaded HTTP server answering model requests from a responder"""
+
+    def __init__(
+        self,
+        host: str = DEFAULT_HOST,
+        port: int = 0,
+        responder=None,
+        latency: float = 0.0,
+        tokens_per_second: float = 0.0,
+        max_concurrency: int = 0,
+        record_path: str = None,
+    ):
+        # The responder can be swapped between runs, e.g. per benchmark case
+        self.responder = responder or default_responder
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.record_path = record_path
+        self.roles = role_agents()
+        self.models = set()
+        self.counts = Counter()
+        self.connections = 0
+        self.active = 0
+        self.peak_concurrency = 0
+        self.queued_seconds = 0.0
+        self.max_queued_seconds = 0.0
+        self._slots = (
+            threading.BoundedSemaphore(max_concurrency) if max_concurrency else None
+        )
+        self._lock = threading.Lock()
+        self._thread = None
+        self.httpd = ThreadingHTTPServer((host, port), StubRequestHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.stub = self
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "StubServer":
+        """Serve on a background thread"""
+        self._thread = threading.Thread(
+            target=self.httpd.serve_forever, name="loogy-stub-server", daemon=True
+        )
+        self._thread.start()
+        logger.info(f"Stub model server listening on {self.url}")
+        return self
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self) -> "StubServer":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    def agent_name(self, prompt: str) -> str:
+        for match in ROLE_RE.finditer(prompt):
+            name = self.roles.get(match.group(1).strip())
+            if name:
+                return name
+        return "unknown"
+
+    def respond(self, model: str, prompt: str) -> str:
+        """Text of the answer to ``prompt``, recorded if record_path is set"""
+        agent_name = self.agent_name(prompt)
+        response = FINAL_ANSWER + self.responder(agent_name, prompt)
+        with self._lock:
+            self.models.add(model)
+            self.counts["prompt_tokens"] += estimate_tokens(prompt)
+            self.counts["completion_tokens"] += estimate_tokens(response)
+            if self.record_path:
+                record = {
+                    "agent": agent_name,
+                    "prompt_digest": prompt_digest(prompt),
+                    "model": model,
+                    "response": response[len(FINAL_ANSWER) :],
+                }
+                with open(self.record_path, "a") as f:
+                    f.write(json.dumps(record) + "\n")
+        return response
+
+    def acquire_slot(self) -> None:
+        started = time.perf_counter()
+        if self._slots is not None:
+            self._slots.acquire()
+        waited = time.perf_counter() - started
+        with self._lock:
+            self.active += 1
+            self.peak_concurrency = max(self.peak_concurrency, self.active)
+            self.queued_seconds += waited
+            self.max_queued_seconds = max(self.max_queued_seconds, waited)
+
+    def release_slot(self) -> None:
+        with self._lock:
+            self.active -= 1
+        if self._slots is not None:
+            self._slots.release()
+
+    def tokens(self, text: str):
+        """Tokens of ``text``, paced by latency and tokens_per_second"""
+        if self.latency:
+            time.sleep(self.latency)
+        for token in TOKEN_RE.findall(text):
+            if self.tokens_per_second:
+                time.sleep(1 / self.tokens_per_second)
+            yield token
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "requests": dict(self.counts),
+                "connections": self.connections,
+                "active": self.active,
+                "peak_concurrency": self.peak_concurrency,
+                "queued_seconds": round(self.queued_seconds, 4),
+                "max_queued_seconds": round(self.max_queued_seconds, 4),
+                "models": sorted(self.models),
+            }
+
+
+def chat_prompt(messages: list) -> str:
+    """The prompt of a chat request, joined the way StubLLM joins it"""
+    return "\n".join(str(message.get("content", "")) for message in messages)
+
+
+def ollama_timestamp() -> str:
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+
+
+class StubRequestHandler(BaseHTTPRequestHandler):
+    server_version = "loogy-stub"
+    protocol_version = "HTTP/1.1"
+
+    @property
+    def stub(self) -> StubServer:
+        return self.server.stub
+
+    def setup(self) -> None:
+        # Called once per connection, however many requests it carries
+        super().setup()
+        with self.stub._lock:
+            self.stub.connections += 1
+
+    def log_message(self, format, *args) -> None:
+        logger.debug(format % args)
+
+    def send_json(self, payload: dict, status: int = 200) -> None:
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def start_stream(self, content_type: str) -> None:
+        # Streamed bodies end when the connection closes
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+    def write_line(self, line: str) -> None:
+        self.wfile.write(line.encode("utf-8"))
+        self.wfile.flush()
+
+    def read_json(self) -> dict:
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def do_GET(self) -> None:
+        path = self.path.rstrip("/")
+        with self.stub._lock:
+            models = sorted(self.stub.models)
+        if path == "/stats":
+            self.send_json(self.stub.stats())
+        elif path == "/api/tags":
+            self.send_json({"models": [{"name": m, "model": m} for m in models]})
+        elif path == "/api/version":
+            self.send_json({"version": "0.0.0-loogy-stub"})
+        elif path in ("/v1/models", "/models"):
+            data = [{"id": m, "object": "model", "owned_by": "loogy"} for m in models]
+            self.send_json({"object": "list", "data": data})
+        elif path == "":
+            self.send_json({"status": "Ollama is running"})
+        else:
+            self.send_json({"error": f"Unknown path {self.path}"}, status=404)
+
+    def do_POST(self) -> None:
+        try:
+            request = self.read_json()
+        except ValueError as e:
+            self.send_json({"error": f"Invalid JSON: {e}"}, status=400)
+            return
+        path = self.path.rstrip("/")
+        with self.stub._lock:
+            self.stub.counts[path] += 1
+        if path == "/api/show":
+            self.send_json(
+                {
+                    "modelfile": "",
+                    "parameters": "",
+                    "template": "{{ .Prompt }}",
+                    "details": {"family": "stub", "format": "gguf"},
+                    "model_info": {},
+                }
+            )
+        elif path == "/api/generate":
+            self.ollama_generate(request)
+        elif path == "/api/chat":
+            self.ollama_chat(request)
+        elif path in ("/v1/chat/completions", "/chat/completions"):
+            self.openai_chat(request)
+        else:
+            self.send_json({"error": f"Unknown path {self.path}"}, status=404)
+
+    def ollama_generate(self, request: dict) -> None:
+        model = request.get("model", "")
+        if not request.get("prompt"):
+            # A request without a prompt only loads the model
+            with self.stub._lock:
+                self.stub.models.add(model)
+                self.stub.counts["loads"] += 1
+            self.send_json(
+                {
+                    "model": model,
+                    "created_at": ollama_timestamp(),
+                    "response": "",
+                    "done": True,
+                    "done_reason": "load",
+                }
+            )
+            return
+        self.ollama_answer(request, request["prompt"], "response", lambda text: text)
+
+    def ollama_chat(self, request: dict) -> None:
+        self.ollama_answer(
+            request,
+            chat_prompt(request.get("messages", [])),
+            "message",
+            lambda text: {"role": "assistant", "content": text},
+        )
+
+    def ollama_answer(self, request: dict, prompt: str, key: str, wrap) -> None:
+        model = request.get("model", "")
+        self.stub.acquire_slot()
+        try:
+            response = self.stub.respond(model, prompt)
+            final = {
+                "model": model,
+                "created_at": ollama_timestamp(),
+                "done": True,
+                "done_reason": "stop",
+                "prompt_eval_count": estimate_tokens(prompt),
+                "eval_count": estimate_tokens(response),
+            }
+            if not request.get("stream", True):
+                text = "".join(self.stub.tokens(response))
+                self.send_json({**final, key: wrap(text)})
+                return
+            self.start_stream("application/x-ndjson")
+            for token in self.stub.tokens(response):
+                chunk = {
+                    "model": model,
+                    "created_at": ollama_timestamp(),
+                    key: wrap(token),
+                    "done": False,
+                }
+                self.write_line(json.dumps(chunk) + "\n")
+            self.write_line(json.dumps({**final, key: wrap("")}) + "\n")
+        finally:
+            self.stub.release_slot()
+
+    def openai_chat(self, request: dict) -> None:
+        model = request.get("model", "")
+        prompt = chat_prompt(request.get("messages", []))
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        created = int(time.time())
+        self.stub.acquire_slot()
+        try:
+            response = self.stub.respond(model, prompt)
+            usage = {
+                "prompt_tokens": estimate_tokens(prompt),
+                "completion_tokens": estimate_tokens(response),
+            }
+            usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+            if not request.get("stream"):
+                text = "".join(self.stub.tokens(response))
+                message = {"role": "assistant", "content": text}
+                self.send_json(
+                    {
+                        "id": completion_id,
+                        "object": "chat.completion",
+                        "created": created,
+                        "model": model,
+                        "choices": [
+                            {"index": 0, "message": message, "finish_reason": "stop"}
+                        ],
+                        "usage": usage,
+                    }
+                )
+                return
+
+            def chunk(delta: dict, finish_reason=None, **extra) -> str:
+                payload = {
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": model,
+                    "choices": [
+                        {"index": 0, "delta": delta, "finish_reason": finish_reason}
+                    ],
+                    **extra,
+                }
+                return f"data: {json.dumps(payload)}\n\n"
+
+            self.start_stream("text/event-stream")
+            self.write_line(chunk({"role": "assistant", "content": ""}))
+            for token in self.stub.tokens(response):
+                self.write_line(chunk({"content": token}))
+            self.write_line(chunk({}, "stop", usage=usage))
+            self.write_line("data: [DONE]\n\n")
+        finally:
+            self.stub.release_slot()
+
+
+def get_parser(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="loogy stub-server",
+        description="Serve scripted model responses over the Ollama and OpenAI APIs",
+    )
+    parser.add_argument("--host", type=str, default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.0,
+        help="Seconds before the first token of every response",
+    )
+    parser.add_argument(
+        "--tokens-per-second",
+        type=float,
+        default=0.0,
+        help="Generation speed of every response (0: no limit)",
+    )
+    parser.add_argument(
+        "--max-concurrency",
+        type=int,
+        default=0,
+        help="Requests answered at the same time; the others wait (0: no limit)",
+    )
+    parser.add_argument(
+        "--script",
+        type=str,
+        help="JSONL of scripted responses (default: echo the code of the task)",
+    )
+    parser.add_argument(
+        "--record",
+        type=str,
+        help="Append every answer to this JSONL file; it can be replayed as --script",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    logging.basicConfig(level=logging.INFO)
+    args = get_parser(argv)
+    server = StubServer(
+        host=args.host,
+        port=args.port,
+        responder=ScriptedResponder(args.script) if args.script else None,
+        latency=args.latency,
+        tokens_per_second=args.tokens_per_second,
+        max_concurrency=args.max_concurrency,
+        record_path=args.record,
+    )
+    logger.info(f"Stub model server listening on {server.url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+        logger.info(f"Stub model server stats: {server.stats()}")
+
+
+if __name__ == "__main__":
+    main()
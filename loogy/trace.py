@@ -0,0 +1,90 @@
+"""Lightweight tracing of a loogy run.
+
+Every stage (developer, tester, test execution, exit check), iteration and
+file operation is recorded as a span with its start time, duration and
+attributes such as prompt/completion tokens or bytes of logs injected. A
+run's spans can be exported as JSON lines or in the Chrome trace event
+format (load it in chrome://tracing or https://ui.perfetto.dev).
+"""
+from contextlib import contextmanager
+import json
+import os
+import threading
+import time
+from typing import Callable, List, Optional
+
+TRACE_FORMATS = ("jsonl", "chrome")
+
+
+class Tracer:
+    """Collects spans; listeners are called with each span as it ends"""
+
+    def __init__(self, listeners: Optional[List[Callable[[dict], None]]] = None):
+        self.spans = []
+        self.listeners = list(listeners or [])
+        self.origin = time.time()
+        self._lock = threading.Lock()
+
+    def add_span(
+        self, name: str, start: float, duration: float, category: str = "stage", **attrs
+    ) -> dict:
+        """Record a span that was timed elsewhere; start is an epoch timestamp"""
+        span = {
+            "name": name,
+            "category": category,
+            "start": start,
+            "duration": duration or 0.0,
+            "thread": threading.get_ident(),
+            "attrs": attrs,
+        }
+        with self._lock:
+            self.spans.append(span)
+        for listener in self.listeners:
+            listener(span)
+        return span
+
+    @contextmanager
+    def span(self, name: str, category: str = "stage", **attrs):
+        """Time the body; the yielded dict can be used to add attributes"""
+        start = time.time()
+        started = time.perf_counter()
+        try:
+            yield attrs
+        finally:
+            self.add_span(
+                name, start, time.perf_counter() - started, category=category, **attrs
+            )
+
+    def of_category(self, category: str) -> List[dict]:
+        return [span for span in self.spans if span["category"] == category]
+
+    def total(self, category: str) -> float:
+        return sum(span["duration"] for span in self.of_category(category))
+
+    def to_chrome(self) -> dict:
+        events = []
+        for span in self.spans:
+            events.append(
+                {
+                    "name": span["name"],
+                    "cat": span["category"],
+                    "ph": "X",
+                    "ts": int((span["start"] - self.origin) * 1e6),
+                    "dur": int(span["duration"] * 1e6),
+                    "pid": os.getpid(),
+                    "tid": span["thread"],
+                    "args": span["attrs"],
+                }
+            )
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def export(self, path: str, trace_format: str = "jsonl") -> None:
+        """Write the spans as JSON lines or a Chrome trace"""
+        if trace_format not in TRACE_FORMATS:
+            raise ValueError(f"Unknown trace format: {trace_format}")
+        with open(path, "w") as f:
+            if trace_format == "chrome":
+                json.dump(self.to_chrome(), f)
+            else:
+                for span in self.spans:
+                    f.write(json.dumps(span, default=str) + "\n")
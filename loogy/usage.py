@@ -0,0 +1,21 @@
+"""Token usage reporting for LLM calls made outside of crewAI's LLM.call.
+
+crewAI counts an agent's tokens with litellm success callbacks, which only
+run for the completions it makes itself. Calls that bypass it (CachedLLM's
+own completions, the Stub provider) report their usage to the same callbacks.
+"""
+from typing import Optional
+
+
+def report_usage(callbacks: Optional[list], params: dict, usage) -> None:
+    """Report ``usage`` (with prompt_tokens and completion_tokens) like crewAI's LLM"""
+    if usage is None:
+        return
+    for callback in callbacks or []:
+        if hasattr(callback, "log_success_event"):
+            callback.log_success_event(
+                kwargs=params,
+                response_obj={"usage": usage},
+                start_time=0,
+                end_time=0,
+            )
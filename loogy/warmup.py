@@ -0,0 +1,75 @@
+"""Warm-up and keep-alive of the models served by a local Ollama server.
+
+Ollama loads a model on its first request and unloads it ``keep_alive``
+after the last request (five minutes unless the request says otherwise), so
+the first call of a run pays the load time. ``warm_model`` sends a generate
+request without a prompt, which only loads the model, or just extends its
+keep-alive when it is already loaded.
+"""
+import json
+import os
+import threading
+import time
+import urllib.request
+import logging
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+DEFAULT_KEEP_ALIVE = "30m"
+DEFAULT_OLLAMA_API_BASE = "http://localhost:11434"
+# Loading a large model from disk can take minutes
+WARM_UP_TIMEOUT = 300.0
+
+
+def ollama_api_base() -> str:
+    """Base URL of the Ollama server, as litellm resolves it"""
+    return os.environ.get("OLLAMA_API_BASE", DEFAULT_OLLAMA_API_BASE).rstrip("/")
+
+
+def keep_alive_value(keep_alive):
+    """Ollama takes durations as strings ("30m") and plain seconds as numbers"""
+    try:
+        return int(keep_alive)
+    except (TypeError, ValueError):
+        return keep_alive
+
+
+def warm_model(
+    model: str,
+    keep_alive: str = DEFAULT_KEEP_ALIVE,
+    api_base: str = None,
+    timeout: float = WARM_UP_TIMEOUT,
+) -> bool:
+    """Load ``model`` and keep it loaded for ``keep_alive``; False on failure"""
+    url = f"{(api_base or ollama_api_base()).rstrip('/')}/api/generate"
+    body = json.dumps({"model": model, "keep_alive": keep_alive_value(keep_alive)})
+    request = urllib.request.Request(
+        url, data=body.encode("utf-8"), headers={"Content-Type": "application/json"}
+    )
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            response.read()
+    except (OSError, ValueError) as e:
+        logger.warning(f"Could not warm up {model} at {url}: {e}")
+        return False
+    logger.info(
+        f"Warmed up {model} in {time.perf_counter() - started:.2f}s "
+        f"(keep_alive={keep_alive})"
+    )
+    return True
+
+
+def warm_models(
+    models, keep_alive: str = DEFAULT_KEEP_ALIVE, api_base: str = None
+) -> threading.Thread:
+    """Warm up ``models`` one after the other on a background thread"""
+
+    def target():
+        for model in models:
+            warm_model(model, keep_alive=keep_alive, api_base=api_base)
+
+    thread = threading.Thread(target=target, name="loogy-warm-up", daemon=True)
+    thread.start()
+    return thread
@@ -15,4 +15,4 @@ fi
 echo "Package installed in development mode."
 echo "You can now run:"
 echo "  - Streamlit app: cd streamlit && streamlit run app.py"
-echo "  - Benchmark: cd benchmark && python src/process_dataset.py" 
\ No newline at end of file
+echo "  - Benchmark: python benchmark/run_benchmark.py" 
\ No newline at end of file
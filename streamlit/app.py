@@ -1,8 +1,8 @@
 import streamlit as st
 import os
 from pathlib import Path
-import time
 import sys
+import uuid
 from dotenv import load_dotenv
 import logging
 
@@ -18,7 +18,9 @@ if parent_dir not in sys.path:
 
 # Now try to import loogy
 try:
-    from loogy.crew import loogy
+    from loogy.defaults import MAX_ITERATIONS
+    from loogy.jobs import Job, JobQueue, JobRejected
+    from loogy.sandbox import extract_code
     logger.info("Successfully imported loogy")
 except ImportError as e:
     logger.error(f"Failed to import loogy: {e}")
@@ -30,6 +32,95 @@ load_dotenv(env_path)
 logger.info(f"Loading .env from: {env_path}")
 
 
+# How often the page polls the status of a running job
+POLL_SECONDS = 1.0
+# Runs executed at once across all sessions; the others wait in the queue
+MAX_CONCURRENT_RUNS = int(os.getenv("LOOGY_MAX_CONCURRENT_RUNS", "2"))
+# Each session writes to its own directory under this one
+SESSIONS_DIR = os.getenv("LOOGY_SESSIONS_DIR", os.path.join("outputs", "sessions"))
+
+
+@st.cache_resource(max_entries=64)
+def get_crew(
+    model_provider: str,
+    model_name: str,
+    output_dir: str,
+    agent_models: tuple = (),
+    escalate_after: int = 0,
+    escalation_model: str = "",
+):
+    """Create the loogy crew once per models and session and reuse it across reruns
+
+    ``agent_models`` is a tuple of (agent, "Provider/model") pairs so that it
+    can be part of the cache key; escalate_after 0 turns escalation off.
+    """
+    # Imported on first use so the page renders before crewAI is loaded
+    from loogy.crew import loogy
+
+    logger.info(f"Creating loogy crew for {model_provider}/{model_name}: {output_dir}")
+    return loogy(
+        model_provider=model_provider,
+        model_name=model_name,
+        output_dir=output_dir,
+        agent_models=dict(agent_models),
+        escalate_after=escalate_after or None,
+        escalation_model=escalation_model or None,
+    )
+
+
+@st.cache_resource
+def get_job_queue() -> JobQueue:
+    """Job queue shared by all sessions of the app"""
+    return JobQueue(max_workers=MAX_CONCURRENT_RUNS)
+
+
+def session_output_dir(session_id: str) -> str:
+    return os.path.join(SESSIONS_DIR, session_id)
+
+
+def render_job(job: Job):
+    """Show the status and the latest outputs of a job"""
+    if job.status == "queued":
+        ahead = get_job_queue().position(job)
+        st.info(f"Waiting for a free worker ({ahead} runs ahead)")
+    elif job.status == "running":
+        stage = f", last finished stage: {job.stage}" if job.stage else ""
+        st.info(f"Iteration {job.iteration} in progress{stage}")
+    elif job.status == "passed":
+        st.success("All tests passed successfully!")
+    elif job.status == "failed":
+        st.warning(f"Tests still failing after {job.iteration} iterations")
+    else:
+        st.error(f"Process failed: {job.error}")
+    st.progress(100 if job.done else min(99, job.iteration * 100 // MAX_ITERATIONS))
+
+    col1, col2 = st.columns(2)
+    with col1:
+        st.subheader("Generated Code")
+        code = job.artifacts.get("codebase.py")
+        if code:
+            st.code(extract_code(code), language="python")
+    with col2:
+        st.subheader("Test Results")
+        st.markdown(job.artifacts.get("tests_results.md", "*No test results yet*"))
+
+    if job.tokens and not job.done:
+        st.subheader("Live Agent Output")
+        st.code(f"[{job.agent}]\n{job.tokens}")
+
+
+@st.fragment(run_every=POLL_SECONDS)
+def poll_job(job_id: str):
+    """Re-render the job every POLL_SECONDS until it is done"""
+    job = get_job_queue().get(job_id)
+    if job is None:
+        return
+    render_job(job)
+    if job.done:
+        # Rerun the whole page to stop polling
+        st.rerun()
+
+
 def main():
     st.set_page_config(layout="wide")
     st.title("Loogy")
@@ -73,9 +164,34 @@ def main():
                 )
                 return
 
+    # Cheap models first: the developer moves to the escalation model only
+    # after the given number of failed iterations
+    st.sidebar.subheader("Model Routing")
+    tester_model = st.sidebar.text_input(
+        "Tester Model (Provider/model)", value="", help="Empty: the model above"
+    )
+    escalation_model = st.sidebar.text_input(
+        "Escalation Model (Provider/model)", value="", help="e.g. OpenAI/gpt-4o"
+    )
+    escalate_after = st.sidebar.number_input(
+        "Escalate After Failed Iterations",
+        min_value=0,
+        max_value=MAX_ITERATIONS,
+        value=0,
+        help="0: never escalate",
+        disabled=not escalation_model,
+    )
+    routing = {
+        "agent_models": (("tester", tester_model),) if tester_model else (),
+        "escalate_after": int(escalate_after),
+        "escalation_model": escalation_model,
+    }
+
     # Session state initialization
-    if "iteration" not in st.session_state:
-        st.session_state.iteration = 0
+    if "session_id" not in st.session_state:
+        st.session_state.session_id = uuid.uuid4().hex
+    if "job_id" not in st.session_state:
+        st.session_state.job_id = None
     if "topic" not in st.session_state:
         st.session_state.topic = """ Fix the code ```import numpy as np \n import pandas as pd \n from sklearn.datasets import make_classification \n
     from sklearn.model_selection import train_test_split\n from xgboost import XGBClassifier\n from sklearn.metrics import accuracy_score\n
@@ -85,117 +201,51 @@ def main():
     model = XGBClassifier(use_label_encoder=False, eval_metric='logloss') model.fit(X_train, y_train) \n
     y_pred = model.predict(X_test)\n accuracy = accuracy_score(y_test, y_pred) \n print(f"Model Accuracy: '{{accuracy:.4f}}'")
 """
-    if "last_topic" not in st.session_state:
-        st.session_state.last_topic = None
+
+    session_id = st.session_state.session_id
+    job_queue = get_job_queue()
+    job = job_queue.get(st.session_state.job_id) if st.session_state.job_id else None
+    running = job is not None and not job.done
 
     # UI Components
     col1, col2 = st.columns([4, 1])
     with col1:
         topic = st.text_input("Development Task:", value=st.session_state.topic)
     with col2:
-        clear_button = st.button("🗑️ Clear Outputs")
+        clear_button = st.button("🗑️ Clear Outputs", disabled=running)
 
-    start_button = st.button("Start Development Process")
+    start_button = st.button("Start Development Process", disabled=running)
 
     if clear_button:
-        # Initialize crew just to use clean_outputs_directory
-        crew = loogy()
+        crew = get_crew(
+            model_provider, model_name, session_output_dir(session_id), **routing
+        )
         crew.clean_outputs_directory()
-        st.session_state.iteration = 0
+        st.session_state.job_id = None
+        job = None
         st.success("✨ Outputs directory cleared!")
         logger.info("Outputs directory cleared via clear button")
 
     if start_button:
         if model_provider == "OpenAI":
             os.environ["OPENAI_API_KEY"] = api_key
-
-        # Initialize crew
-        crew = loogy(model_provider=model_provider, model_name=model_name)
-
-        # Debug paths
-        crew.debug_paths()
-
-        # Ensure output files exist
-        crew.ensure_output_files_exist()
-
-        # Clean outputs if topic changed
-        if st.session_state.last_topic != topic:
-            logger.info(
-                f"Topic changed from '{st.session_state.last_topic}' to '{topic}'"
-            )
-            crew.clean_outputs_directory()
-            st.session_state.iteration = 0
-
         st.session_state.topic = topic
-        st.session_state.last_topic = topic
-
-        # Initialize UI containers
-        progress_bar = st.progress(0)
-        status_text = st.empty()
-        col1, col2 = st.columns(2)
-
-        with col1:
-            st.subheader("Generated Code")
-            code_display = st.empty()
-
-        with col2:
-            st.subheader("Test Results")
-            test_results = st.empty()
 
+        # One run does all the iterations; the page only polls its status
         try:
-            while st.session_state.iteration < 3:
-                st.session_state.iteration += 1
-                status_text.text(
-                    f"Iteration {st.session_state.iteration} in progress..."
-                )
-                progress_bar.progress(st.session_state.iteration * 33)
-
-                # Execute crew
-                crew.run(topic=topic)
-
-                # Display outputs
-                try:
-                    # Read codebase.py
-                    code_path = crew.get_output_path("codebase.py")
-                    if not os.path.exists(code_path):
-                        # Create empty file if it doesn't exist
-                        with open(code_path, "w") as f:
-                            f.write("# No code generated yet")
-                        logger.warning(f"Created empty file at {code_path}")
-
-                    with open(code_path, "r") as f:
-                        code_content = f.read()
-                    code_display.code(code_content, language="python")
-                except Exception as e:
-                    code_display.error(f"Error reading codebase: {str(e)}")
-                    logger.error(f"Error reading codebase: {str(e)}", exc_info=True)
-
-                try:
-                    # Read tests_results.md
-                    test_path = crew.get_output_path("tests_results.md")
-                    if not os.path.exists(test_path):
-                        # Create empty file if it doesn't exist
-                        with open(test_path, "w") as f:
-                            f.write("*No test results available yet*")
-                        logger.warning(f"Created empty file at {test_path}")
-
-                    with open(test_path, "r") as f:
-                        test_content = f.read()
-                    test_results.markdown(test_content)
-                except Exception as e:
-                    test_results.error(f"Error reading test results: {str(e)}")
-                    logger.error(f"Error reading test results: {str(e)}", exc_info=True)
-
-                if crew.exit_flag:
-                    status_text.success("All tests passed successfully!")
-                    progress_bar.progress(100)
-                    break
-
-                time.sleep(1)
-
-        except Exception as e:
-            st.error(f"Process failed: {str(e)}")
-            logger.error(f"Execution error: {str(e)}", exc_info=True)
+            crew = get_crew(
+                model_provider, model_name, session_output_dir(session_id), **routing
+            )
+            job = job_queue.submit(session_id, crew, topic)
+            st.session_state.job_id = job.job_id
+        except JobRejected as e:
+            st.warning(str(e))
+
+    if job is not None:
+        if job.done:
+            render_job(job)
+        else:
+            poll_job(job.job_id)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,74 @@
+import asyncio
+import os
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from loogy import batch
+
+
+class FakeCrew:
+    """Runs two stages at once on the loop's executor, like loogy.arun"""
+
+    def __init__(self, barrier):
+        self.barrier = barrier
+
+    async def arun(self, topic, max_iterations, resume):
+        await asyncio.gather(
+            asyncio.to_thread(self.barrier.wait),
+            asyncio.to_thread(self.barrier.wait),
+        )
+
+
+class TestRunBatchAsync(unittest.TestCase):
+    def run_batch(self, concurrency, make_crew):
+        tasks = [{"task_id": str(i), "topic": "x"} for i in range(concurrency)]
+        options = {"model_provider": "Stub", "max_iterations": 1}
+        with tempfile.TemporaryDirectory() as directory, mock.patch.object(
+            batch, "configure_http_pool"
+        ), mock.patch.object(batch, "make_crew", make_crew), mock.patch.object(
+            batch, "describe_result", lambda record, crew: record.update(
+                status="passed"
+            )
+        ):
+            return asyncio.run(
+                batch.run_batch_async(
+                    tasks,
+                    options,
+                    os.path.join(directory, "results.jsonl"),
+                    concurrency=concurrency,
+                    provider_limits={},
+                )
+            )
+
+    def test_all_runs_get_their_stage_threads(self):
+        # More threads than the stock default executor has on a small machine;
+        # the barrier only opens once every stage of every run is on a thread
+        concurrency = 2 * (min(32, (os.cpu_count() or 1) + 4))
+        barrier = threading.Barrier(batch.THREADS_PER_RUN * concurrency, timeout=10)
+
+        def make_crew(task, options):
+            return FakeCrew(barrier), {"task_id": task["task_id"]}
+
+        statuses = self.run_batch(concurrency, make_crew)
+        self.assertEqual(statuses, {"passed": concurrency})
+
+    def test_crews_are_built_off_the_loop(self):
+        loop_thread = threading.get_ident()
+        build_threads = []
+
+        def make_crew(task, options):
+            build_threads.append(threading.get_ident())
+            return (
+                FakeCrew(threading.Barrier(batch.THREADS_PER_RUN)),
+                {"task_id": task["task_id"]},
+            )
+
+        self.run_batch(2, make_crew)
+        self.assertEqual(len(build_threads), 2)
+        self.assertNotIn(loop_thread, build_threads)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+import tempfile
+import unittest
+
+from loogy.cache import ResponseCache
+
+
+class TestResponseCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache = ResponseCache(cache_dir=self.directory.name)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_key_depends_on_every_part(self):
+        key = ResponseCache.make_key(("Ollama", "m"), 0.7, [{"content": "a"}])
+        self.assertEqual(
+            key, ResponseCache.make_key(("Ollama", "m"), 0.7, [{"content": "a"}])
+        )
+        self.assertNotEqual(
+            key, ResponseCache.make_key(("Ollama", "m"), 0.1, [{"content": "a"}])
+        )
+        self.assertNotEqual(
+            key, ResponseCache.make_key(("Ollama", "m"), 0.7, [{"content": "b"}])
+        )
+
+    def test_hit_in_a_later_run(self):
+        key = ResponseCache.make_key("prompt")
+        self.assertIsNone(self.cache.get(key))
+        self.cache.put(key, "answer")
+        self.cache.start_run()
+        self.assertEqual(self.cache.get(key), "answer")
+        self.assertEqual(self.cache.stats()["hits"], 1)
+
+    def test_retry_in_the_same_run_is_not_served(self):
+        key = ResponseCache.make_key("prompt")
+        self.cache.put(key, "failing fix")
+        # The loop sends the same prompt again after the fix failed
+        self.assertIsNone(self.cache.get(key))
+        self.cache.put(key, "new fix")
+        self.assertIsNone(self.cache.get(key))
+        self.assertEqual(self.cache.stats()["repeats"], 2)
+        self.cache.start_run()
+        self.assertEqual(self.cache.get(key), "new fix")
+        # Served once, so the rest of this run asks the model again
+        self.assertIsNone(self.cache.get(key))
+
+    def test_bypass(self):
+        cache = ResponseCache(cache_dir=self.directory.name, bypass=True)
+        key = ResponseCache.make_key("prompt")
+        cache.put(key, "answer")
+        cache.start_run()
+        self.assertIsNone(cache.get(key))
+
+    def test_evicts_least_recently_used(self):
+        cache = ResponseCache(cache_dir=self.directory.name, max_bytes=100)
+        for index in range(5):
+            cache.put(ResponseCache.make_key(index), "x" * 40)
+        self.assertLessEqual(cache._disk_usage(), 100)
+
+
+if __name__ == "__main__":
+    unittest.main()
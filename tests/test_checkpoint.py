@@ -0,0 +1,74 @@
+import os
+import tempfile
+import threading
+import unittest
+
+from loogy.checkpoint import (
+    CheckpointWriter,
+    load_checkpoint,
+    save_checkpoint,
+    topic_digest,
+)
+
+
+class TestCheckpoint(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "checkpoint.json.gz")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_round_trip(self):
+        state = {"topic": topic_digest("fix me"), "iteration": 2, "completed": ["a"]}
+        self.assertGreater(save_checkpoint(self.path, state), 0)
+        loaded = load_checkpoint(self.path, "fix me")
+        self.assertEqual(loaded["iteration"], 2)
+        self.assertEqual(loaded["completed"], ["a"])
+
+    def test_other_topic_is_ignored(self):
+        save_checkpoint(self.path, {"topic": topic_digest("fix me")})
+        self.assertIsNone(load_checkpoint(self.path, "something else"))
+
+    def test_missing_or_corrupt(self):
+        self.assertIsNone(load_checkpoint(self.path, "fix me"))
+        with open(self.path, "wb") as f:
+            f.write(b"not gzip")
+        self.assertIsNone(load_checkpoint(self.path, "fix me"))
+
+
+class TestCheckpointWriter(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "checkpoint.json.gz")
+        self.writer = CheckpointWriter(self.path)
+
+    def tearDown(self):
+        self.writer.flush()
+        self.directory.cleanup()
+
+    def test_written_in_the_background(self):
+        self.writer.submit({"topic": topic_digest("fix me"), "iteration": 1})
+        self.writer.flush()
+        self.assertEqual(load_checkpoint(self.path, "fix me")["iteration"], 1)
+        (span,) = self.writer.tracer.of_category("io")
+        self.assertEqual(span["name"], "checkpoint")
+        self.assertNotEqual(span["thread"], threading.get_ident())
+
+    def test_only_the_latest_waiting_state_is_written(self):
+        digest = topic_digest("fix me")
+        self.writer.submit({"topic": digest, "iteration": 0})
+        self.writer.flush()
+        # Hold the writer thread so the next states wait behind each other
+        release = threading.Event()
+        self.writer._writer.submit(release.wait)
+        for iteration in range(1, 5):
+            self.writer.submit({"topic": digest, "iteration": iteration})
+        release.set()
+        self.writer.flush()
+        self.assertEqual(load_checkpoint(self.path, "fix me")["iteration"], 4)
+        self.assertEqual(len(self.writer.tracer.of_category("io")), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
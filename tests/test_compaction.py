@@ -0,0 +1,43 @@
+import unittest
+
+from loogy.compaction import compact_logs, estimate_tokens
+
+TRACEBACK = """result: Failed
+
+### test_a: ValueError
+```
+Traceback (most recent call last):
+  File "/tmp/x/unit_tests.py", line 5, in test_a
+    f()
+  File "/usr/lib/python3.11/site-packages/numpy/core.py", line 10, in g
+    h()
+  File "/usr/lib/python3.11/site-packages/numpy/core.py", line 20, in h
+    raise ValueError
+  File "/tmp/x/codebase.py", line 3, in f
+    return g()
+ValueError: bad shape
+```
+"""
+
+
+class TestCompactLogs(unittest.TestCase):
+    def test_empty(self):
+        self.assertEqual(compact_logs("   "), "")
+
+    def test_keeps_user_frames_and_error(self):
+        compacted = compact_logs(TRACEBACK)
+        self.assertTrue(compacted.startswith("result: Failed"))
+        self.assertIn("codebase.py", compacted)
+        self.assertIn("ValueError: bad shape", compacted)
+        self.assertNotIn('numpy/core.py", line 20', compacted)
+
+    def test_fits_the_budget(self):
+        text = "result: Failed\n" + "\n".join(f"line {i} " * 20 for i in range(500))
+        compacted = compact_logs(text, token_budget=200)
+        self.assertLessEqual(estimate_tokens(compacted), 220)
+        # The tail of a long output block is kept
+        self.assertIn("line 499", compacted)
+
+
+if __name__ == "__main__":
+    unittest.main()
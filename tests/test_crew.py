@@ -0,0 +1,340 @@
+import os
+import tempfile
+import threading
+import unittest
+from concurrent.futures import Future, ThreadPoolExecutor
+from types import SimpleNamespace
+from unittest import mock
+
+from loogy.checkpoint import CHECKPOINT_FILE, load_checkpoint
+from loogy.crew import ArtifactStore, loogy
+from loogy.sandbox import TestCaseResult, TestRunResult
+
+BROKEN = "```python\ndef f(:\n    pass\n```"
+GOOD = "```python\ndef f():\n    return 1\n```"
+
+
+def make_crew(output_dir, **kwargs):
+    options = dict(
+        model_provider="Stub",
+        output_dir=output_dir,
+        use_cache=False,
+        failure_memo=False,
+        warm_workers=False,
+        warm_up=False,
+        trace_format=None,
+        artifact_flush="end",
+    )
+    options.update(kwargs)
+    return loogy(**options)
+
+
+class TestArtifactStore(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def check_flush_during_puts(self, flush_mode):
+        store = ArtifactStore(self.directory.name, flush=flush_mode)
+        done = threading.Event()
+
+        def put_all(thread):
+            for i in range(200):
+                store.put(f"{thread}-{i % 20}.txt", str(i))
+
+        def flush_repeatedly():
+            while not done.is_set():
+                store.flush()
+
+        flusher = threading.Thread(target=flush_repeatedly)
+        flusher.start()
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            list(pool.map(put_all, range(8)))
+        done.set()
+        flusher.join()
+        store.flush()
+
+        self.assertEqual(store.dirty, set())
+        for name, content in store.snapshot().items():
+            self.assertEqual(store.path(name).read_text(), content)
+
+    def test_flush_during_puts(self):
+        for flush_mode in ArtifactStore.FLUSH_MODES:
+            with self.subTest(flush=flush_mode):
+                self.check_flush_during_puts(flush_mode)
+
+
+class TestPrepareRun(unittest.TestCase):
+    topic = "def get(config, key):\n    return config[key]\n"
+
+    def first_inputs(self, duration):
+        previous = TestRunResult(
+            tests=[
+                failed("test_get", "KeyError", "'port'", KEY_ERROR),
+                TestCaseResult("test_other", "passed", duration),
+            ],
+            exit_code=1,
+            duration=duration,
+        )
+        with tempfile.TemporaryDirectory() as directory:
+            crew = make_crew(directory)
+            crew.write_output("tests_results.md", previous.to_markdown())
+            crew.prepare_run(self.topic)
+            return dict(crew.inputs)
+
+    def test_same_first_prompt_whatever_the_previous_timings(self):
+        first = self.first_inputs(0.25)
+        self.assertIn("KeyError", first["logs"])
+        self.assertEqual(first, self.first_inputs(1.5))
+
+    def test_logs_argument_is_used(self):
+        with tempfile.TemporaryDirectory() as directory:
+            crew = make_crew(directory)
+            crew.write_output("tests_results.md", "result: Failed\n")
+            crew.prepare_run(self.topic, logs="ValueError: bad port")
+        self.assertIn("ValueError: bad port", crew.inputs["logs"])
+        self.assertNotIn("result: Failed", crew.inputs["logs"])
+
+
+class TestStaticGuardrail(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.crew = make_crew(self.directory.name, static_retries=2)
+        self.crew.prepare_run("def f(): pass")
+        self.crew.start_iteration()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_retries_then_gives_up(self):
+        guardrail = self.crew.static_guardrail("develop_topic_task")
+        answers = [guardrail(SimpleNamespace(raw=BROKEN))[0] for _ in range(3)]
+        self.assertEqual(answers, [False, False, True])
+        self.assertTrue(guardrail(SimpleNamespace(raw=GOOD))[0])
+
+    def test_candidates_have_their_own_retries(self):
+        first = self.crew.static_guardrail("develop_topic_task#0")
+        second = self.crew.static_guardrail("develop_topic_task#1")
+        for _ in range(3):
+            first(SimpleNamespace(raw=BROKEN))
+        self.assertFalse(second(SimpleNamespace(raw=BROKEN))[0])
+        self.assertFalse(self.crew.static_reports["develop_topic_task#1"].ok)
+
+    def test_concurrent_candidates(self):
+        names = [f"develop_topic_task#{variant}" for variant in range(8)]
+
+        def check(name):
+            guardrail = self.crew.static_guardrail(name)
+            return [guardrail(SimpleNamespace(raw=BROKEN))[0] for _ in range(3)]
+
+        with ThreadPoolExecutor(max_workers=len(names)) as pool:
+            answers = list(pool.map(check, names))
+        self.assertEqual(answers, [[False, False, True]] * len(names))
+
+    def test_new_iteration_resets_the_retries(self):
+        guardrail = self.crew.static_guardrail("develop_topic_task")
+        for _ in range(3):
+            guardrail(SimpleNamespace(raw=BROKEN))
+        self.crew.start_iteration()
+        self.assertFalse(guardrail(SimpleNamespace(raw=BROKEN))[0])
+
+    def test_disabled(self):
+        crew = make_crew(self.directory.name, static_checks=False)
+        self.assertIsNone(crew.static_guardrail("develop_topic_task"))
+
+
+class TestCheckpoints(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.crew = make_crew(self.directory.name)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_one_checkpoint_per_stage(self):
+        topic = "def double(x):\n    return x * 2\n"
+        writer = self.crew.checkpoint_writer
+        with mock.patch.object(
+            writer, "submit", wraps=writer.submit
+        ) as submit, mock.patch.object(
+            self.crew, "complete_stage", wraps=self.crew.complete_stage
+        ) as complete_stage:
+            self.crew.run(topic=topic, max_iterations=1)
+        self.assertGreater(complete_stage.call_count, 0)
+        self.assertEqual(submit.call_count, complete_stage.call_count)
+
+        # The saved state has the timings of the stages it covers
+        state = load_checkpoint(
+            os.path.join(self.directory.name, CHECKPOINT_FILE), topic
+        )
+        stages = {span["name"] for span in state["spans"]}
+        self.assertIn("develop_topic_task", stages)
+        self.assertIn("develop_topic_task", state["completed"])
+
+
+TESTS = "```python\nimport unittest\n\n\nclass T(unittest.TestCase):\n    pass\n```"
+KEY_ERROR = (
+    "Traceback (most recent call last):\n"
+    '  File "/tmp/run/codebase.py", line 2, in get\n'
+    "    return config[key]\n"
+    "KeyError: 'port'\n"
+)
+IN_TESTS = (
+    "Traceback (most recent call last):\n"
+    '  File "/tmp/run/unit_tests.py", line 9, in test_get\n'
+    "    self.assertEqual(get(), undefined_helper())\n"
+    "NameError: name 'undefined_helper' is not defined\n"
+)
+
+
+def result(*tests):
+    return TestRunResult(tests=list(tests), exit_code=1)
+
+
+def failed(name, error_type, message, traceback):
+    return TestCaseResult(
+        name, "failed", error_type=error_type, message=message, traceback=traceback
+    )
+
+
+class TestMemoizeFailures(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.crew = make_crew(
+            self.directory.name,
+            failure_memo=True,
+            failure_memo_path=os.path.join(self.directory.name, "failures.json"),
+        )
+        self.crew.write_output("unit_tests.py", TESTS)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def iteration(self, code, test_result):
+        self.crew.write_output("codebase.py", code)
+        self.crew.memoize_failures(test_result)
+
+    def entries(self):
+        return self.crew.failure_memo.entries()
+
+    def test_fix_is_recorded_when_the_same_tests_pass(self):
+        self.iteration(
+            "return config[key]",
+            result(failed("test_get", "KeyError", "'port'", KEY_ERROR)),
+        )
+        self.iteration(
+            "return config.get(key)", result(TestCaseResult("test_get", "passed"))
+        )
+        (entry,) = self.entries().values()
+        self.assertIn("+return config.get(key)", entry["fix"])
+
+    def test_not_recorded_when_the_tests_were_rewritten(self):
+        self.iteration(
+            "return config[key]",
+            result(failed("test_get", "KeyError", "'port'", KEY_ERROR)),
+        )
+        self.crew.write_output("unit_tests.py", TESTS.replace("pass", "x = 1"))
+        self.iteration(
+            "return config.get(key)", result(TestCaseResult("test_get", "passed"))
+        )
+        self.assertEqual(self.entries(), {})
+
+    def test_not_recorded_when_the_test_did_not_run(self):
+        self.iteration(
+            "return config[key]",
+            result(failed("test_get", "KeyError", "'port'", KEY_ERROR)),
+        )
+        # e.g. a run stopped at the first failure before reaching the test
+        self.iteration(
+            "return config.get(key)", result(TestCaseResult("test_other", "passed"))
+        )
+        self.assertEqual(self.entries(), {})
+
+    def test_failures_raised_in_the_tests_are_skipped(self):
+        error = failed(
+            "test_get", "NameError", "name 'undefined_helper' is not defined", IN_TESTS
+        )
+        self.iteration("return config[key]", result(error))
+        self.assertIsNone(self.crew.pending_failures)
+        self.iteration(
+            "return config.get(key)", result(TestCaseResult("test_get", "passed"))
+        )
+        self.assertEqual(self.entries(), {})
+
+
+class TestFrozenTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.crew = make_crew(self.directory.name)
+        self.crew.prepare_run("def get(config, key):\n    return config[key]\n")
+        self.crew.write_output("unit_tests.py", TESTS)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_tests_failing_the_same_way_stay_frozen(self):
+        failing = result(failed("test_get", "KeyError", "'port'", KEY_ERROR))
+        for _ in range(5):
+            self.crew.update_frozen_tests(failing)
+            self.assertTrue(self.crew.tests_frozen())
+
+    def test_tests_raising_in_their_own_code_are_rewritten(self):
+        self.crew.update_frozen_tests(
+            result(failed("test_get", "KeyError", "'port'", KEY_ERROR))
+        )
+        error = failed(
+            "test_get", "NameError", "name 'undefined_helper' is not defined", IN_TESTS
+        )
+        error.outcome = "error"
+        self.crew.update_frozen_tests(result(error))
+        self.assertFalse(self.crew.tests_frozen())
+
+
+class TestCandidates(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.crew = make_crew(self.directory.name, candidates=2)
+        self.crew.prepare_run("def f(): pass")
+        self.crew.start_iteration()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_abandoned_candidate_stops_before_its_tests(self):
+        cancel = threading.Event()
+        tests_future = Future()
+        tests_future.set_result(TESTS)
+
+        def kickoff(crew):
+            cancel.set()
+            return SimpleNamespace(raw=GOOD)
+
+        with mock.patch.object(
+            self.crew, "kickoff_and_record", side_effect=kickoff
+        ), mock.patch("loogy.crew.run_unit_tests") as run_tests:
+            self.assertIsNone(self.crew.evaluate_candidate(0, tests_future, cancel))
+        run_tests.assert_not_called()
+
+    def test_abandoned_candidate_writes_nothing(self):
+        self.crew._candidate_cancel.set()
+        guardrail = self.crew.static_guardrail("develop_topic_task#1")
+        self.assertEqual(guardrail(SimpleNamespace(raw=BROKEN)), (True, BROKEN))
+        self.assertFalse(self.crew.artifacts.exists("static_analysis.md"))
+        # The developer outside of candidates is still checked
+        guardrail = self.crew.static_guardrail("develop_topic_task")
+        self.assertFalse(guardrail(SimpleNamespace(raw=BROKEN))[0])
+
+    def test_finish_run_waits_for_abandoned_candidates(self):
+        release = threading.Event()
+        pool = self.crew._candidate_pool = ThreadPoolExecutor(max_workers=1)
+        abandoned = pool.submit(release.wait, 10)
+        threading.Timer(0.1, release.set).start()
+        self.crew.finish_run()
+        self.assertTrue(abandoned.done())
+        self.assertIsNone(self.crew._candidate_pool)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+import os
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+import litellm
+
+from loogy import http_pool
+from loogy.cache import ResponseCache
+from loogy.crew import CachedLLM
+from loogy.stub_server import StubServer
+
+
+class TestSharedPool(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache = ResponseCache(self.directory.name, bypass=True)
+        # configure_http_pool() installs clients once per process
+        for target, name in [
+            (http_pool, "_configured"),
+            (http_pool, "_handler"),
+            (litellm, "client_session"),
+            (litellm, "aclient_session"),
+            (litellm, "module_level_client"),
+            (litellm, "module_level_aclient"),
+        ]:
+            patcher = mock.patch.object(target, name, getattr(target, name))
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        http_pool._configured = False
+        litellm.client_session = litellm.aclient_session = None
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def complete(self, server, prompt):
+        llm = CachedLLM(
+            model="ollama/stub",
+            cache=self.cache,
+            namespace=("test",),
+            base_url=server.url,
+        )
+        return llm.call([{"role": "user", "content": prompt}])
+
+    def test_ollama_calls_reuse_the_pooled_connections(self):
+        http_pool.configure_http_pool(max_connections=2)
+        with StubServer(latency=0.1) as server, mock.patch.dict(
+            # litellm looks up the model info on OLLAMA_API_BASE
+            os.environ,
+            {"OLLAMA_API_BASE": server.url},
+        ):
+            with ThreadPoolExecutor(max_workers=6) as pool:
+                answers = list(
+                    pool.map(lambda i: self.complete(server, f"prompt {i}"), range(6))
+                )
+            stats = server.stats()
+        self.assertTrue(all(answers))
+        self.assertEqual(stats["requests"]["/api/generate"], 6)
+        self.assertLessEqual(stats["connections"], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,114 @@
+import json
+import os
+import tempfile
+import unittest
+
+from loogy.memo import FailureMemo, Signature, _digest, message_template, signatures
+from loogy.sandbox import TestCaseResult, TestRunResult
+
+
+def traceback_at(line: str, filename: str = "codebase.py") -> str:
+    return (
+        "Traceback (most recent call last):\n"
+        f'  File "/tmp/run/{filename}", line 3, in f\n'
+        f"    {line}\n"
+    )
+
+
+def failure(name, error_type, message, traceback=""):
+    return TestCaseResult(
+        name=name,
+        outcome="failed",
+        error_type=error_type,
+        message=message,
+        traceback=traceback,
+    )
+
+
+class TestSignatures(unittest.TestCase):
+    def test_message_template(self):
+        self.assertEqual(
+            message_template("index 12 is out of bounds for 'x'\nmore"),
+            "index N is out of bounds for '?'",
+        )
+
+    def test_tests_failing_on_the_same_line_share_a_signature(self):
+        at = traceback_at("return values[i]")
+        result = TestRunResult(
+            tests=[
+                failure("test_a", "IndexError", "list index out of range", at),
+                failure("test_b", "IndexError", "list index out of range", at),
+            ]
+        )
+        self.assertEqual(len(signatures(result.failures())), 1)
+
+    def test_failures_without_a_frame_are_told_apart_by_test(self):
+        result = TestRunResult(
+            tests=[
+                failure("test_a", "AssertionError", "1 != 2"),
+                failure("test_b", "AssertionError", "3 != 4"),
+            ]
+        )
+        first, second = signatures(result.failures())
+        self.assertNotEqual(first.key, second.key)
+
+    def test_generic_or_frameless_failures_have_no_loose_key(self):
+        self.assertIsNone(Signature("AssertionError", "N != N", "x = f()").loose_key)
+        undefined = Signature("NameError", "name '?' is not defined", "return x")
+        self.assertIsNone(undefined.loose_key)
+        self.assertIsNone(Signature("KeyError", "'?'", "", "test_a").loose_key)
+        self.assertIsNotNone(Signature("KeyError", "'?'", "return d[k]").loose_key)
+
+
+class TestFailureMemo(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "failures.json")
+        self.memo = FailureMemo(self.path)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_assertions_of_other_tests_do_not_match(self):
+        fixed = Signature("AssertionError", "N != N", "", "test_total")
+        self.memo.record(fixed, "return 1\n", "return 2\n")
+        other = Signature("AssertionError", "N != N", "", "test_average")
+        self.assertEqual(self.memo.lookup([other]), [])
+        self.assertEqual(len(self.memo.lookup([fixed])), 1)
+
+    def test_name_errors_only_match_the_same_line(self):
+        fixed = Signature("NameError", "name '?' is not defined", "return np.sum(x)")
+        self.memo.record(fixed, "return np.sum(x)\n", "import numpy as np\n")
+        other = Signature("NameError", "name '?' is not defined", "return pd.concat(x)")
+        self.assertEqual(self.memo.lookup([other]), [])
+
+    def test_specific_errors_match_in_other_code(self):
+        fixed = Signature("KeyError", "'?'", "return config[key]")
+        self.memo.record(fixed, "return config[key]\n", "return config.get(key)\n")
+        other = Signature("KeyError", "'?'", "value = settings[name]")
+        (hint,) = self.memo.lookup([other])
+        self.assertIn("config.get(key)", hint["fix"])
+
+    def test_generic_entries_of_older_memos_do_not_match_loosely(self):
+        entry = {
+            "loose_key": _digest("AssertionError", "N != N"),
+            "error_type": "AssertionError",
+            "template": "N != N",
+            "frame": "",
+            "fix": "-a\n+b",
+            "used": 0,
+        }
+        with open(self.path, "w") as f:
+            json.dump({"entries": {"old": entry}}, f)
+        signature = Signature("AssertionError", "N != N", "", "test_other")
+        self.assertEqual(FailureMemo(self.path).lookup([signature]), [])
+
+    def test_saved_and_reloaded(self):
+        fixed = Signature("KeyError", "'?'", "return config[key]")
+        self.memo.record(fixed, "return config[key]\n", "return config.get(key)\n")
+        self.memo.save()
+        self.assertEqual(len(FailureMemo(self.path).lookup([fixed])), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+import unittest
+
+from loogy.patching import PatchError, apply_patch
+
+CODE = "def add(a, b):\n    return a - b\n\n\ndef sub(a, b):\n    return a - b\n"
+
+
+class TestApplyPatch(unittest.TestCase):
+    def test_edit_block(self):
+        response = (
+            "<<<<<<< SEARCH\ndef add(a, b):\n    return a - b\n=======\n"
+            "def add(a, b):\n    return a + b\n>>>>>>> REPLACE\n"
+        )
+        self.assertIn("return a + b", apply_patch(CODE, response))
+
+    def test_ambiguous_edit_block(self):
+        response = (
+            "<<<<<<< SEARCH\n    return a - b\n=======\n    return 0\n"
+            ">>>>>>> REPLACE\n"
+        )
+        with self.assertRaises(PatchError):
+            apply_patch(CODE, response)
+
+    def test_trailing_whitespace_is_ignored(self):
+        response = (
+            "<<<<<<< SEARCH\ndef add(a, b):   \n    return a - b\n=======\n"
+            "def add(a, b):\n    return a + b\n>>>>>>> REPLACE\n"
+        )
+        self.assertIn("return a + b", apply_patch(CODE, response))
+
+    def test_unified_diff(self):
+        diff = (
+            "--- a/codebase.py\n+++ b/codebase.py\n@@ -1,2 +1,2 @@\n"
+            " def add(a, b):\n-    return a - b\n+    return a + b\n"
+        )
+        patched = apply_patch(CODE, diff)
+        self.assertTrue(patched.startswith("def add(a, b):\n    return a + b\n"))
+
+    def test_pure_insertion_goes_after_the_line(self):
+        diff = "@@ -2,0 +3,1 @@\n+inserted = 0\n"
+        patched = apply_patch("a = 1\nb = 2\nc = 3\n", diff)
+        self.assertEqual(patched, "a = 1\nb = 2\ninserted = 0\nc = 3\n")
+
+    def test_insertion_at_the_top(self):
+        patched = apply_patch("a = 1\n", "@@ -0,0 +1,1 @@\n+import os\n")
+        self.assertEqual(patched, "import os\na = 1\n")
+
+    def test_insertion_after_a_hunk_that_changed_the_line_count(self):
+        diff = (
+            "@@ -1,1 +1,2 @@\n-a = 1\n+a = 1\n+a2 = 1\n"
+            "@@ -3,0 +5,1 @@\n+inserted = 0\n"
+        )
+        patched = apply_patch("a = 1\nb = 2\nc = 3\nd = 4\n", diff)
+        self.assertEqual(
+            patched, "a = 1\na2 = 1\nb = 2\nc = 3\ninserted = 0\nd = 4\n"
+        )
+
+    def test_result_must_compile(self):
+        response = (
+            "<<<<<<< SEARCH\ndef add(a, b):\n=======\ndef add(a, b:\n>>>>>>> REPLACE\n"
+        )
+        with self.assertRaises(PatchError):
+            apply_patch(CODE, response)
+
+    def test_no_edits(self):
+        with self.assertRaises(PatchError):
+            apply_patch(CODE, "Here is the fixed code")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,121 @@
+import subprocess
+import unittest
+from unittest import mock
+
+from loogy.sandbox import (
+    TestCaseResult,
+    TestRunResult,
+    extract_code,
+    imported_modules,
+    merge_results,
+    plan_shards,
+    run_unit_tests,
+    strip_timings,
+)
+
+
+def make_result(*tests, **kwargs) -> TestRunResult:
+    return TestRunResult(tests=[TestCaseResult(*test) for test in tests], **kwargs)
+
+
+class TestExtractCode(unittest.TestCase):
+    def test_longest_fenced_block(self):
+        text = (
+            "Example:\n```python\nx = 1\n```\n"
+            "Code:\n```python\ndef f():\n    return 2\n```"
+        )
+        self.assertEqual(extract_code(text), "def f():\n    return 2\n")
+
+    def test_plain_text(self):
+        self.assertEqual(extract_code("print('hi')  "), "print('hi')\n")
+
+    def test_imported_modules(self):
+        code = "import numpy as np, os\nfrom sklearn.svm import SVC\nimport numpy\n"
+        self.assertEqual(imported_modules(code), ["numpy", "os", "sklearn"])
+
+
+class TestMergeResults(unittest.TestCase):
+    def test_merges_tests_and_flags(self):
+        first = make_result(("a", "passed"), exit_code=0, stdout="one")
+        second = make_result(("b", "failed"), exit_code=1, timed_out=True, stdout="two")
+        merged = merge_results([first, second])
+        self.assertEqual([test.name for test in merged.tests], ["a", "b"])
+        self.assertEqual(merged.exit_code, 1)
+        self.assertTrue(merged.timed_out)
+        self.assertEqual(merged.stdout, "one\ntwo")
+        self.assertFalse(merged.ok)
+
+    def test_all_passing_is_ok(self):
+        merged = merge_results([make_result(("a", "passed"), exit_code=0)] * 2)
+        self.assertTrue(merged.ok)
+        self.assertEqual(merged.passed, 2)
+
+
+class TestPlanShards(unittest.TestCase):
+    def test_balances_by_duration(self):
+        durations = {"a": 3.0, "b": 2.0, "c": 1.0, "d": 1.0}
+        plans = plan_shards(list(durations), durations, 2)
+        self.assertEqual(len(plans), 2)
+        # The first plan runs everything the other shards do not
+        self.assertEqual(sorted(plans[0]["exclude"]), sorted(plans[1]["select"]))
+        self.assertEqual(sorted(plans[1]["select"]), ["b", "c"])
+
+    def test_no_more_shards_than_tests(self):
+        plans = plan_shards(["a"], {}, 4)
+        self.assertEqual(plans, [{"exclude": []}])
+
+
+class TestRunResultMarkdown(unittest.TestCase):
+    def test_first_line_and_failures(self):
+        result = make_result(
+            ("a", "passed"),
+            ("b", "failed", 0.0, "AssertionError", "1 != 2", "Traceback ..."),
+            exit_code=1,
+        )
+        markdown = result.to_markdown(timings=False)
+        self.assertTrue(markdown.startswith("result: Failed\n"))
+        self.assertIn("### b: AssertionError", markdown)
+        self.assertNotIn("duration", markdown)
+        self.assertEqual(result.error_classes, ["AssertionError"])
+
+
+class TestStripTimings(unittest.TestCase):
+    def test_matches_the_rendering_without_timings(self):
+        result = make_result(
+            ("test_a", "passed", 0.012),
+            ("test_b", "failed", 1.5, "AssertionError", "1 != 2", "Traceback"),
+            exit_code=1,
+            duration=1.75,
+        )
+        self.assertEqual(
+            strip_timings(result.to_markdown()), result.to_markdown(timings=False)
+        )
+
+    def test_untimed_results_are_unchanged(self):
+        result = make_result(("test_a", "passed", 0.012))
+        untimed = result.to_markdown(timings=False)
+        self.assertEqual(strip_timings(untimed), untimed)
+
+
+ALLOCATE = "def allocate():\n    return bytearray(512 * 1024 * 1024)\n"
+ALLOCATE_TESTS = (
+    "import unittest\nfrom codebase import allocate\n\n\n"
+    "class T(unittest.TestCase):\n"
+    "    def test_allocate(self):\n"
+    "        allocate()\n"
+)
+
+
+class TestRunUnitTests(unittest.TestCase):
+    def test_harness_applies_the_memory_limit(self):
+        with mock.patch(
+            "loogy.sandbox.subprocess.Popen", wraps=subprocess.Popen
+        ) as popen:
+            result = run_unit_tests(ALLOCATE, ALLOCATE_TESTS, memory_mb=256)
+        self.assertNotIn("preexec_fn", popen.call_args.kwargs)
+        (test,) = result.tests
+        self.assertEqual(test.error_type, "MemoryError")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,61 @@
+import unittest
+
+from loogy.static_analysis import analyze
+
+
+def codes(code: str) -> list:
+    return [diagnostic.code for diagnostic in analyze(code).diagnostics]
+
+
+class TestAnalyze(unittest.TestCase):
+    def test_clean_code(self):
+        report = analyze("import os\n\n\ndef f(x):\n    return os.path.join(x, 'a')\n")
+        self.assertTrue(report.ok)
+        self.assertEqual(report.diagnostics, [])
+
+    def test_syntax_error(self):
+        report = analyze("def f(:\n    pass\n")
+        self.assertFalse(report.ok)
+        self.assertEqual(codes("def f(:\n    pass\n"), ["syntax-error"])
+
+    def test_undefined_name(self):
+        report = analyze("def f():\n    return undefined_thing\n")
+        self.assertFalse(report.ok)
+        self.assertIn("undefined_thing", str(report.errors[0]))
+
+    def test_scopes(self):
+        code = (
+            "class A:\n    x = 1\n\n"
+            "    def f(self):\n        return [y for y in range(3)]\n"
+            "\n\ndef g():\n    global z\n    z = 1\n    return lambda w: w + z\n"
+        )
+        self.assertTrue(analyze(code).ok)
+
+    def test_comprehension_over_a_class_attribute(self):
+        code = "class A:\n    xs = [1, 2]\n    ys = [x * 2 for x in xs]\n"
+        self.assertTrue(analyze(code).ok)
+
+    def test_comprehension_body_does_not_see_the_class_scope(self):
+        code = "class A:\n    n = 2\n    ys = [x * n for x in range(3)]\n"
+        self.assertEqual(codes(code), ["undefined-name"])
+
+    def test_nested_generators(self):
+        code = "pairs = [(x, y) for x in range(3) for y in range(x)]\n"
+        self.assertTrue(analyze(code).ok)
+
+    def test_class_cell_in_methods(self):
+        code = (
+            "class A:\n    def f(self):\n        return __class__\n\n"
+            "    def g(self):\n        return lambda: __class__.__name__\n"
+        )
+        self.assertTrue(analyze(code).ok)
+        self.assertEqual(codes("def f():\n    return __class__\n"), ["undefined-name"])
+
+    def test_missing_module_is_a_warning(self):
+        report = analyze("import no_such_module_for_loogy\n")
+        self.assertTrue(report.ok)
+        self.assertEqual([d.code for d in report.warnings], ["missing-module"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,31 @@
+import unittest
+from types import SimpleNamespace
+
+from loogy.usage import report_usage
+
+
+class RecordingCallback:
+    def __init__(self):
+        self.events = []
+
+    def log_success_event(self, kwargs, response_obj, start_time, end_time):
+        self.events.append((kwargs, response_obj))
+
+
+class TestReportUsage(unittest.TestCase):
+    def test_reports_to_success_callbacks(self):
+        callback = RecordingCallback()
+        usage = SimpleNamespace(prompt_tokens=3, completion_tokens=2)
+        params = {"model": "stub"}
+        report_usage([callback, object()], params, usage)
+        self.assertEqual(callback.events, [(params, {"usage": usage})])
+
+    def test_nothing_to_report(self):
+        callback = RecordingCallback()
+        report_usage([callback], {}, None)
+        report_usage(None, {}, SimpleNamespace(prompt_tokens=1))
+        self.assertEqual(callback.events, [])
+
+
+if __name__ == "__main__":
+    unittest.main()